@@ -17,6 +17,11 @@ Usage::
 The RTC-free logic itself is covered by fast unit tests
 (``jupyterlab_chat/tests/test_rtc_lib.py``); this matrix only validates the real
 wiring against jupyter_server with each provider actually installed.
+
+The ``benchmark`` session runs the performance benchmarks
+(``python/jupyterlab-chat/benchmarks``) and compares them to the previous run::
+
+    nox -s benchmark
 """
 import nox
 
@@ -44,6 +49,26 @@ def unit(session: nox.Session) -> None:
     )
 
 
+@nox.session
+def benchmark(session: nox.Session) -> None:
+    """Performance benchmarks of the chat models and transports.
+
+    Every run is saved under ``.benchmarks/`` and compared with the latest saved
+    run; a mean slowdown of more than 20% on any benchmark fails the session.
+    Extra arguments are passed to pytest (e.g. ``-- -k 10000``).
+    """
+    session.env["SKIP_JUPYTER_BUILDER"] = "1"
+    session.install("-e", f"{_PKG}[test]", "pytest-benchmark")
+    session.run(
+        "pytest",
+        f"{_PKG}/benchmarks",
+        "--benchmark-autosave",
+        "--benchmark-compare",
+        "--benchmark-compare-fail=mean:20%",
+        *session.posargs,
+    )
+
+
 @nox.session
 @nox.parametrize("env", list(_RTC_ENVS))
 def rtc_integration(session: nox.Session, env: str) -> None:
@@ -3,13 +3,32 @@
  * Distributed under the terms of the Modified BSD License.
  */
 
-import { IMessageContent, INewMessage, IUser } from '@jupyter/chat';
+import {
+  IMessageContent,
+  IMimeModelBody,
+  INewMessage,
+  IUser
+} from '@jupyter/chat';
 import { URLExt } from '@jupyterlab/coreutils';
 import { ServerConnection } from '@jupyterlab/services';
 import { PromiseDelegate, UUID } from '@lumino/coreutils';
 import { ISignal, Signal } from '@lumino/signaling';
 
-const WS_PATH = 'api/jupyter-chat/ws';
+const WS_PATH = 'api/jupyter-chat/ws/multiplex';
+const BLOBS_PATH = 'api/jupyter-chat/blobs';
+
+/**
+ * Whether a mime model is a reference to a blob stored by the server (a large
+ * mime model offloaded out of the chat).
+ */
+function isBlobRef(mimeModel: any): mimeModel is { blob: string } {
+  return (
+    typeof mimeModel === 'object' &&
+    mimeModel !== null &&
+    typeof mimeModel.blob === 'string' &&
+    mimeModel.data === undefined
+  );
+}
 
 export namespace WebSocketHandler {
   export interface IOptions {
@@ -42,10 +61,193 @@ export namespace WebSocketHandler {
 }
 
 /**
- * Owns the WebSocket connection for a single chat file.
+ * A WebSocket connection shared by the chats of a server.
+ *
+ * Each chat subscribes to the connection by path; the server tags every frame
+ * of a chat with its `chat_id`, which the connection uses to route the frames
+ * to the subscriptions of that chat. The connection is opened with its first
+ * subscription, closed with its last one, and reopened on abnormal close,
+ * subscribing to the chats again.
+ */
+export class WebSocketMultiplexer {
+  /**
+   * The shared connection to a server.
+   */
+  static forSettings(
+    serverSettings: ServerConnection.ISettings
+  ): WebSocketMultiplexer {
+    const instances = WebSocketMultiplexer._instances;
+    let multiplexer = instances.get(serverSettings.wsUrl);
+    if (!multiplexer) {
+      multiplexer = new WebSocketMultiplexer(serverSettings);
+      instances.set(serverSettings.wsUrl, multiplexer);
+    }
+    return multiplexer;
+  }
+
+  constructor(serverSettings: ServerConnection.ISettings) {
+    this._serverSettings = serverSettings;
+  }
+
+  /**
+   * Subscribe to the chat at `path`: its frames, starting with its connection
+   * frame, are handed to `onFrame`.
+   */
+  subscribe(
+    path: string,
+    user: IUser | null,
+    onFrame: (frame: any) => void
+  ): WebSocketMultiplexer.ISubscription {
+    const entry: Private.ISubscriptionEntry = { path, user, onFrame };
+    const subscription: WebSocketMultiplexer.ISubscription = {
+      send: data => {
+        if (entry.chatId) {
+          this._send({ ...data, chat_id: entry.chatId });
+        }
+      },
+      dispose: () => this._unsubscribe(subscription)
+    };
+    this._subscriptions.set(subscription, entry);
+    if (this._socket?.readyState === WebSocket.OPEN) {
+      this._send({ type: 'subscribe', path, user: user ?? undefined });
+    } else if (!this._socket) {
+      this._openSocket();
+    }
+    return subscription;
+  }
+
+  private _unsubscribe(subscription: WebSocketMultiplexer.ISubscription): void {
+    const entry = this._subscriptions.get(subscription);
+    if (!entry) {
+      return;
+    }
+    this._subscriptions.delete(subscription);
+    const others = [...this._subscriptions.values()];
+    if (entry.chatId && !others.some(e => e.chatId === entry.chatId)) {
+      this._send({ type: 'unsubscribe', chat_id: entry.chatId });
+    } else if (
+      !entry.chatId &&
+      others.length &&
+      !others.some(e => e.path === entry.path) &&
+      this._socket?.readyState === WebSocket.OPEN
+    ) {
+      // Subscribed, but its chat id is not known yet: leave the chat when its
+      // connection frame arrives.
+      this._abandonedPaths.add(entry.path);
+    }
+    if (!others.length) {
+      const socket = this._socket;
+      this._socket = null;
+      socket?.close();
+    }
+  }
+
+  private _handleFrame(frame: any): void {
+    const entries = [...this._subscriptions.values()];
+    if (frame.type === 'connection') {
+      // The connection frame of a subscription: bind the subscriptions of its
+      // path waiting for it to the chat.
+      let bound = false;
+      for (const entry of entries) {
+        if (!entry.chatId && entry.path === frame.path) {
+          entry.chatId = frame.chat_id;
+          bound = true;
+        }
+      }
+      if (this._abandonedPaths.delete(frame.path) && !bound) {
+        this._send({ type: 'unsubscribe', chat_id: frame.chat_id });
+      }
+    }
+    for (const entry of entries) {
+      if (entry.chatId === frame.chat_id) {
+        entry.onFrame(frame);
+      }
+    }
+  }
+
+  private _send(data: Record<string, unknown>): void {
+    if (this._socket?.readyState === WebSocket.OPEN) {
+      this._socket.send(JSON.stringify(data));
+    }
+  }
+
+  private _openSocket(): void {
+    const wsUrl = URLExt.join(this._serverSettings.wsUrl, WS_PATH);
+    const token = this._serverSettings.token;
+    const socket = new WebSocket(
+      token ? `${wsUrl}?token=${encodeURIComponent(token)}` : wsUrl
+    );
+    this._socket = socket;
+    socket.onopen = () => {
+      // Subscribe (again, after a reconnection) to the chats, once each.
+      const paths = new Map<string, IUser | null>();
+      this._abandonedPaths.clear();
+      for (const entry of this._subscriptions.values()) {
+        delete entry.chatId;
+        paths.set(entry.path, entry.user);
+      }
+      for (const [path, user] of paths) {
+        this._send({ type: 'subscribe', path, user: user ?? undefined });
+      }
+    };
+    socket.onmessage = event => {
+      try {
+        this._handleFrame(JSON.parse(event.data as string));
+      } catch (e) {
+        console.error('WS chat: invalid JSON received', e);
+      }
+    };
+    socket.onclose = event => {
+      if (this._socket !== socket) {
+        return;
+      }
+      this._socket = null;
+      if (event.code === 1006 && this._subscriptions.size) {
+        setTimeout(() => {
+          if (!this._socket && this._subscriptions.size) {
+            this._openSocket();
+          }
+        }, 1000);
+      }
+    };
+    socket.onerror = error =>
+      console.error('WS chat connection error:', error);
+  }
+
+  private static _instances = new Map<string, WebSocketMultiplexer>();
+
+  private _serverSettings: ServerConnection.ISettings;
+  private _socket: WebSocket | null = null;
+  // The paths of the subscriptions disposed before their connection frame.
+  private _abandonedPaths = new Set<string>();
+  private _subscriptions = new Map<
+    WebSocketMultiplexer.ISubscription,
+    Private.ISubscriptionEntry
+  >();
+}
+
+export namespace WebSocketMultiplexer {
+  /**
+   * The subscription of a chat to a shared connection.
+   */
+  export interface ISubscription {
+    /**
+     * Send a frame to the chat; dropped until its connection frame is received.
+     */
+    send(data: Record<string, unknown>): void;
+    /**
+     * Leave the chat.
+     */
+    dispose(): void;
+  }
+}
+
+/**
+ * Owns the WebSocket subscription of a single chat file.
  *
  * Responsibilities:
- * - Open and maintain the WS connection (reconnect on abnormal close)
+ * - Subscribe to the chat on the connection shared by the chats of the server
+ *   (see `WebSocketMultiplexer`, which reconnects on abnormal close)
  * - Own the WS protocol: parse raw frames, maintain the users map, resolve
  *   sender/mention usernames to IUser objects
  * - Emit clean IMessageContent objects via `messageReceived` for every
@@ -53,6 +255,8 @@ export namespace WebSocketHandler {
  * - Expose a `ready` promise that resolves once the initial connection
  *   message has been processed
  * - Provide typed send methods (sendMessage / updateMessage / deleteMessage)
+ * - Fetch the mime models offloaded to blobs by the server, and emit their
+ *   messages again once fetched
  *
  * The path is not known at construction time (LabChatModel learns it from the
  * document context), so it must be set via `setPath()` before `initialize()`.
@@ -116,7 +320,7 @@ export class WebSocketHandler {
   }
 
   initialize(): void {
-    this._openSocket();
+    this._subscribe();
   }
 
   sendMessage(message: INewMessage): string {
@@ -168,8 +372,8 @@ export class WebSocketHandler {
 
   dispose(): void {
     this._disposed = true;
-    this._socket?.close();
-    this._socket = null;
+    this._subscription?.dispose();
+    this._subscription = null;
     Signal.clearData(this);
   }
 
@@ -188,6 +392,11 @@ export class WebSocketHandler {
       this._usersChanged.emit(incoming);
     } else if (data.type === 'msg' && data.message) {
       this._messageReceived.emit(this._toMessageContent(data.message));
+    } else if (data.type === 'batch') {
+      // Several frames committed together by a server-side batch.
+      for (const frame of (data.frames as any[]) ?? []) {
+        this._handleMessage(frame);
+      }
     } else if (data.type === 'writing') {
       const user: IUser = data.user ?? {
         username: data.sender,
@@ -229,8 +438,14 @@ export class WebSocketHandler {
     if (msg.metadata !== undefined) {
       content.metadata = msg.metadata;
     }
-    if (msg.mime_model !== undefined) {
-      content.mime_model = msg.mime_model;
+    if (isBlobRef(msg.mime_model)) {
+      // Rendered from the body until the blob is fetched.
+      this._fetchBlob(msg);
+    } else {
+      this._pendingBlobs.delete(msg.id);
+      if (msg.mime_model !== undefined) {
+        content.mime_model = msg.mime_model;
+      }
     }
     if (Array.isArray(msg.attachments) && msg.attachments.length) {
       content.attachments = msg.attachments;
@@ -243,50 +458,77 @@ export class WebSocketHandler {
     return content;
   }
 
+  /**
+   * Fetch the blob of an offloaded mime model, then emit the message again
+   * with it, unless a newer version of the message was received meanwhile.
+   * Blobs are immutable: each is fetched once, and cached by the browser.
+   */
+  private _fetchBlob(msg: any): void {
+    const digest = msg.mime_model.blob as string;
+    this._pendingBlobs.set(msg.id, msg);
+    let blob = this._blobs.get(digest);
+    if (!blob) {
+      const url =
+        URLExt.join(this._serverSettings.baseUrl, BLOBS_PATH, digest) +
+        `?path=${encodeURIComponent(this._path)}`;
+      blob = ServerConnection.makeRequest(url, {}, this._serverSettings).then(
+        response => (response.ok ? response.json() : undefined)
+      );
+      blob.catch(() => this._blobs.delete(digest));
+      this._blobs.set(digest, blob);
+    }
+    blob
+      .then(mimeModel => {
+        if (this._disposed || this._pendingBlobs.get(msg.id) !== msg) {
+          return;
+        }
+        this._pendingBlobs.delete(msg.id);
+        if (mimeModel) {
+          this._messageReceived.emit(
+            this._toMessageContent({ ...msg, mime_model: mimeModel })
+          );
+        }
+      })
+      .catch(e => console.error(`WS chat: could not fetch blob ${digest}`, e));
+  }
+
   private _send(data: Record<string, unknown>): void {
-    this._socket?.send(JSON.stringify(data));
+    this._subscription?.send(data);
   }
 
-  private _openSocket(): void {
-    const wsUrl = URLExt.join(this._serverSettings.wsUrl, WS_PATH);
-    const token = this._serverSettings.token;
-    const url =
-      `${wsUrl}?path=${encodeURIComponent(this._path)}` +
-      (token ? `&token=${encodeURIComponent(token)}` : '') +
-      (this._user
-        ? `&user=${encodeURIComponent(JSON.stringify(this._user))}`
-        : '');
-
-    this._socket = new WebSocket(url);
-    this._socket.onmessage = event => {
-      try {
-        this._handleMessage(JSON.parse(event.data as string));
-      } catch (e) {
-        console.error('WS chat: invalid JSON received', e);
-      }
-    };
-    this._socket.onclose = event => {
-      if (event.code === 1006 && !this._disposed) {
-        setTimeout(() => {
-          if (!this._disposed) {
-            this._openSocket();
-          }
-        }, 1000);
-      }
-    };
-    this._socket.onerror = error =>
-      console.error('WS chat connection error:', error);
+  private _subscribe(): void {
+    this._subscription = WebSocketMultiplexer.forSettings(
+      this._serverSettings
+    ).subscribe(this._path, this._user, frame => this._handleMessage(frame));
   }
 
   private _path = '';
   private _disposed = false;
   private _chatId: string | undefined;
   private _user: IUser | null = null;
-  private _socket: WebSocket | null = null;
+  private _subscription: WebSocketMultiplexer.ISubscription | null = null;
   private _serverSettings: ServerConnection.ISettings;
   private _usersMap: Record<string, IUser> = {};
+  private _blobs = new Map<string, Promise<IMimeModelBody | undefined>>();
+  // The latest version of the messages whose blob is being fetched.
+  private _pendingBlobs = new Map<string, any>();
   private _ready = new PromiseDelegate<void>();
   private _messageReceived = new Signal<this, IMessageContent>(this);
   private _usersChanged = new Signal<this, Record<string, IUser>>(this);
   private _writingChanged = new Signal<this, WebSocketHandler.IWriting>(this);
 }
+
+namespace Private {
+  /**
+   * The state of a subscription to a shared connection.
+   */
+  export interface ISubscriptionEntry {
+    path: string;
+    user: IUser | null;
+    onFrame: (frame: any) => void;
+    /**
+     * The chat id, from the connection frame of the subscription.
+     */
+    chatId?: string;
+  }
+}
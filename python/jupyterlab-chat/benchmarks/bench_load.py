@@ -0,0 +1,40 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Load test of the WebSocket transport against an in-process server."""
+import pytest
+
+from loadtest import LoadConfig, run_load
+
+
+@pytest.fixture
+def jp_server_config():
+    # The WebSocket transport is served only while no RTC provider is enabled.
+    return {"ServerApp": {"jpserver_extensions": {"jupyterlab_chat": True}}}
+
+
+def bench_websocket_load(
+    jp_serverapp,
+    http_server_client,
+    jp_http_port,
+    jp_base_url,
+    jp_auth_header,
+    jp_asyncio_loop,
+):
+    """Many chatters and streaming personas on one server; prints the report.
+
+    ``http_server_client`` makes the server listen on ``jp_http_port``.
+    pytest-jupyter's client and server share ``jp_asyncio_loop``, so the load
+    runs on the server's own loop and the measured lag is the server's.
+    """
+    config = LoadConfig(clients=40, chats=4, rate=2.0, duration=3.0, writers=2)
+    report = jp_asyncio_loop.run_until_complete(
+        run_load(
+            f"ws://localhost:{jp_http_port}{jp_base_url}",
+            config,
+            headers=jp_auth_header,
+            chat_manager=jp_serverapp.web_app.settings["chat_manager"],
+        )
+    )
+    print("\n" + report.format())
+    assert report.sent and report.chunks
+    assert len(report.latencies) == report.expected_deliveries
@@ -0,0 +1,74 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Benchmarks of the WebSocket chat model and handler."""
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from jupyterlab_chat.chat_manager import ChatManager
+from jupyterlab_chat.models import NewMessage
+from jupyterlab_chat.websocket_handler import WSChatHandler
+from jupyterlab_chat.websocket_model import WsChatModel
+from synthetic import SIZES
+
+pytestmark = pytest.mark.benchmark(group="websocket")
+
+#: Number of in-process clients the fan-out benchmark broadcasts to.
+CLIENTS = [1, 10, 100]
+
+
+def _loaded_model(chat_file, n_messages: int) -> WsChatModel:
+    path = chat_file(n_messages)
+    model = WsChatModel(path=path.name, root_dir=path.parent)
+    model.load_from_file()
+    return model
+
+
+@pytest.mark.parametrize("size", SIZES)
+def bench_load_from_file(benchmark, chat_file, size):
+    path = chat_file(size)
+    model = WsChatModel(path=path.name, root_dir=path.parent)
+    benchmark(model.load_from_file)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def bench_save(benchmark, chat_file, size):
+    model = _loaded_model(chat_file, size)
+    benchmark(model.save)
+
+
+@pytest.mark.parametrize("size", SIZES)
+def bench_add_message(benchmark, chat_file, size):
+    model = _loaded_model(chat_file, size)
+    new_message = NewMessage(body="Hello @User-1", sender="user-2")
+    benchmark(model.add_message, new_message)
+
+
+@pytest.mark.parametrize("clients", CLIENTS)
+def bench_handler_fan_out(benchmark, chat_file, clients):
+    """A client message handled end to end (insert, save, broadcast) by
+    ``WSChatHandler.on_message`` and fanned out to ``clients`` connections."""
+    path = chat_file(SIZES[0])
+    settings: dict = {"server_root_dir": str(path.parent)}
+    manager = ChatManager(
+        SimpleNamespace(web_app=SimpleNamespace(settings=settings)),
+        start_poller=False,
+    )
+    settings["chat_manager"] = manager
+    model = manager.ws_open(path.name)
+    # A handler bound to the model without a tornado connection.
+    handler = WSChatHandler.__new__(WSChatHandler)
+    handler.application = SimpleNamespace(settings=settings)
+    handler._path = path.name
+    handler._model = model
+    for i in range(clients):
+        model.handlers[f"client-{i}"] = SimpleNamespace(write_message=lambda frame: None)
+
+    raw = json.dumps({"body": "Hello everyone", "user": {"username": "user-1"}})
+    loop = asyncio.new_event_loop()
+    try:
+        benchmark(lambda: loop.run_until_complete(handler.on_message(raw)))
+    finally:
+        loop.close()
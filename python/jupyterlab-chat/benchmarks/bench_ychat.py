@@ -0,0 +1,71 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Benchmarks of the collaborative chat model (``YChat``)."""
+import pytest
+
+from conftest import chat_json
+from jupyterlab_chat.models import Message, NewMessage
+from jupyterlab_chat.utils import find_mentions
+from jupyterlab_chat.ychat import YChat
+from synthetic import SIZES
+
+pytestmark = pytest.mark.benchmark(group="ychat")
+
+#: Loading 100k messages into a ``YChat`` takes minutes (``set()`` does not
+#: scale linearly yet), so the collaborative model is benchmarked up to 10k.
+YCHAT_SIZES = [size for size in SIZES if size <= 10_000]
+
+
+def _loaded_chat(n_messages: int) -> YChat:
+    # The document stays "dirty" (as while loading): new messages are then not
+    # rescheduled for a server timestamp, which would need a running event loop.
+    chat = YChat()
+    chat.set(chat_json(n_messages))
+    return chat
+
+
+@pytest.mark.parametrize("size", YCHAT_SIZES)
+def bench_add_message(benchmark, size):
+    chat = _loaded_chat(size)
+    new_message = NewMessage(body="Hello @User-1, see the attached file", sender="user-2")
+    benchmark(chat.add_message, new_message)
+
+
+@pytest.mark.parametrize("size", YCHAT_SIZES)
+def bench_update_message_append(benchmark, size):
+    """A streamed reply: one chunk appended to the latest message per call."""
+    chat = _loaded_chat(size)
+    msg_id = chat.add_message(NewMessage(body="", sender="user-0"))
+    message = chat.get_message(msg_id)
+    assert message is not None
+
+    def stream_chunk():
+        chunk = Message(
+            id=msg_id, body=" token", time=message.time, sender=message.sender
+        )
+        chat.update_message(chunk, append=True)
+
+    benchmark(stream_chunk)
+
+
+@pytest.mark.parametrize("size", YCHAT_SIZES)
+def bench_set(benchmark, size):
+    content = chat_json(size)
+    chat = YChat()
+    benchmark(chat.set, content)
+
+
+@pytest.mark.parametrize("size", YCHAT_SIZES)
+def bench_get(benchmark, size):
+    chat = _loaded_chat(size)
+    benchmark(chat.get)
+
+
+@pytest.mark.parametrize("size", YCHAT_SIZES)
+def bench_find_mentions(benchmark, size):
+    """``find_mentions`` against the users of a chat; independent of the number
+    of messages, but parametrized alike so runs are comparable."""
+    chat = _loaded_chat(size)
+    message = chat.get_messages()[-1]
+    message.body = "@User-1 @User-2 could you review this with @User-42?"
+    benchmark(find_mentions, message, chat)
@@ -0,0 +1,44 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Performance benchmarks of the chat models and the WebSocket transport.
+
+The benchmarks use `pytest-benchmark` and live outside the unit tests: their
+modules are named ``bench_*.py`` so a plain ``pytest`` run does not collect
+them. Run them through nox, which stores every run and compares it to the
+previous one::
+
+    nox -s benchmark
+    nox -s benchmark -- -k "10000"     # a single chat size
+
+See ``noxfile.py`` for the storage location and the regression threshold.
+``loadtest.py`` is a load generator for a running server; ``bench_load.py``
+runs it against an in-process server.
+"""
+from __future__ import annotations
+
+import json
+from functools import lru_cache
+from pathlib import Path
+
+import pytest
+
+from synthetic import make_chat
+
+
+@lru_cache(maxsize=None)
+def chat_json(n_messages: int) -> str:
+    """The serialized synthetic chat of ``n_messages`` messages (cached, as
+    generating the largest sizes is slow)."""
+    return json.dumps(make_chat(n_messages), indent=2)
+
+
+@pytest.fixture
+def chat_file(tmp_path: Path):
+    """Factory writing the synthetic chat of a given size to ``chat.chat``."""
+
+    def write(n_messages: int) -> Path:
+        path = tmp_path / "chat.chat"
+        path.write_text(chat_json(n_messages))
+        return path
+
+    return write
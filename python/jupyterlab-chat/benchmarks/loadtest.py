@@ -0,0 +1,332 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Headless load test of the WebSocket chat transport.
+
+Opens ``--clients`` WebSocket connections to ``api/jupyter-chat/ws``, spread
+over ``--chats`` chat files, and has every client post messages at ``--rate``
+messages per second for ``--duration`` seconds. Every ``msg`` frame a client
+receives for a message posted by the load test is a delivery; the report gives
+the p50/p99 end-to-end delivery latency (send to receipt, over all recipients),
+the event-loop lag and the peak server RSS.
+
+Against a local server started with ``jupyter server`` (RTC disabled)::
+
+    python benchmarks/loadtest.py --url http://localhost:8888/ --token <token> \\
+        --clients 200 --chats 20 --rate 0.5 --duration 60 --server-pid <pid>
+
+The chat files (``loadtest-<n>.chat``) are created in the server root.
+
+When the server runs in the same process, as with the pytest-jupyter server
+fixture (see ``bench_load.py``), pass its ``ChatManager`` to :func:`run_load`:
+the load test then also runs server-side streaming writers (personas appending
+chunks to their reply), and the event-loop lag and RSS are the server's own.
+Against a separate server, the lag is measured on the load generator's loop and
+the RSS is read from ``--server-pid`` (Linux only).
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlencode, urlparse
+
+from jupyter_server.utils import url_path_join
+from tornado.httpclient import HTTPRequest
+from tornado.websocket import WebSocketClientConnection, websocket_connect
+
+from jupyterlab_chat.models import Message, NewMessage, User
+
+if TYPE_CHECKING:
+    from jupyterlab_chat.chat_manager import ChatManager
+
+#: Interval in seconds of the event-loop lag probe.
+LAG_PROBE_INTERVAL = 0.01
+#: Interval in seconds of the RSS sampler.
+RSS_SAMPLE_INTERVAL = 0.5
+#: Seconds to keep reading after the last message, for in-flight deliveries.
+DRAIN_DELAY = 1.0
+#: Chunks streamed into a persona reply before it starts a new one.
+CHUNKS_PER_REPLY = 50
+
+
+@dataclass
+class LoadConfig:
+    """Shape of the generated load."""
+
+    clients: int = 50
+    """ Number of WebSocket connections. """
+
+    chats: int = 5
+    """ Number of chat files the connections are spread over. """
+
+    rate: float = 1.0
+    """ Messages posted per second by each client. """
+
+    duration: float = 10.0
+    """ Seconds during which messages are posted. """
+
+    writers: int = 0
+    """ Server-side streaming writers per chat (in-process servers only). """
+
+    chunk_interval: float = 0.05
+    """ Seconds between two chunks streamed by a writer. """
+
+    prefix: str = "loadtest"
+    """ Prefix of the chat file names. """
+
+    def chat_path(self, index: int) -> str:
+        return f"{self.prefix}-{index % self.chats}.chat"
+
+
+@dataclass
+class LoadReport:
+    """Measurements of a load test run."""
+
+    config: LoadConfig
+    sent: int = 0
+    """ Messages posted by the clients. """
+
+    chunks: int = 0
+    """ Chunks streamed by the server-side writers. """
+
+    latencies: list[float] = field(default_factory=list)
+    """ End-to-end delivery latency in seconds, one per recipient. """
+
+    loop_lag: list[float] = field(default_factory=list)
+    """ Event-loop lag samples in seconds. """
+
+    rss_bytes: Optional[int] = None
+    """ Peak server RSS in bytes, when it could be read. """
+
+    @staticmethod
+    def _percentile(values: list[float], percent: int) -> float:
+        if len(values) < 2:
+            return values[0] if values else 0.0
+        return statistics.quantiles(values, n=100)[percent - 1]
+
+    @property
+    def expected_deliveries(self) -> int:
+        """Deliveries if every message reached every client of its chat."""
+        return self.sent * self.config.clients // self.config.chats
+
+    def format(self) -> str:
+        lines = [
+            f"clients={self.config.clients} chats={self.config.chats} "
+            f"rate={self.config.rate}/s duration={self.config.duration}s "
+            f"writers={self.config.writers}/chat",
+            f"messages sent: {self.sent}, chunks streamed: {self.chunks}",
+            f"deliveries: {len(self.latencies)} (expected ~{self.expected_deliveries})",
+            "delivery latency: p50={:.1f}ms p99={:.1f}ms".format(
+                self._percentile(self.latencies, 50) * 1000,
+                self._percentile(self.latencies, 99) * 1000,
+            ),
+            "event-loop lag: p50={:.1f}ms p99={:.1f}ms max={:.1f}ms".format(
+                self._percentile(self.loop_lag, 50) * 1000,
+                self._percentile(self.loop_lag, 99) * 1000,
+                max(self.loop_lag, default=0.0) * 1000,
+            ),
+            "peak RSS: "
+            + (f"{self.rss_bytes / 2**20:.1f} MiB" if self.rss_bytes else "unavailable"),
+        ]
+        return "\n".join(lines)
+
+
+def read_rss(pid: Optional[int] = None) -> Optional[int]:
+    """Resident set size in bytes of ``pid`` (this process by default), read
+    from ``/proc``; ``None`` where unavailable."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+async def _connect(
+    ws_url: str, path: str, username: str, headers: dict[str, str]
+) -> WebSocketClientConnection:
+    user = {"username": username, "name": username, "display_name": username}
+    query = urlencode({"path": path, "user": json.dumps(user)})
+    url = url_path_join(ws_url, "api/jupyter-chat/ws") + "?" + query
+    return await websocket_connect(HTTPRequest(url, headers=headers))
+
+
+async def _receive(
+    conn: WebSocketClientConnection, sent_at: dict[str, float], report: LoadReport
+) -> None:
+    while True:
+        raw = await conn.read_message()
+        if raw is None:
+            return
+        frame = json.loads(raw)
+        if frame.get("type") != "msg":
+            continue
+        sent = sent_at.get(frame["message"]["id"])
+        if sent is not None:
+            report.latencies.append(time.perf_counter() - sent)
+
+
+async def _send(
+    conn: WebSocketClientConnection,
+    username: str,
+    deadline: float,
+    rate: float,
+    sent_at: dict[str, float],
+    report: LoadReport,
+) -> None:
+    user = {"username": username, "name": username, "display_name": username}
+    while time.perf_counter() < deadline:
+        msg_id = uuid.uuid4().hex
+        sent_at[msg_id] = time.perf_counter()
+        await conn.write_message(
+            json.dumps({"id": msg_id, "body": f"load test {report.sent}", "user": user})
+        )
+        report.sent += 1
+        await asyncio.sleep(1 / rate)
+
+
+async def _stream(
+    chat_manager: "ChatManager",
+    path: str,
+    persona: User,
+    deadline: float,
+    interval: float,
+    report: LoadReport,
+) -> None:
+    model = await chat_manager.create(path)
+    if model is None:
+        return
+    model.set_user(persona)
+    model.broadcast_writing_status(persona, {"typingIndicator": "is writing"})
+    while time.perf_counter() < deadline:
+        msg_id = model.add_message(NewMessage(body="", sender=persona.username), [])
+        reply = model.get_message(msg_id)
+        if reply is None:
+            return
+        for _ in range(CHUNKS_PER_REPLY):
+            if time.perf_counter() >= deadline:
+                break
+            chunk = Message(id=msg_id, body="token ", time=reply.time, sender=reply.sender)
+            model.update_message(chunk, append=True)
+            report.chunks += 1
+            await asyncio.sleep(interval)
+    model.broadcast_writing_status(persona, None)
+
+
+async def _probe_lag(stop: asyncio.Event, report: LoadReport) -> None:
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        report.loop_lag.append(time.perf_counter() - start - LAG_PROBE_INTERVAL)
+
+
+async def _sample_rss(
+    stop: asyncio.Event, pid: Optional[int], report: LoadReport
+) -> None:
+    while not stop.is_set():
+        rss = read_rss(pid)
+        if rss is not None:
+            report.rss_bytes = max(report.rss_bytes or 0, rss)
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+
+async def run_load(
+    ws_url: str,
+    config: LoadConfig,
+    headers: Optional[dict[str, str]] = None,
+    chat_manager: Optional["ChatManager"] = None,
+    server_pid: Optional[int] = None,
+) -> LoadReport:
+    """Run a load test against the server at ``ws_url`` (``ws://host:port/base/``).
+
+    ``chat_manager`` is the server's manager when it runs in this process; it
+    enables the server-side streaming writers, and the RSS of this process is
+    sampled. Otherwise the RSS of ``server_pid`` is sampled, if given.
+    """
+    report = LoadReport(config=config)
+    sent_at: dict[str, float] = {}
+    headers = headers or {}
+    stop = asyncio.Event()
+    probes = [asyncio.ensure_future(_probe_lag(stop, report))]
+    if chat_manager is not None or server_pid is not None:
+        probes.append(asyncio.ensure_future(_sample_rss(stop, server_pid, report)))
+
+    usernames = [f"load-client-{i}" for i in range(config.clients)]
+    conns = await asyncio.gather(
+        *(
+            _connect(ws_url, config.chat_path(i), username, headers)
+            for i, username in enumerate(usernames)
+        )
+    )
+    receivers = [
+        asyncio.ensure_future(_receive(conn, sent_at, report)) for conn in conns
+    ]
+
+    deadline = time.perf_counter() + config.duration
+    load = [
+        _send(conn, username, deadline, config.rate, sent_at, report)
+        for conn, username in zip(conns, usernames)
+    ]
+    if chat_manager is not None:
+        for chat in range(config.chats):
+            for k in range(config.writers):
+                persona = User(username=f"load-persona-{k}", name=f"Persona {k}", bot=True)
+                load.append(
+                    _stream(
+                        chat_manager,
+                        config.chat_path(chat),
+                        persona,
+                        deadline,
+                        config.chunk_interval,
+                        report,
+                    )
+                )
+    await asyncio.gather(*load)
+
+    await asyncio.sleep(DRAIN_DELAY)
+    for conn in conns:
+        conn.close()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    stop.set()
+    await asyncio.gather(*probes)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8888/", help="server URL")
+    parser.add_argument("--token", default="", help="server token")
+    parser.add_argument("--server-pid", type=int, help="server process id, for its RSS")
+    defaults = LoadConfig()
+    parser.add_argument("--clients", type=int, default=defaults.clients)
+    parser.add_argument("--chats", type=int, default=defaults.chats)
+    parser.add_argument("--rate", type=float, default=defaults.rate)
+    parser.add_argument("--duration", type=float, default=defaults.duration)
+    parser.add_argument("--prefix", default=defaults.prefix)
+    args = parser.parse_args()
+
+    parts = urlparse(args.url)
+    ws_url = parts._replace(scheme="wss" if parts.scheme == "https" else "ws").geturl()
+    headers = {"Authorization": f"token {args.token}"} if args.token else {}
+    config = LoadConfig(
+        clients=args.clients,
+        chats=args.chats,
+        rate=args.rate,
+        duration=args.duration,
+        prefix=args.prefix,
+    )
+    report = asyncio.run(
+        run_load(ws_url, config, headers=headers, server_pid=args.server_pid)
+    )
+    print(report.format())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Synthetic chat generator for the benchmarks.
+
+Builds deterministic ``.chat`` contents (the format written by
+``WsChatModel.save()`` and ``YChat.get()``) of a given size, with many users
+(some of them bots), @mentions and file/notebook attachments.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import asdict
+
+from jupyterlab_chat.models import User
+
+#: Chat sizes (number of messages) the benchmarks are parametrized with.
+SIZES = [1_000, 10_000, 100_000]
+
+_WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod "
+    "tempor incididunt ut labore et dolore magna aliqua"
+).split()
+
+
+def make_users(count: int = 50) -> dict[str, dict]:
+    """``count`` users keyed by username; one in five is a bot."""
+    return {
+        f"user-{i}": asdict(
+            User(
+                username=f"user-{i}",
+                name=f"User {i}",
+                display_name=f"User {i}",
+                initials=f"U{i}",
+                bot=i % 5 == 0,
+            )
+        )
+        for i in range(count)
+    }
+
+
+def make_attachments(count: int = 100) -> dict[str, dict]:
+    """``count`` attachments keyed by id, alternating files and notebooks."""
+    attachments: dict[str, dict] = {}
+    for i in range(count):
+        if i % 2:
+            attachments[f"att-{i}"] = {
+                "type": "notebook",
+                "value": f"notebooks/analysis-{i}.ipynb",
+                "cells": [{"id": f"cell-{i}", "input_type": "code"}],
+            }
+        else:
+            attachments[f"att-{i}"] = {
+                "type": "file",
+                "value": f"src/module_{i}.py",
+                "mimetype": "text/x-python",
+            }
+    return attachments
+
+
+def make_body(rng: random.Random, users: list[str]) -> str:
+    """A message body of a few words, sometimes mentioning a user."""
+    words = rng.choices(_WORDS, k=rng.randint(5, 40))
+    if rng.random() < 0.2:
+        words.insert(0, f"@User-{rng.choice(users).split('-')[1]}")
+    return " ".join(words)
+
+
+def make_chat(
+    n_messages: int,
+    n_users: int = 50,
+    n_attachments: int = 100,
+    seed: int = 0,
+) -> dict:
+    """The contents of a ``.chat`` file holding ``n_messages`` messages."""
+    rng = random.Random(seed)
+    users = make_users(n_users)
+    attachments = make_attachments(n_attachments)
+    usernames = list(users)
+    attachment_ids = list(attachments)
+    messages = []
+    for i in range(n_messages):
+        message: dict = {
+            "type": "msg",
+            "id": f"msg-{i}",
+            "time": 1_700_000_000.0 + i,
+            "sender": rng.choice(usernames),
+            "body": make_body(rng, usernames),
+            "raw_time": False,
+        }
+        if rng.random() < 0.1:
+            message["attachments"] = rng.sample(attachment_ids, k=2)
+        messages.append(message)
+    return {
+        "messages": messages,
+        "users": users,
+        "attachments": attachments,
+        "metadata": {"id": f"chat-{n_messages}"},
+    }
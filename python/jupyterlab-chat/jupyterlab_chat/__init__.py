@@ -10,12 +10,10 @@
 # re-enters the still-initializing `ychat` module before `YChat` is defined and
 # raises a circular-import AttributeError. Importing `jupyter_ydoc` here forces
 # its entry-point registry to finish first, since this package `__init__` always
-# runs before the `ychat` submodule.
+# runs before the `ychat` submodule. (This is the one transport import that
+# cannot be deferred: no later hook runs before a standalone `ychat` import.)
 import jupyter_ydoc  # noqa: F401
 
-from jupyter_server.utils import url_path_join
-
-from .models import BaseChatModel  # noqa: F401
 from .rtc_lib import (  # noqa: F401
     RTC_PROVIDERS,
     RTCProvider,
@@ -24,7 +22,27 @@ from .rtc_lib import (  # noqa: F401
     get_server_session_rtc_info,
     publish_rtc_info,
 )
-from .websocket_handler import WSChatHandler  # noqa: F401
+
+# Public names re-exported lazily (PEP 562), so that importing the package does
+# not load the WebSocket stack (``websocket_handler``, ``websocket_model`` and,
+# through them, ``jupyter_events``): it is only imported by
+# ``_load_jupyter_server_extension`` when RTC is off, or on first access here.
+_LAZY_EXPORTS = {
+    "BaseChatModel": ".models",
+    "WSChatHandler": ".websocket_handler",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_EXPORTS:
+        import importlib
+
+        module = importlib.import_module(_LAZY_EXPORTS[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 try:
     from ._version import __version__
@@ -66,15 +84,34 @@ def _load_jupyter_server_extension(server_app):
     # under WebSocket it backs the WS handler (owns ``chats_by_id``).
     from .chat_manager import ChatManager
 
-    chat_manager = ChatManager(server_app, rtc_enabled=rtc_info.enabled)
+    chat_manager = ChatManager(
+        server_app, rtc_enabled=rtc_info.enabled, parent=server_app
+    )
     server_app.web_app.settings["chat_manager"] = chat_manager
 
+    # The REST API serves both transports.
+    from jupyter_server.utils import url_path_join
+
+    from .handlers import ChatBlobHandler, ChatImportHandler, ChatMessagesHandler
+
+    base_url = server_app.web_app.settings.get("base_url", "/")
+    server_app.web_app.add_handlers(".*$", [
+        (url_path_join(base_url, "api/jupyter-chat/import"), ChatImportHandler),
+        (url_path_join(base_url, "api/jupyter-chat/messages"), ChatMessagesHandler),
+        (url_path_join(base_url, r"api/jupyter-chat/blobs/([0-9a-f]{64})"), ChatBlobHandler),
+    ])
+
     # When RTC is off, chat runs over the plain WebSocket handler. When an RTC
     # provider is active, the collaborative (YChat) backend serves chat instead.
     if not rtc_info.enabled:
-        base_url = server_app.web_app.settings.get("base_url", "/")
+        from .websocket_handler import MultiplexedWSChatHandler, WSChatHandler
+
         server_app.web_app.add_handlers(".*$", [
             (url_path_join(base_url, "api/jupyter-chat/ws"), WSChatHandler),
+            (
+                url_path_join(base_url, "api/jupyter-chat/ws/multiplex"),
+                MultiplexedWSChatHandler,
+            ),
         ])
 
     name = "jupyterlab_chat"
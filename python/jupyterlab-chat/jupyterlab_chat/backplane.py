@@ -0,0 +1,354 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""
+Relaying of the WebSocket chats between server processes.
+
+A :class:`ChatBackplane` lets several Jupyter server processes host the same
+WebSocket chat, each serving its own clients. Every change saved by a process
+is published on the topic of its chat (the chat id); the other processes
+hosting the chat apply it to their model and send it to their clients. A single
+process owns the persistence of the chats (``ChatManager.persist_chats``): it
+subscribes to all the topics, opening the chats changed elsewhere, and writes
+them to their store.
+
+The backplane is selected with the ``ChatManager.backplane_class``
+configurable:
+
+- :class:`InMemoryBackplane` relays between the managers of a single process,
+  e.g. in tests.
+- :class:`UnixSocketBackplane` relays between the processes of a host, through
+  a :class:`UnixSocketBroker` run by one of them (``start_broker``).
+"""
+from __future__ import annotations
+
+import asyncio
+import collections
+import json
+import os
+from abc import abstractmethod
+from typing import Callable, ClassVar, Dict, List, Optional, Set
+
+from jupyter_core.paths import jupyter_runtime_dir
+from tornado.ioloop import IOLoop
+from traitlets import Bool, Float, Int, Unicode
+from traitlets.config import LoggingConfigurable
+
+from .utils import ConfigurableABCMeta
+
+#: The topic matching the changes of all the chats.
+ALL_CHATS = "*"
+
+#: Maximum size in bytes of a frame relayed over a Unix domain socket.
+MAX_FRAME_SIZE = 2**26
+
+#: Size in bytes of the frames buffered for the broker beyond which the
+#: published changes wait with the pending ones.
+MAX_WRITE_BUFFER_SIZE = 2**20
+
+BackplaneCallback = Callable[[dict], None]
+
+
+class ChatBackplane(LoggingConfigurable, metaclass=ConfigurableABCMeta):
+    """Publishes the changes of chats to the other processes hosting them, and
+    delivers theirs to the subscribed callbacks. Subclass and select the
+    subclass with the ``ChatManager.backplane_class`` configurable.
+
+    A change is published on the topic of its chat, and delivered to the
+    callbacks subscribed to that topic or to :data:`ALL_CHATS` in the *other*
+    backplanes, never back to the publisher.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._subscribers: Dict[str, List[BackplaneCallback]] = {}
+
+    def subscribe(self, topic: str, callback: BackplaneCallback) -> None:
+        callbacks = self._subscribers.setdefault(topic, [])
+        callbacks.append(callback)
+        if len(callbacks) == 1:
+            self._on_subscribe(topic)
+
+    def unsubscribe(self, topic: str, callback: BackplaneCallback) -> None:
+        callbacks = self._subscribers.get(topic, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._subscribers[topic]
+                self._on_unsubscribe(topic)
+
+    @abstractmethod
+    def publish(self, topic: str, data: dict) -> None:
+        """Publish ``data``, a JSON-serializable dict, on ``topic``."""
+
+    def close(self) -> None:
+        pass
+
+    def _on_subscribe(self, topic: str) -> None:
+        """Called when ``topic`` gets its first subscriber."""
+
+    def _on_unsubscribe(self, topic: str) -> None:
+        """Called when ``topic`` loses its last subscriber."""
+
+    def _deliver(self, topic: str, data: dict) -> None:
+        """Hand ``data`` to the callbacks of ``topic`` and of all the chats,
+        each once. Callback errors are logged."""
+        callbacks = dict.fromkeys(
+            self._subscribers.get(topic, []) + self._subscribers.get(ALL_CHATS, [])
+        )
+        for callback in callbacks:
+            try:
+                callback(data)
+            except Exception:
+                self.log.exception("Chat backplane subscriber failed on %s", topic)
+
+
+class InMemoryBackplane(ChatBackplane):
+    """Relays between the backplanes of the same :attr:`hub` in this process.
+
+    The data is serialized, as between processes, so that the managers never
+    share the dicts of their models.
+    """
+
+    hub = Unicode(
+        "default",
+        config=True,
+        help="Name of the hub of the backplanes relaying to each other.",
+    )
+
+    _hubs: ClassVar[Dict[str, List["InMemoryBackplane"]]] = {}
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._hubs.setdefault(self.hub, []).append(self)
+
+    def publish(self, topic: str, data: dict) -> None:
+        raw = json.dumps(data)
+        for backplane in list(self._hubs.get(self.hub, [])):
+            if backplane is not self:
+                backplane._deliver(topic, json.loads(raw))
+
+    def close(self) -> None:
+        peers = self._hubs.get(self.hub, [])
+        if self in peers:
+            peers.remove(self)
+
+
+class UnixSocketBackplane(ChatBackplane):
+    """Relays through a :class:`UnixSocketBroker` listening on a Unix domain
+    socket, to which it reconnects whenever the connection is lost.
+
+    The frames are newline-delimited JSON: ``{"op": "sub"|"unsub", "topic"}``
+    and ``{"op": "pub", "topic", "data"}``. Changes published while
+    disconnected, or while :data:`MAX_WRITE_BUFFER_SIZE` bytes are waiting for
+    a slow broker, are kept pending, up to :attr:`max_pending`, and sent once
+    the connection is back or drained.
+    """
+
+    socket_path = Unicode(
+        "",
+        config=True,
+        help="""Path of the Unix domain socket of the broker; defaults to
+        ``jupyter-chat-backplane.sock`` in the Jupyter runtime directory.""",
+    )
+    start_broker = Bool(
+        False,
+        config=True,
+        help="Run the broker in this process; exactly one process should.",
+    )
+    reconnect_interval_s = Float(
+        1.0, config=True, help="Delay before reconnecting to the broker."
+    )
+    max_pending = Int(
+        10_000,
+        config=True,
+        help="""Number of changes kept while disconnected from the broker, or
+        while it is behind; the oldest ones are dropped beyond it.""",
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if not self.socket_path:
+            self.socket_path = os.path.join(
+                jupyter_runtime_dir(), "jupyter-chat-backplane.sock"
+            )
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._pending: collections.deque[bytes] = collections.deque(
+            maxlen=self.max_pending
+        )
+        self._task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._broker: Optional[UnixSocketBroker] = None
+        self._closed = False
+
+    def publish(self, topic: str, data: dict) -> None:
+        frame = _encode({"op": "pub", "topic": topic, "data": data})
+        writer = self._writer
+        if writer is not None and not self._pending and _has_room(writer):
+            writer.write(frame)
+        else:
+            if len(self._pending) == self._pending.maxlen:
+                self.log.warning("Chat backplane disconnected or behind; dropping a change")
+            self._pending.append(frame)
+            self._flush_pending()
+        self._start()
+
+    def _on_subscribe(self, topic: str) -> None:
+        # Subscriptions are (re)sent on connection.
+        if self._writer is not None:
+            self._writer.write(_encode({"op": "sub", "topic": topic}))
+        self._start()
+
+    def _on_unsubscribe(self, topic: str) -> None:
+        if self._writer is not None:
+            self._writer.write(_encode({"op": "unsub", "topic": topic}))
+
+    def _start(self) -> None:
+        """Start the connection task, once the event loop runs."""
+        if self._task is not None or self._closed:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            IOLoop.current().add_callback(self._start)
+            return
+        self._task = loop.create_task(self._run())
+
+    def _flush_pending(self) -> None:
+        """Start sending the pending changes, as the broker takes them."""
+        if self._writer is None or self._flush_task is not None:
+            return
+        self._flush_task = asyncio.get_running_loop().create_task(
+            self._send_pending(self._writer)
+        )
+
+    async def _send_pending(self, writer: asyncio.StreamWriter) -> None:
+        try:
+            while self._pending and writer is self._writer:
+                while self._pending and _has_room(writer):
+                    writer.write(self._pending.popleft())
+                await writer.drain()
+        except OSError:
+            # The connection is lost: `_run` reconnects.
+            pass
+        finally:
+            self._flush_task = None
+
+    async def _run(self) -> None:
+        if self.start_broker:
+            broker = UnixSocketBroker(self.socket_path)
+            try:
+                await broker.start()
+            except OSError as e:
+                self.log.error(
+                    "Could not start the chat backplane broker on %s: %s",
+                    self.socket_path,
+                    e,
+                )
+            else:
+                self._broker = broker
+        while not self._closed:
+            try:
+                reader, writer = await asyncio.open_unix_connection(
+                    self.socket_path, limit=MAX_FRAME_SIZE
+                )
+            except OSError as e:
+                self.log.debug("Could not connect to the chat backplane: %s", e)
+                await asyncio.sleep(self.reconnect_interval_s)
+                continue
+            for topic in self._subscribers:
+                writer.write(_encode({"op": "sub", "topic": topic}))
+            self._writer = writer
+            self._flush_pending()
+            try:
+                while line := await reader.readline():
+                    frame = json.loads(line)
+                    if frame.get("op") == "pub":
+                        self._deliver(frame["topic"], frame["data"])
+            except (OSError, ValueError, KeyError) as e:
+                self.log.warning("Chat backplane connection failed: %s", e)
+            finally:
+                self._writer = None
+                writer.close()
+            if not self._closed:
+                self.log.warning("Chat backplane disconnected; reconnecting")
+                await asyncio.sleep(self.reconnect_interval_s)
+
+    def close(self) -> None:
+        self._closed = True
+        if self._writer is not None:
+            self._writer.close()
+        for task in (self._task, self._flush_task):
+            if task is not None:
+                task.cancel()
+        if self._broker is not None:
+            self._broker.close()
+
+
+class UnixSocketBroker:
+    """Forwards the changes published by the connected backplanes to the other
+    connected backplanes subscribed to their topic. A change without a
+    connected subscriber is dropped, so the process persisting the chats must
+    be connected."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._topics: Dict[asyncio.StreamWriter, Set[str]] = {}
+
+    async def start(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._server = await asyncio.start_unix_server(
+            self._serve, self.path, limit=MAX_FRAME_SIZE
+        )
+
+    async def _serve(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        topics = self._topics[writer] = set()
+        try:
+            while line := await reader.readline():
+                frame = json.loads(line)
+                op, topic = frame.get("op"), frame.get("topic")
+                if op == "sub":
+                    topics.add(topic)
+                elif op == "unsub":
+                    topics.discard(topic)
+                elif op == "pub":
+                    peers = [
+                        peer
+                        for peer, peer_topics in self._topics.items()
+                        if peer is not writer
+                        and (topic in peer_topics or ALL_CHATS in peer_topics)
+                    ]
+                    # Wait for the subscribers to take the change before
+                    # reading the next one, so that a slow subscriber holds
+                    # back its publishers instead of buffering without limit.
+                    await asyncio.gather(*(_forward(peer, line) for peer in peers))
+        except (OSError, ValueError):
+            pass
+        finally:
+            del self._topics[writer]
+            writer.close()
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._topics):
+            writer.close()
+
+
+def _has_room(writer: asyncio.StreamWriter) -> bool:
+    return writer.transport.get_write_buffer_size() < MAX_WRITE_BUFFER_SIZE
+
+
+async def _forward(peer: asyncio.StreamWriter, line: bytes) -> None:
+    """Write ``line`` to ``peer``; a peer gone is left to its own connection."""
+    try:
+        peer.write(line)
+        await peer.drain()
+    except OSError:
+        pass
+
+
+def _encode(frame: dict) -> bytes:
+    return json.dumps(frame).encode() + b"\n"
@@ -0,0 +1,103 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""
+Content-addressed storage of large mime models.
+
+A message ``mime_model`` (e.g. a rendered output with base64 images) whose
+JSON serialization is larger than a threshold is offloaded to a blob: a file
+named after the SHA-256 of its content, in the hidden :data:`BLOBS_DIR`
+directory next to the chat file. The message then holds a reference,
+``{"blob": <digest>, "size": <bytes>}``, so the chat file and the frames sent
+to the clients stay small; identical payloads are stored once. The clients
+fetch the blobs they render from the ``api/jupyter-chat/blobs`` endpoint, and
+can cache them forever since a blob never changes.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+from . import chat_file
+
+#: Directory of the blobs, next to the chat files.
+BLOBS_DIR = ".chat_blobs"
+
+#: Key of the digest in a blob reference.
+BLOB_KEY = "blob"
+
+#: A valid blob digest.
+DIGEST_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+#: Maximum total size in bytes of the blobs kept in memory by :func:`read_blob`.
+CACHE_MAX_SIZE = 2**25
+
+
+def blobs_dir(path: Path) -> Path:
+    """The directory of the blobs of the chat file at ``path``."""
+    return path.parent / BLOBS_DIR
+
+
+def is_blob_ref(mime_model: Any) -> bool:
+    return isinstance(mime_model, dict) and BLOB_KEY in mime_model and "data" not in mime_model
+
+
+def offload(path: Path, mime_model: Optional[dict], min_size: int) -> Optional[dict]:
+    """The reference to the blob of ``mime_model`` if its serialization is at
+    least ``min_size`` bytes (writing the blob when new), else ``mime_model``
+    itself. ``path`` is the chat file the message belongs to."""
+    if not min_size or mime_model is None or is_blob_ref(mime_model):
+        return mime_model
+    data = json.dumps(mime_model).encode()
+    if len(data) < min_size:
+        return mime_model
+    digest = hashlib.sha256(data).hexdigest()
+    blob = blobs_dir(path) / digest
+    if not blob.exists():
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        chat_file.write_atomic(blob, data)
+    return {BLOB_KEY: digest, "size": len(data)}
+
+
+class _BlobCache:
+    """The blobs read last, up to :data:`CACHE_MAX_SIZE` bytes in total.
+    Blobs are immutable, so a cached blob is never stale."""
+
+    def __init__(self):
+        self._blobs: OrderedDict[Path, bytes] = OrderedDict()
+        self._size = 0
+
+    def read(self, blob: Path) -> bytes:
+        data = self._blobs.get(blob)
+        if data is not None:
+            self._blobs.move_to_end(blob)
+            return data
+        data = blob.read_bytes()
+        if len(data) <= CACHE_MAX_SIZE:
+            self._blobs[blob] = data
+            self._size += len(data)
+            while self._size > CACHE_MAX_SIZE:
+                _, evicted = self._blobs.popitem(last=False)
+                self._size -= len(evicted)
+        return data
+
+
+_cache = _BlobCache()
+
+
+def read_blob(path: Path, digest: str) -> bytes:
+    """The content of a blob of the chat file at ``path``; raises
+    ``FileNotFoundError`` for an unknown (or invalid) digest."""
+    if not DIGEST_PATTERN.match(digest):
+        raise FileNotFoundError(digest)
+    return _cache.read(blobs_dir(path) / digest)
+
+
+def resolve(path: Path, mime_model: Any) -> Any:
+    """``mime_model`` with a blob reference replaced by the blob content."""
+    if not is_blob_ref(mime_model):
+        return mime_model
+    return json.loads(read_blob(path, mime_model[BLOB_KEY]))
@@ -0,0 +1,425 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""The ``.chat`` file format.
+
+A chat file is a JSON object with the ``messages`` (sorted by time), ``users``
+(keyed by username), ``attachments`` (keyed by attachment id) and ``metadata``
+of a chat. Both chat models serialize through :func:`dumps`/:func:`dump`, and
+the offline maintenance functions below (used by the ``jupyter chat``
+command) work on the same content, so a file written by either is identical.
+
+A chat file may be segmented: its ``messages`` are then only the recent
+messages (the tail), and the older ones are archived in immutable segment
+files, listed in order under the ``segments`` key (the manifest). Segments are
+JSON arrays of messages, optionally gzip-compressed, kept in the hidden
+:data:`ARCHIVE_DIR` directory next to the chat file, under the chat id (so
+they follow a chat renamed in its directory). Opening a chat only
+reads the tail; the segments are read by :func:`read_archive` and
+:func:`read_history`.
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from dataclasses import fields
+from pathlib import Path
+from typing import IO, Iterable, Iterator, Optional, TypeGuard, Union
+
+from jupyter_core.paths import jupyter_runtime_dir
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None  # type: ignore[assignment]
+
+from .models import Message
+
+#: Top-level keys of a chat file, in the order they are written.
+CHAT_FILE_KEYS = ("messages", "users", "attachments", "metadata")
+
+#: Indentation of the serialized chat files.
+INDENT = 2
+
+#: Fields a serialized message must have.
+REQUIRED_MESSAGE_FIELDS: dict[str, Union[type, tuple[type, ...]]] = {
+    "id": str,
+    "body": str,
+    "time": (int, float),
+    "sender": str,
+}
+
+#: Fields a serialized message may have that list strings, and whether they
+#: may be null.
+LIST_MESSAGE_FIELDS = {"attachments": True, "mentions": False}
+
+#: Fields a serialized message may have.
+MESSAGE_FIELDS = {f.name for f in fields(Message)}
+
+#: Directory of the lock files of the chat files, in the Jupyter runtime
+#: directory.
+LOCK_DIR = "jupyter-chat-locks"
+
+#: Key of the manifest of the archive segments of a segmented chat file.
+SEGMENTS_KEY = "segments"
+
+#: Directory of the archive segments, next to the chat files.
+ARCHIVE_DIR = ".chat_archive"
+
+
+def chat_content(
+    messages: list,
+    users: dict,
+    attachments: dict,
+    metadata: dict,
+    segments: Optional[list] = None,
+) -> dict:
+    """The content of a chat file, with its keys in the file order. The
+    manifest of the archive ``segments`` is only written when there is one."""
+    content = {
+        "messages": messages,
+        "users": users,
+        "attachments": attachments,
+        "metadata": metadata,
+    }
+    if segments:
+        content[SEGMENTS_KEY] = segments
+    return content
+
+
+def dumps(content: dict) -> str:
+    return json.dumps(content, indent=INDENT)
+
+
+def dump(content: dict, f: IO[str]) -> None:
+    json.dump(content, f, indent=INDENT)
+
+
+def write_atomic(path: Path, data: Union[str, bytes]) -> None:
+    """Replace ``path`` with ``data`` without ever leaving a partial file."""
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb" if isinstance(data, bytes) else "w") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load(path: Union[str, Path]) -> dict:
+    """Read a chat file; raises ``ValueError`` if it is not a JSON object. An
+    empty file is an empty chat."""
+    text = Path(path).read_text()
+    content = json.loads(text) if text.strip() else {}
+    if not isinstance(content, dict):
+        raise ValueError("a chat file must contain a JSON object")
+    return content
+
+
+def normalize(content: dict) -> dict:
+    """``content`` with every chat file key, in the file order; other keys are
+    kept after them."""
+    normalized = chat_content(
+        content.get("messages", []),
+        content.get("users", {}),
+        content.get("attachments", {}),
+        content.get("metadata", {}),
+    )
+    normalized.update(content)
+    return normalized
+
+
+@contextmanager
+def lock(path: Path) -> Iterator[None]:
+    """Hold an exclusive advisory lock on the chat file at ``path``, shared by
+    the processes of the host. The lock is taken on a file of the Jupyter
+    runtime directory (see :func:`lock_path`), which, unlike the chat file, is
+    never replaced. A no-op where ``fcntl`` is not available, or the lock file
+    cannot be created."""
+    try:
+        if fcntl is None:  # pragma: no cover - Windows
+            raise OSError("fcntl is not available")
+        lock_file = lock_path(path)
+        lock_file.parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(lock_file, os.O_RDWR | os.O_CREAT, 0o600)
+    except OSError:
+        yield
+        return
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def lock_path(path: Path) -> Path:
+    """The lock file of the chat file at ``path``, named after its absolute
+    path."""
+    digest = hashlib.sha256(os.fsencode(path.absolute())).hexdigest()
+    return Path(jupyter_runtime_dir(), LOCK_DIR, f"{digest}.lock")
+
+
+def file_version(path: Path) -> Optional[tuple[int, int, int]]:
+    """The inode, modification time and size of ``path``, which change with
+    each write; ``None`` if it does not exist."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def merge(theirs: dict, ours: dict, changed: Iterable[str] = ()) -> dict:
+    """Merge the content ``ours`` of a chat with the content ``theirs`` written
+    meanwhile by another process, by message id: the messages of both are
+    kept, and a message in both is taken from ``ours`` if its id is in
+    ``changed``, else from ``theirs``. Users, attachments and metadata are
+    merged key by key, preferring ours. The longer archive manifest is kept
+    (manifests only grow), and the messages it archives are left out."""
+    changed = set(changed)
+    segments = max(
+        ours.get(SEGMENTS_KEY, []), theirs.get(SEGMENTS_KEY, []), key=len
+    )
+    archived_end = segments[-1]["end"] if segments else None
+    messages = {m["id"]: m for m in ours.get("messages", [])}
+    for message in theirs.get("messages", []):
+        if message["id"] not in messages or message["id"] not in changed:
+            messages[message["id"]] = message
+    return chat_content(
+        sorted(
+            (
+                m for m in messages.values()
+                if archived_end is None or m.get("time", 0) > archived_end
+            ),
+            key=lambda m: m.get("time", 0),
+        ),
+        {**theirs.get("users", {}), **ours.get("users", {})},
+        {**theirs.get("attachments", {}), **ours.get("attachments", {})},
+        {**theirs.get("metadata", {}), **ours.get("metadata", {})},
+        segments,
+    )
+
+
+def segments_dir(path: Path, content: dict) -> Path:
+    """The directory of the archive segments of the chat file at ``path``,
+    whose content is ``content``."""
+    return path.parent / ARCHIVE_DIR / content["metadata"]["id"]
+
+
+def write_segment(
+    path: Path, content: dict, messages: list[dict], compress: bool = True
+) -> None:
+    """Write ``messages``, older than the messages of ``content`` (the content
+    of the chat file at ``path``), to a new archive segment, and list it in the
+    manifest of ``content``. The chat file itself is not written."""
+    manifest = content.setdefault(SEGMENTS_KEY, [])
+    name = f"{len(manifest):06d}.json" + (".gz" if compress else "")
+    data = json.dumps(messages).encode()
+    directory = segments_dir(path, content)
+    directory.mkdir(parents=True, exist_ok=True)
+    write_atomic(directory / name, gzip.compress(data) if compress else data)
+    manifest.append({
+        "file": name,
+        "count": len(messages),
+        "start": messages[0].get("time", 0),
+        "end": messages[-1].get("time", 0),
+    })
+
+
+def archive(path: Path, content: dict, count: int, compress: bool = True) -> int:
+    """Move the ``count`` oldest messages of ``content``, the content of the
+    chat file at ``path``, into a new archive segment (see
+    :func:`write_segment`). Returns the number of messages archived.
+    """
+    messages = content.get("messages", [])
+    if count <= 0 or not messages:
+        return 0
+    archived, content["messages"] = messages[:count], messages[count:]
+    write_segment(path, content, archived, compress)
+    return len(archived)
+
+
+def read_segment(path: Path, content: dict, entry: dict) -> list[dict]:
+    """The messages of the archive segment described by the manifest ``entry``
+    of ``content``, the content of the chat file at ``path``."""
+    data = (segments_dir(path, content) / entry["file"]).read_bytes()
+    if entry["file"].endswith(".gz"):
+        data = gzip.decompress(data)
+    return json.loads(data)
+
+
+def read_archive(
+    path: Path, content: dict, since: Optional[float] = None
+) -> Iterator[dict]:
+    """The archived messages of the chat file at ``path``, oldest first. With
+    ``since``, the segments holding no later message are not read."""
+    for entry in content.get(SEGMENTS_KEY, []):
+        if since is None or entry["end"] > since:
+            yield from read_segment(path, content, entry)
+
+
+def select_messages(
+    messages: Iterable[dict], since: Optional[float] = None, limit: Optional[int] = None
+) -> list[dict]:
+    """The ``messages`` (oldest first) sent after ``since`` (all when ``None``),
+    at most ``limit`` of them."""
+    selected = (m for m in messages if since is None or m.get("time", 0) > since)
+    return list(itertools.islice(selected, limit))
+
+
+def read_history(
+    path: Path, content: dict, before: Optional[float] = None, limit: Optional[int] = None
+) -> list[dict]:
+    """The ``limit`` latest messages (all when ``None``) of the chat file at
+    ``path`` sent before ``before``, oldest first. The segments are read from
+    the newest, and only until ``limit`` messages are found."""
+    def sent_before(messages: list[dict]) -> list[dict]:
+        return [m for m in messages if before is None or m.get("time", 0) < before]
+
+    found = sent_before(content.get("messages", []))
+    for entry in reversed(content.get(SEGMENTS_KEY, [])):
+        if limit is not None and len(found) >= limit:
+            break
+        if before is None or entry["start"] < before:
+            found[:0] = sent_before(read_segment(path, content, entry))
+    return found if limit is None else found[max(0, len(found) - limit):]
+
+
+def find_chat_files(paths: list[str]) -> Iterator[Path]:
+    """The chat files among ``paths``, looking for ``*.chat`` files in the
+    directory trees."""
+    for path in map(Path, paths):
+        if path.is_dir():
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for name in sorted(files):
+                    if name.endswith(".chat"):
+                        yield Path(root) / name
+        else:
+            yield path
+
+
+def validate(content: dict) -> list[str]:
+    """The problems found in the content of a chat file (empty if valid)."""
+    problems = []
+    for key, container in zip(CHAT_FILE_KEYS, (list, dict, dict, dict)):
+        if not isinstance(content.get(key, container()), container):
+            problems.append(f"'{key}' is not a JSON {container.__name__}")
+    if problems:
+        return problems
+
+    attachments = content.get("attachments", {})
+    seen: set[str] = set()
+    last_time = float("-inf")
+    for index, message in enumerate(content.get("messages", [])):
+        where = f"message {index}"
+        if not isinstance(message, dict):
+            problems.append(f"{where} is not a JSON object")
+            continue
+        for name, kind in REQUIRED_MESSAGE_FIELDS.items():
+            if not isinstance(message.get(name), kind):
+                problems.append(f"{where} has no valid '{name}'")
+        for name, nullable in LIST_MESSAGE_FIELDS.items():
+            value = message.get(name, [])
+            if not (value is None and nullable or _is_str_list(value)):
+                problems.append(f"{where} has no valid '{name}'")
+        unknown = sorted(set(message) - MESSAGE_FIELDS)
+        if unknown:
+            problems.append(f"{where} has unknown fields {unknown}")
+        msg_id = message.get("id")
+        if isinstance(msg_id, str):
+            if msg_id in seen:
+                problems.append(f"{where} has a duplicate id '{msg_id}'")
+            seen.add(msg_id)
+        msg_time = message.get("time")
+        if isinstance(msg_time, (int, float)):
+            if msg_time < last_time:
+                problems.append(f"{where} is out of time order")
+            last_time = max(last_time, msg_time)
+        att_ids = message.get("attachments")
+        if _is_str_list(att_ids):
+            for att_id in att_ids:
+                if att_id not in attachments:
+                    problems.append(f"{where} refers to a missing attachment '{att_id}'")
+
+    metadata_id = content.get("metadata", {}).get("id")
+    if metadata_id is not None and not isinstance(metadata_id, str):
+        problems.append("'metadata.id' is not a string")
+    manifest = content.get(SEGMENTS_KEY, [])
+    if not isinstance(manifest, list) or not all(
+        isinstance(entry, dict) and {"file", "count", "start", "end"} <= set(entry)
+        for entry in manifest
+    ):
+        problems.append(f"'{SEGMENTS_KEY}' is not a valid segment manifest")
+    return problems
+
+
+def _is_str_list(value: object) -> TypeGuard[list[str]]:
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+def compact(content: dict, archived: Iterable[dict] = ()) -> dict[str, int]:
+    """Remove what a chat no longer needs from ``content``, in place.
+
+    Clears the body, mime model and attachments of deleted messages, then
+    drops the attachments no message refers to and the users who neither sent
+    nor are mentioned in a message. The ``archived`` messages of a segmented
+    chat are immutable, but count as references. Returns the number of items
+    removed, by kind.
+    """
+    removed = {"deleted_bodies": 0, "attachments": 0, "users": 0}
+    messages = content.get("messages", [])
+    for message in messages:
+        if message.get("deleted") and (
+            message.get("body")
+            or message.get("mime_model") is not None
+            or message.get("attachments")
+        ):
+            message["body"] = ""
+            message.pop("mime_model", None)
+            message.pop("attachments", None)
+            removed["deleted_bodies"] += 1
+
+    archived = list(archived)
+    referenced = {
+        att_id
+        for message in (*archived, *messages)
+        for att_id in message.get("attachments") or []
+    }
+    attachments = content.get("attachments", {})
+    for att_id in [a for a in attachments if a not in referenced]:
+        del attachments[att_id]
+        removed["attachments"] += 1
+
+    active = {message.get("sender") for message in (*archived, *messages)}
+    active.update(
+        username
+        for message in (*archived, *messages)
+        for username in message.get("mentions") or []
+    )
+    users = content.get("users", {})
+    for username in [u for u in users if u not in active]:
+        del users[username]
+        removed["users"] += 1
+    return removed
+
+
+def export_messages(content: dict, out: IO[str], path: Optional[Path] = None) -> int:
+    """Write the messages of a chat as NDJSON (one message per line, in time
+    order) to ``out``, in the format read by the bulk import endpoint. The
+    archived messages of a segmented chat file are included when its ``path``
+    is given. Returns the number of messages written."""
+    messages: Iterable[dict] = content.get("messages", [])
+    if path is not None:
+        messages = itertools.chain(read_archive(path, content), messages)
+    count = 0
+    for message in messages:
+        out.write(json.dumps(message))
+        out.write("\n")
+        count += 1
+    return count
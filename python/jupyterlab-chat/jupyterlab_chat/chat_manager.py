@@ -1,7 +1,8 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 """
-Transport-agnostic chat lifecycle: model access and memory management.
+Transport-agnostic chat lifecycle: model access, memory management and
+message retention.
 
 ``ChatManager`` gives server-side consumers (e.g. jupyter-ai-router, personas) a
 single way to (1) observe chat lifecycle events, (2) retrieve a chat model by path
@@ -20,12 +21,14 @@ generic schema; under WebSocket, the handler notifies the manager directly.
 """
 from __future__ import annotations
 
+import asyncio
+import bisect
 import time
 from pathlib import Path
-from typing import TYPE_CHECKING, Callable, Optional
+from typing import TYPE_CHECKING, Callable, Optional, cast
 
 from tornado.ioloop import PeriodicCallback
-from traitlets import Float
+from traitlets import Bool, Float, Int, Type
 from traitlets.config import LoggingConfigurable
 
 from .events import (
@@ -35,12 +38,25 @@ from .events import (
     ChatEvent,
     ChatEventAction,
 )
-from .websocket_model import WsChatModel
+from .metrics import (
+    CHAT_CONNECTED_CLIENTS_TOTAL,
+    CHAT_EVICTIONS,
+    CHAT_LIVE_TOTAL,
+    TRANSPORT_RTC,
+    TRANSPORT_WEBSOCKET,
+)
+from . import chat_file
+from .backplane import ALL_CHATS, ChatBackplane
+from .models import BaseChatModel, MessageFilter, OverflowPolicy
+from .observers import AllChatsMessageObserver
+from .stores import ChatChanges, ChatStore, JsonChatStore
+from .tracing import NULL_TRACE, FrameTrace, NullTraceExporter, TraceExporter
 
 if TYPE_CHECKING:
     from jupyter_server.serverapp import ServerApp
 
-    from .models import BaseChatModel
+    from .websocket_model import WsChatModel
+    from .ychat import YChat
 
 
 class ChatManager(LoggingConfigurable):
@@ -52,6 +68,8 @@ class ChatManager(LoggingConfigurable):
       2. Model access -- ``get`` (sync) / ``create`` (async get-or-create).
       3. Memory management -- frees a model after ``inactivity_timeout_s`` with no
          connected clients, or when its backing file is gone.
+      4. Retention -- archives the messages beyond ``retention_max_messages`` or
+         older than ``retention_max_age_s``, in the background.
 
     Every emitted event carries the chat's stable ``chat_id`` (``model.get_id()``).
     """
@@ -62,6 +80,106 @@ class ChatManager(LoggingConfigurable):
     poll_interval_s = Float(
         60.0, config=True, help="How often to poll for inactive/deleted chats."
     )
+    import_batch_size = Int(
+        10_000,
+        config=True,
+        help="""Number of messages inserted at once by the bulk import endpoint;
+        each batch is persisted and sent to the live clients in one step.""",
+    )
+    import_max_body_size = Int(
+        10 * 2**30,
+        config=True,
+        help="Maximum size in bytes of a bulk import request body.",
+    )
+    chat_store_class = Type(
+        default_value=JsonChatStore,
+        klass=ChatStore,
+        config=True,
+        help="""The store persisting the WebSocket chats: ``JsonChatStore`` keeps
+        each chat in its ``.chat`` file, ``SQLiteChatStore`` keeps the messages
+        as rows of a SQLite database, which saves large chats incrementally.
+        Collaborative chats are always kept in their ``.chat`` file.""",
+    )
+    blob_min_size = Int(
+        0,
+        config=True,
+        help="""Size in bytes from which the mime model of a message (e.g. a
+        rendered output) is stored in a content-addressed blob next to the chat
+        file, and fetched by the clients when rendered, rather than being
+        inlined in the chat file and the frames. 0 keeps them inline. Only
+        applies to WebSocket chats.""",
+    )
+    writing_status_interval_s = Float(
+        0.25,
+        config=True,
+        help="""Minimum interval in seconds between two broadcasts of the
+        writing statuses of a chat; the changes made in between are coalesced.
+        0 broadcasts every change.""",
+    )
+    writing_status_expiry_s = Float(
+        120.0,
+        config=True,
+        help="""Time in seconds after which a writer that did not refresh its
+        writing status is removed. 0 keeps the writers until they stop.""",
+    )
+    retention_max_messages = Int(
+        0,
+        config=True,
+        help="""Number of recent messages kept live in a chat; the older ones are
+        archived. 0 for no limit.""",
+    )
+    retention_max_age_s = Float(
+        0.0,
+        config=True,
+        help="""Age in seconds after which messages are archived. 0 for no
+        limit.""",
+    )
+    retention_min_archived = Int(
+        100,
+        config=True,
+        help="""Minimum number of expired messages archived at once, so that a
+        chat is not archived a few messages at a time.""",
+    )
+    retention_interval_s = Float(
+        3600.0, config=True, help="How often to apply the retention policy."
+    )
+    retention_scan_files = Bool(
+        True,
+        config=True,
+        help="""Also apply the retention policy to the chat files under the
+        server root that are not open.""",
+    )
+    backplane_class = Type(
+        default_value=None,
+        klass=ChatBackplane,
+        allow_none=True,
+        config=True,
+        help="""The backplane relaying the changes of the WebSocket chats
+        between the server processes hosting them, e.g. ``UnixSocketBackplane``,
+        so that the clients of a chat can be served by several processes. None
+        serves each chat from a single process.""",
+    )
+    persist_chats = Bool(
+        True,
+        config=True,
+        help="""Whether this process writes the WebSocket chats to their store,
+        and applies the retention policy. With a backplane, exactly one process
+        should: it receives the changes made in the others.""",
+    )
+    trace_exporter_class = Type(
+        default_value=NullTraceExporter,
+        klass=TraceExporter,
+        config=True,
+        help="""The exporter receiving per-frame latency traces of the WebSocket
+        handler. The default exporter disables tracing.""",
+    )
+    trace_in_frames = Bool(
+        False,
+        config=True,
+        help="""Echo the server-side trace id and stage timings in outgoing
+        ``msg`` frames, so clients can compute end-to-end latency. Only effective
+        when tracing is enabled.""",
+    )
 
     def __init__(self, serverapp: "ServerApp", rtc_enabled: bool = False, start_poller: bool = True, **kwargs):
         super().__init__(**kwargs)
@@ -69,6 +187,13 @@ class ChatManager(LoggingConfigurable):
         self._settings = serverapp.web_app.settings
         self._event_logger = self._settings.get("event_logger")
         self._rtc_enabled = rtc_enabled
+        # The classes of the traits are abstract, their configured values not.
+        trace_exporter_class: Callable[[], TraceExporter] = self.trace_exporter_class
+        chat_store_class: Callable[..., ChatStore] = self.chat_store_class
+        backplane_class: Optional[Callable[..., ChatBackplane]] = self.backplane_class
+        self.trace_exporter = trace_exporter_class()
+        self.chat_store = chat_store_class(parent=self)
+        self.backplane = backplane_class(parent=self) if backplane_class else None
 
         # Live chat models keyed by their stable chat id (``chat.get_id()``) --
         # the only stable identifier of a chat (paths change on rename; room ids
@@ -80,13 +205,35 @@ class ChatManager(LoggingConfigurable):
         # (same dict object as ``_chats_by_id``), keyed by the stable chat id.
         self._settings["chats_by_id"] = self._chats_by_id
 
+        # The observers of the messages of all the live chats.
+        self._all_chats_observers: list[AllChatsMessageObserver] = []
+
+        # The futures resolved with the model of a chat when it goes live,
+        # keyed by the chat id or path awaited, with their number of waiters
+        # (see `wait_for_chat`).
+        self._chat_waiters: dict[str, tuple[asyncio.Future, int]] = {}
+
+        # The paths of the chats whose collaboration room is being initialized
+        # (under RTC), before their model is live.
+        self._opening_room_paths: set[str] = set()
+
         self._register_schema()
+        if self.backplane is not None and self.persist_chats and not rtc_enabled:
+            # The process persisting the chats also persists the chats that
+            # are only open in other processes.
+            self.backplane.subscribe(ALL_CHATS, self._on_relayed)
         if rtc_enabled:
             self._wire_rtc_forwarding()
 
         self._poller = PeriodicCallback(self._poll, self.poll_interval_s * 1000)
+        self._retention_task: Optional[asyncio.Task] = None
+        self._retention_poller = PeriodicCallback(
+            self._start_retention, self.retention_interval_s * 1000
+        )
         if start_poller:
             self._poller.start()
+            if self.retention_enabled:
+                self._retention_poller.start()
 
     @property
     def _root_dir(self) -> Path:
@@ -122,6 +269,44 @@ class ChatManager(LoggingConfigurable):
             schema_id=CHAT_ROOM_EVENT_SCHEMA_ID, listener=callback
         )
 
+    def observe_all_messages(
+        self,
+        callback: Callable,
+        filter: Optional[MessageFilter] = None,
+        *,
+        maxsize: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+    ) -> AllChatsMessageObserver:
+        """Observe the messages of every live chat, current and future, of
+        either transport.
+
+        The events selected by ``filter`` are put in one queue, as with an
+        asynchronous ``observe_messages`` observer, and carry the ``chat_id``
+        of their chat; ``callback`` may be a coroutine function. The observer
+        is attached to each chat when it goes live and detached when it is
+        freed. Pass the returned observer to :meth:`unobserve_all_messages` to
+        stop it.
+        """
+        observer = AllChatsMessageObserver(
+            callback, filter, maxsize, overflow, self.transport
+        )
+        for chat_id, model in self._chats_by_id.items():
+            observer.attach(chat_id, model)
+        self._all_chats_observers.append(observer)
+        return observer
+
+    def unobserve_all_messages(self, observer: AllChatsMessageObserver) -> None:
+        if observer in self._all_chats_observers:
+            self._all_chats_observers.remove(observer)
+        observer.close()
+
+    async def wait_for_observers(self, model: "WsChatModel") -> None:
+        """Wait until the asynchronous observers of ``model``, and of all the
+        chats, with the ``block`` overflow policy have room in their queue."""
+        await model.wait_for_observers()
+        for observer in list(self._all_chats_observers):
+            await observer.wait_for_room()
+
     def _emit_event(self, event: ChatEvent) -> None:
         if self._event_logger is None:
             return
@@ -162,6 +347,25 @@ class ChatManager(LoggingConfigurable):
             )
         )
 
+    # ------------------------------------------------------------------
+    # Frame tracing (WebSocket transport)
+    # ------------------------------------------------------------------
+    def start_trace(self, path: str) -> FrameTrace:
+        """Start tracing a frame received on ``path``; returns the shared no-op
+        trace when tracing is disabled."""
+        if not self.trace_exporter.enabled:
+            return NULL_TRACE
+        return FrameTrace(path)
+
+    def finish_trace(self, trace: FrameTrace) -> None:
+        """Hand a finished trace to the exporter. Exporter errors are logged."""
+        if not trace.enabled:
+            return
+        try:
+            self.trace_exporter.export(trace)
+        except Exception as e:  # pragma: no cover - defensive
+            self.log.warning("Chat trace exporter failed: %s", e)
+
     # ------------------------------------------------------------------
     # Responsibility 2 -- model access
     # ------------------------------------------------------------------
@@ -181,13 +385,50 @@ class ChatManager(LoggingConfigurable):
         WS: get-or-create a ``WsChatModel`` (loading from disk; creating an empty
         chat when the file is missing is expected). RTC: an ``opened`` room event
         creates and caches the ``YChat``, so this returns an already-live model
-        and does not create one on demand.
+        and does not create one on demand; see :meth:`wait_for_chat` to wait for
+        it.
         """
         if self._rtc_enabled:
             existing = self._model_for_path(path)
             return existing
         return self._get_or_create_ws(path)
 
+    async def wait_for_chat(
+        self, path_or_id: str, timeout: Optional[float] = None
+    ) -> "BaseChatModel":
+        """Return the live model of a chat, by chat id or path, waiting for it
+        to go live: under RTC, until its room is initialized; under WebSocket,
+        until a client opens it.
+
+        Concurrent waiters for a chat share one future. Raises
+        ``asyncio.TimeoutError`` when the chat is not live within ``timeout``
+        seconds.
+        """
+        model = self.get(path_or_id) or self._model_for_path(path_or_id)
+        if model is not None:
+            return model
+        future, waiters = self._chat_waiters.get(path_or_id, (None, 0))
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+        self._chat_waiters[path_or_id] = (future, waiters + 1)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout)
+        finally:
+            if path_or_id in self._chat_waiters:
+                future, waiters = self._chat_waiters[path_or_id]
+                if waiters > 1:
+                    self._chat_waiters[path_or_id] = (future, waiters - 1)
+                else:
+                    del self._chat_waiters[path_or_id]
+                    future.cancel()
+
+    def is_open_in_room(self, path: str) -> bool:
+        """Whether the chat at ``path`` is open, or being opened, in a
+        collaboration room (under RTC)."""
+        return path in self._opening_room_paths or (
+            self._rtc_enabled and self._model_for_path(path) is not None
+        )
+
     def _model_for_path(self, path: str) -> Optional["BaseChatModel"]:
         """Find the live model whose current path is ``path`` (linear scan over
         the handful of live chats). Uses ``get_path()`` so a renamed chat is
@@ -213,8 +454,8 @@ class ChatManager(LoggingConfigurable):
                 continue
             # Inactivity: only applies to WS models we own the memory for. A
             # connected client keeps the chat alive.
-            if isinstance(model, WsChatModel):
-                if model.handlers:
+            if not self._rtc_enabled:
+                if cast("WsChatModel", model).handlers:
                     self._last_activity_by_id[chat_id] = now
                 elif now - self._last_activity_by_id.get(chat_id, now) > self.inactivity_timeout_s:
                     self._free(chat_id, ChatEventAction.CLOSED)
@@ -224,8 +465,14 @@ class ChatManager(LoggingConfigurable):
         self._last_activity_by_id.pop(chat_id, None)
         if model is None:
             return None
-        if isinstance(model, WsChatModel):
-            model.dispose()
+        for observer in self._all_chats_observers:
+            observer.detach(chat_id)
+        if not self._rtc_enabled:
+            cast("WsChatModel", model).dispose()
+            if self.backplane is not None:
+                self.backplane.unsubscribe(chat_id, self._on_relayed)
+        self._update_live_metric()
+        CHAT_EVICTIONS.labels(self.transport, action.value).inc()
         # The event carries the model's current path (for display/discovery) and
         # its stable chat id (the key we just freed).
         self._emit_event(
@@ -233,9 +480,159 @@ class ChatManager(LoggingConfigurable):
         )
         return model
 
+    # ------------------------------------------------------------------
+    # Responsibility 4 -- retention
+    # ------------------------------------------------------------------
+    @property
+    def retention_enabled(self) -> bool:
+        return self.persist_chats and bool(
+            self.retention_max_messages or self.retention_max_age_s
+        )
+
+    def _expired_count(self, times: list[float], now: float) -> int:
+        """The number of oldest messages to archive, given the times of all the
+        messages of a chat, oldest first; 0 while fewer than
+        ``retention_min_archived`` are expired."""
+        count = 0
+        if self.retention_max_messages:
+            count = max(len(times) - self.retention_max_messages, 0)
+        if self.retention_max_age_s:
+            count = max(count, bisect.bisect_left(times, now - self.retention_max_age_s))
+        return count if count >= max(self.retention_min_archived, 1) else 0
+
+    def _start_retention(self) -> None:
+        if self._retention_task is None or self._retention_task.done():
+            self._retention_task = asyncio.create_task(self.apply_retention())
+
+    async def apply_retention(self) -> int:
+        """Archive the expired messages of the live chats, then (with
+        ``retention_scan_files``) of the chat files that are not open. Returns
+        the number of messages archived.
+
+        Runs on the event loop, yielding between chats; the directory walk and
+        the archiving of the JSON chat files run in threads.
+        """
+        if not self.persist_chats:
+            return 0
+        now = time.time()
+        archived = 0
+        for chat_id, model in list(self._chats_by_id.items()):
+            count = self._expired_count(self._message_times(model), now)
+            if count:
+                try:
+                    archived += model.archive_messages(count)
+                except Exception as e:
+                    self.log.warning("Could not archive messages of chat %s: %s", chat_id, e)
+            await asyncio.sleep(0)
+        if self.retention_scan_files:
+            archived += await self._apply_file_retention(now)
+        if archived:
+            self.log.info("Archived %d expired chat message(s)", archived)
+        return archived
+
+    def _message_times(self, model: BaseChatModel) -> list[float]:
+        """The times of the messages of ``model``, read from their raw dicts
+        rather than from messages with resolved blobs."""
+        if self._rtc_enabled:
+            messages = cast("YChat", model)._get_messages()
+        else:
+            messages = cast("WsChatModel", model)._messages
+        return [m.get("time", 0) for m in messages]
+
+    async def _apply_file_retention(self, now: float) -> int:
+        # Under RTC, the chat files are in the JSON format whatever the store.
+        store = self.chat_store if not self._rtc_enabled else JsonChatStore(parent=self)
+        loop = asyncio.get_running_loop()
+        if isinstance(store, JsonChatStore):
+            # Walk and parse the chat files in a thread: only the few with
+            # expired messages are archived below.
+            paths = await loop.run_in_executor(None, self._find_expired_files, now)
+        else:
+            # Other stores are used from the event loop only.
+            paths = await loop.run_in_executor(
+                None, lambda: list(chat_file.find_chat_files([str(self._root_dir)]))
+            )
+        archived = 0
+        for path in paths:
+            live = {
+                self._root_dir / model.get_path() for model in self._chats_by_id.values()
+            }
+            if path in live:
+                continue
+            try:
+                if isinstance(store, JsonChatStore):
+                    archived += await loop.run_in_executor(
+                        None, self._archive_expired_file, store, path, now
+                    )
+                else:
+                    # Loaded, archived and saved without yielding, so that the
+                    # chat cannot be opened meanwhile.
+                    content = store.load(path)
+                    count = self._expired_count(
+                        [m.get("time", 0) for m in content.get("messages", [])], now
+                    )
+                    if count and "id" in content.get("metadata", {}):
+                        count = store.archive(path, content, count)
+                        store.save(
+                            path, chat_file.normalize(content), ChatChanges(state=True)
+                        )
+                        archived += count
+            except (OSError, ValueError, KeyError) as e:
+                self.log.warning("Could not archive messages of %s: %s", path, e)
+            await asyncio.sleep(0)
+        return archived
+
+    def _archive_expired_file(self, store: JsonChatStore, path: Path, now: float) -> int:
+        """Archive the expired messages of the JSON chat file at ``path``. Runs
+        in a thread, under the lock of the file, so that a chat opened
+        meanwhile is loaded once it is archived."""
+        with chat_file.lock(path):
+            content = chat_file.load(path)
+            count = self._expired_count(
+                [m.get("time", 0) for m in content.get("messages", [])], now
+            )
+            if not count or "id" not in content.get("metadata", {}):
+                return 0
+            count = store.archive(path, content, count)
+            chat_file.write_atomic(path, chat_file.dumps(chat_file.normalize(content)))
+        return count
+
+    def _find_expired_files(self, now: float) -> list[Path]:
+        """The JSON chat files with messages to archive. Runs in a thread."""
+        expired = []
+        for path in chat_file.find_chat_files([str(self._root_dir)]):
+            try:
+                messages = chat_file.load(path).get("messages", [])
+            except (OSError, ValueError):
+                continue
+            if self._expired_count([m.get("time", 0) for m in messages], now):
+                expired.append(path)
+        return expired
+
+    @property
+    def transport(self) -> str:
+        """The metrics label of the transport serving this session's chats. A
+        session has a single transport, so checking the flag (rather than the
+        model class) keeps the other transport's modules unimported."""
+        return TRANSPORT_RTC if self._rtc_enabled else TRANSPORT_WEBSOCKET
+
+    def _update_live_metric(self) -> None:
+        """Refresh the live-chats gauge from the registry."""
+        CHAT_LIVE_TOTAL.labels(self.transport).set(len(self._chats_by_id))
+
     def stop(self) -> None:
         if getattr(self, "_poller", None) is not None:
             self._poller.stop()
+            self._retention_poller.stop()
+        if self.backplane is not None:
+            self.backplane.close()
+        for observer in self._all_chats_observers:
+            observer.close()
+        self._all_chats_observers = []
+        for future, _ in self._chat_waiters.values():
+            future.cancel()
+        self._chat_waiters = {}
+        self.chat_store.close()
 
     # ------------------------------------------------------------------
     # WebSocket transport hooks (called by WSChatHandler)
@@ -248,6 +645,26 @@ class ChatManager(LoggingConfigurable):
         self._last_activity_by_id[model.get_id()] = time.time()
         return model
 
+    def ws_subscribe(self, model: "WsChatModel", client_id: str, handler) -> None:
+        """Route the frames broadcast by ``model`` to ``handler`` under
+        ``client_id``. ``handler`` has the ``write_message`` method of a
+        WebSocket handler: either the connection of a single chat, or one
+        channel of a multiplexed connection."""
+        if client_id not in model.handlers:
+            CHAT_CONNECTED_CLIENTS_TOTAL.inc()
+        model.handlers[client_id] = handler
+        self._last_activity_by_id[model.get_id()] = time.time()
+
+    def ws_unsubscribe(self, model: "WsChatModel", client_id: str) -> None:
+        """Stop routing the frames of ``model`` to ``client_id``, emitting
+        ``client_disconnected``; the model is freed with its last client."""
+        if model.handlers.pop(client_id, None) is None:
+            return
+        CHAT_CONNECTED_CLIENTS_TOTAL.dec()
+        self.on_client_disconnect(model.get_path(), client_id, model.get_id())
+        if not model.handlers:
+            self.ws_client_gone(model.get_id())
+
     def ws_activity(self, chat_id: str) -> None:
         self._last_activity_by_id[chat_id] = time.time()
 
@@ -273,12 +690,30 @@ class ChatManager(LoggingConfigurable):
         """
         return False
 
-    def _get_or_create_ws(self, path: str) -> "WsChatModel":
+    def _on_relayed(self, relayed: dict) -> None:
+        """Apply the changes of a chat saved by another process; the process
+        persisting the chats opens the chats it does not host."""
+        chat_id = relayed["chat_id"]
+        model = self._chats_by_id.get(chat_id)
+        if model is None:
+            if not self.persist_chats or not relayed.get("path"):
+                return
+            model = self._get_or_create_ws(relayed["path"], chat_id=chat_id)
+        self._last_activity_by_id[model.get_id()] = time.time()
+        cast("WsChatModel", model).apply_relayed(relayed)
+
+    def _get_or_create_ws(
+        self, path: str, chat_id: Optional[str] = None
+    ) -> "WsChatModel":
         # Reuse the live model for this path if one exists (matched by current
         # path, so a renamed chat is still found). A cached model is the live
         # in-memory session: reuse it verbatim -- we do not reload from disk
         # (out-of-band file changes are unsupported) so attached server-side
         # state, such as AI personas, is preserved across reconnects.
+        # The WebSocket stack is only imported once a WS chat is opened, so an
+        # RTC session never pays for it.
+        from .websocket_model import WsChatModel
+
         existing = self._model_for_path(path)
         if isinstance(existing, WsChatModel):
             return existing
@@ -286,11 +721,35 @@ class ChatManager(LoggingConfigurable):
             path=path,
             root_dir=self._root_dir,
             event_logger=self._event_logger,
+            store=self.chat_store,
+            blob_min_size=self.blob_min_size,
+            backplane=self.backplane,
+            persist=self.persist_chats,
+            writing_status_interval_s=self.writing_status_interval_s,
+            writing_status_expiry_s=self.writing_status_expiry_s,
         )
         model.load_from_file()
+        if chat_id is not None and model._unsaved_state:
+            # A new chat, created by another process: keep its id.
+            model.set_metadata("id", chat_id)
         chat_id = model.get_id()
+        if self.backplane is not None:
+            self.backplane.subscribe(chat_id, self._on_relayed)
+        self._add_live(chat_id, model, path)
+        return model
+
+    def _add_live(self, chat_id: str, model: "BaseChatModel", path: str) -> None:
+        """Register a chat that went live, attaching the observers of all the
+        chats, and emit ``opened``."""
         self._chats_by_id[chat_id] = model
         self._last_activity_by_id[chat_id] = time.time()
+        self._update_live_metric()
+        for observer in self._all_chats_observers:
+            observer.attach(chat_id, model)
+        for key in (chat_id, path, model.get_path()):
+            future, _ = self._chat_waiters.pop(key, (None, 0))
+            if future is not None:
+                future.set_result(model)
         self._emit_event(
             ChatEvent(
                 path=path,
@@ -298,7 +757,6 @@ class ChatManager(LoggingConfigurable):
                 chat_id=chat_id,
             )
         )
-        return model
 
     # ------------------------------------------------------------------
     # RTC forwarding (best-effort; not exercised without jupyter_collaboration)
@@ -326,7 +784,11 @@ class ChatManager(LoggingConfigurable):
             # Resolve the YChat: `get_document` loads the file content into the
             # doc before returning, so `get_id()` reads the persisted metadata id
             # (never mints a premature one that could conflict with disk).
-            model = await self._resolve_ychat(room, initial_path=path)
+            self._opening_room_paths.add(path)
+            try:
+                model = await self._resolve_ychat(room, initial_path=path)
+            finally:
+                self._opening_room_paths.discard(path)
             if model is None:
                 # No usable chat without a resolved model; do not emit an
                 # `opened` event that could not carry a chat_id.
@@ -335,16 +797,7 @@ class ChatManager(LoggingConfigurable):
                     room,
                 )
                 return
-            chat_id = model.get_id()
-            self._chats_by_id[chat_id] = model
-            self._last_activity_by_id[chat_id] = time.time()
-            self._emit_event(
-                ChatEvent(
-                    path=path,
-                    action=ChatEventAction.OPENED,
-                    chat_id=chat_id,
-                )
-            )
+            self._add_live(model.get_id(), model, path)
         elif action == "clean":
             model = self._model_for_path(path)
             if model is not None:
@@ -359,10 +812,15 @@ class ChatManager(LoggingConfigurable):
             model = await collaboration.get_document(room_id=room_id, copy=False)
             if model is not None:
                 # Record the room id (so get_path() can recover the file id) and
-                # the initial path, both taken from the room lifecycle event.
+                # the initial path, both taken from the room lifecycle event,
+                # the root directory (where archive segments are written), and
+                # the throttling of the writing statuses.
                 # `room_id` is an RTC transport detail kept internal to YChat.
                 model.room_id = room_id
                 model.initial_path = initial_path
+                model.root_dir = self._root_dir
+                model._writers.interval_s = self.writing_status_interval_s
+                model._writers.expiry_s = self.writing_status_expiry_s
             return model
         except Exception as e:  # pragma: no cover - depends on RTC install
             self.log.warning("Could not resolve YChat for room %s: %s", room_id, e)
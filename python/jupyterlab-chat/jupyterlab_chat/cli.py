@@ -0,0 +1,269 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""The ``jupyter chat`` command: offline export and maintenance of chat files.
+
+The maintenance subcommands (``validate``, ``compact``, ``format``,
+``archive``) take chat files and directories, which are searched for
+``*.chat`` files, and process the files in parallel with a process pool. The
+files are read and written with :mod:`jupyterlab_chat.chat_file`, the format
+of the chat models, under the lock the chat stores take, and are replaced
+atomically: a server that has a rewritten chat open merges the rewrite on its
+next save rather than overwriting it.
+"""
+from __future__ import annotations
+
+import os
+import sys
+from abc import abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Iterator, Tuple
+
+from jupyter_core.application import JupyterApp
+from traitlets import Bool, Int, Unicode
+
+from . import __version__, chat_file
+from .utils import ConfigurableABCMeta
+
+#: Result of a maintenance task on a file: whether it failed, and the lines to
+#: report for it.
+TaskResult = Tuple[bool, list]
+
+#: How the items removed by `chat_file.compact()` are reported.
+COMPACTED_ITEMS = {
+    "deleted_bodies": "deleted-message bodies",
+    "attachments": "orphaned attachments",
+    "users": "stale users",
+}
+
+
+def _load_valid(path: Path) -> dict:
+    """Load a chat file that passes validation; raises ``ValueError``."""
+    content = chat_file.load(path)
+    if chat_file.validate(content):
+        raise ValueError("invalid chat file, skipped (see `jupyter chat validate`)")
+    return content
+
+
+def validate_file(path: Path) -> TaskResult:
+    try:
+        problems = chat_file.validate(chat_file.load(path))
+    except (OSError, ValueError) as e:
+        problems = [str(e)]
+    return bool(problems), problems
+
+
+def compact_file(path: Path, dry_run: bool = False) -> TaskResult:
+    with chat_file.lock(path):
+        try:
+            content = _load_valid(path)
+            removed = chat_file.compact(content, chat_file.read_archive(path, content))
+        except (OSError, ValueError) as e:
+            return True, [str(e)]
+        if not any(removed.values()):
+            return False, []
+        if not dry_run:
+            chat_file.write_atomic(path, chat_file.dumps(chat_file.normalize(content)))
+    summary = ", ".join(
+        f"{count} {COMPACTED_ITEMS[kind]}" for kind, count in removed.items() if count
+    )
+    return False, [("would remove " if dry_run else "removed ") + summary]
+
+
+def archive_file(path: Path, keep: int, compress: bool = True) -> TaskResult:
+    with chat_file.lock(path):
+        try:
+            content = _load_valid(path)
+        except (OSError, ValueError) as e:
+            return True, [str(e)]
+        if "id" not in content.get("metadata", {}):
+            return True, ["the chat has no id yet, skipped (open it once)"]
+        archived = chat_file.archive(
+            path, content, len(content.get("messages", [])) - keep, compress
+        )
+        if not archived:
+            return False, []
+        chat_file.write_atomic(path, chat_file.dumps(chat_file.normalize(content)))
+    return False, [f"archived {archived} messages"]
+
+
+def format_file(path: Path, check: bool = False) -> TaskResult:
+    with chat_file.lock(path):
+        try:
+            text = path.read_text()
+            content = _load_valid(path)
+        except (OSError, ValueError) as e:
+            return True, [str(e)]
+        formatted = chat_file.dumps(chat_file.normalize(content))
+        if formatted == text:
+            return False, []
+        if check:
+            return True, ["would be reformatted"]
+        chat_file.write_atomic(path, formatted)
+    return False, ["reformatted"]
+
+
+class ChatFilesApp(JupyterApp, metaclass=ConfigurableABCMeta):
+    """Base class of the subcommands processing chat files in parallel."""
+
+    version = __version__
+
+    jobs = Int(
+        0,
+        config=True,
+        help="""Number of worker processes; 0 for one per CPU, 1 to process the
+        files in this process.""",
+    )
+
+    aliases = {**JupyterApp.aliases, "jobs": "ChatFilesApp.jobs"}
+
+    @abstractmethod
+    def task(self) -> Callable[[Path], TaskResult]:
+        """The maintenance task run on each file: a module-level function, or a
+        partial of one, so that it can be sent to the worker processes."""
+
+    def _run(self, paths: list[Path]) -> Iterator[TaskResult]:
+        task = self.task()
+        if self.jobs == 1 or len(paths) < 2:
+            yield from map(task, paths)
+            return
+        workers = self.jobs or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunksize = max(1, len(paths) // (workers * 4))
+            yield from pool.map(task, paths, chunksize=chunksize)
+
+    def start(self) -> None:
+        if not self.extra_args:
+            sys.exit(f"{self.name}: give the chat files or directories to process")
+        paths = list(chat_file.find_chat_files(self.extra_args))
+        failed = 0
+        for path, (failure, lines) in zip(paths, self._run(paths)):
+            failed += failure
+            for line in lines:
+                print(f"{path}: {line}")
+        self.report(len(paths), failed)
+        if failed:
+            sys.exit(1)
+
+    def report(self, total: int, failed: int) -> None:
+        self.log.info("%d chat file(s) processed, %d failed", total, failed)
+
+
+class ValidateApp(ChatFilesApp):
+    name = "jupyter-chat-validate"
+    description = "Check chat files for malformed content."
+    examples = "jupyter chat validate shared/ --jobs=8"
+
+    def task(self) -> Callable[[Path], TaskResult]:
+        return validate_file
+
+
+class CompactApp(ChatFilesApp):
+    name = "jupyter-chat-compact"
+    description = """Remove what chat files no longer need: the bodies of deleted
+    messages, the attachments no message refers to and the users who neither
+    sent nor are mentioned in a message."""
+    examples = "jupyter chat compact shared/ --dry-run"
+
+    dry_run = Bool(False, config=True, help="Report what would be removed, without writing.")
+    flags = {
+        **JupyterApp.flags,
+        "dry-run": ({"CompactApp": {"dry_run": True}}, dry_run.help),
+    }
+
+    def task(self) -> Callable[[Path], TaskResult]:
+        return partial(compact_file, dry_run=self.dry_run)
+
+
+class FormatApp(ChatFilesApp):
+    name = "jupyter-chat-format"
+    description = "Rewrite chat files in the format written by the chat models."
+    examples = "jupyter chat format shared/ --check"
+
+    check = Bool(
+        False, config=True, help="Only report the files that would be reformatted."
+    )
+    flags = {
+        **JupyterApp.flags,
+        "check": ({"FormatApp": {"check": True}}, check.help),
+    }
+
+    def task(self) -> Callable[[Path], TaskResult]:
+        return partial(format_file, check=self.check)
+
+
+class ArchiveApp(ChatFilesApp):
+    name = "jupyter-chat-archive"
+    description = """Segment chat files: move all but their most recent messages
+    to a new archive segment, so that the chats open without reading them."""
+    examples = "jupyter chat archive shared/ --keep=5000"
+
+    keep = Int(1000, config=True, help="Number of recent messages to keep in the chat files.")
+    compress = Bool(True, config=True, help="Whether to gzip-compress the archive segments.")
+    aliases = {**ChatFilesApp.aliases, "keep": "ArchiveApp.keep"}
+    flags = {
+        **JupyterApp.flags,
+        "no-compress": ({"ArchiveApp": {"compress": False}}, "Write uncompressed segments."),
+    }
+
+    def task(self) -> Callable[[Path], TaskResult]:
+        return partial(archive_file, keep=self.keep, compress=self.compress)
+
+
+class ExportApp(JupyterApp):
+    name = "jupyter-chat-export"
+    version = __version__
+    description = """Export the messages of a chat file as NDJSON (one message per
+    line, in time order, archived messages included), the format of the bulk
+    import endpoint."""
+    examples = "jupyter chat export team.chat --output=team.ndjson"
+
+    output = Unicode(
+        "", config=True, help="File to write the messages to (default: standard output)."
+    )
+    aliases = {**JupyterApp.aliases, "output": "ExportApp.output"}
+
+    def start(self) -> None:
+        if len(self.extra_args) != 1:
+            sys.exit(f"{self.name}: give one chat file to export")
+        path = Path(self.extra_args[0])
+        # The file and its archive are read together, not archived meanwhile.
+        with chat_file.lock(path):
+            try:
+                content = chat_file.load(path)
+            except (OSError, ValueError) as e:
+                sys.exit(f"{path}: {e}")
+            if self.output:
+                with open(self.output, "w") as out:
+                    count = chat_file.export_messages(content, out, path)
+            else:
+                count = chat_file.export_messages(content, sys.stdout, path)
+        self.log.info("%d message(s) exported", count)
+
+
+class ChatApp(JupyterApp):
+    name = "jupyter-chat"
+    version = __version__
+    description = "Export and maintain chat files."
+
+    subcommands = {
+        "export": (ExportApp, "Export the messages of a chat file as NDJSON."),
+        "validate": (ValidateApp, ValidateApp.description),
+        "compact": (CompactApp, "Remove what chat files no longer need."),
+        "format": (FormatApp, FormatApp.description),
+        "archive": (
+            ArchiveApp,
+            "Move all but the recent messages of chat files to archive segments.",
+        ),
+    }
+
+    def start(self) -> None:
+        super().start()
+        sys.exit(f"Please supply a subcommand: {', '.join(sorted(self.subcommands))}")
+
+
+main = launch_new_instance = ChatApp.launch_instance
+
+if __name__ == "__main__":
+    main()
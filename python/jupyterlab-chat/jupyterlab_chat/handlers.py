@@ -0,0 +1,303 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""REST handlers of the chat server extension.
+
+They serve both transports: the live model of a chat is obtained from the
+``ChatManager``, and a chat that is not live is read from or written to its
+file directly.
+"""
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import uuid
+from dataclasses import asdict
+from pathlib import Path
+from typing import TYPE_CHECKING, Optional
+
+from jupyter_server.base.handlers import APIHandler
+from tornado import web
+from tornado.http1connection import HTTP1Connection
+
+from . import blobs, chat_file
+from .metrics import CHAT_MESSAGES, TRANSPORT_RTC
+from .models import Message
+from .stores import ChatStore, JsonChatStore
+
+if TYPE_CHECKING:
+    from .chat_manager import ChatManager
+    from .models import BaseChatModel
+
+
+class ChatAPIHandler(APIHandler):
+    """Base class of the chat REST handlers."""
+
+    @property
+    def _chat_manager(self) -> "ChatManager":
+        return self.settings["chat_manager"]
+
+    @property
+    def _root_dir(self) -> Path:
+        return Path(self.settings.get("server_root_dir", ".")).expanduser().resolve()
+
+    def _get_path(self) -> str:
+        path = self.get_query_argument("path", None)
+        if not path:
+            raise web.HTTPError(400, "Missing 'path' query parameter")
+        if not (self._root_dir / path).resolve().is_relative_to(self._root_dir):
+            raise web.HTTPError(404, f"No chat at '{path}'")
+        return path
+
+    def _authorize(self, action: str) -> None:
+        """Check the current user may ``action`` ("read" or "write") the chat
+        files, which are contents."""
+        user = self.current_user
+        if user is None:
+            raise web.HTTPError(403)
+        if not self.authorizer.is_authorized(self, user, action, "contents"):
+            raise web.HTTPError(403)
+
+    async def _get_model(self, path: str) -> "BaseChatModel":
+        """The live model of the chat at ``path``; under RTC, a chat that is not
+        open in a collaboration room is served from its file."""
+        model = await self._chat_manager.create(path)
+        if model is None:
+            from .websocket_model import WsChatModel
+
+            model = WsChatModel(
+                path=path,
+                root_dir=self._root_dir,
+                blob_min_size=self._chat_manager.blob_min_size,
+            )
+            model.load_from_file()
+        return model
+
+
+@web.stream_request_body
+class ChatImportHandler(ChatAPIHandler):
+    """Bulk import of messages into the chat at ``?path=``.
+
+    The request body is NDJSON: one message per line, with at least ``body``,
+    ``sender`` and ``time`` (the original timestamp); ``id`` is generated when
+    missing, and the other :class:`Message` fields are optional. The body is
+    parsed as it streams in, and every ``ChatManager.import_batch_size``
+    messages are inserted with :meth:`BaseChatModel.import_messages`: one
+    persistence step and one notification of the live clients per batch.
+
+    Responds with the number of messages read and inserted (messages whose id
+    is already in the chat are skipped). An invalid line fails the request
+    with a 400 error; the batches committed before it stay imported.
+
+    Under RTC, a chat that is not open is imported into its file. Its
+    collaboration room would overwrite the file, so the import fails with a
+    409 error if the room opens before the import ends.
+    """
+
+    _model: Optional["BaseChatModel"] = None
+
+    async def prepare(self, *, _redirect_to_login: bool = True) -> None:
+        # APIHandler answers an unauthenticated request with a 403 rather
+        # than a redirection to the login page.
+        await super().prepare()
+        # The body is read before `post` runs: check the request as `post`
+        # would before accepting it.
+        self._authenticate_import()
+        connection = self.request.connection
+        if isinstance(connection, HTTP1Connection):
+            connection.set_max_body_size(self._chat_manager.import_max_body_size)
+        self._path = self._get_path()
+        self._buffer = b""
+        self._line_number = 0
+        self._pending: list[Message] = []
+        self._received = 0
+        self._imported = 0
+        # Raised by `post`: tornado cannot send an error response from
+        # `data_received`, so the rest of the body is ignored instead.
+        self._error: Optional[web.HTTPError] = None
+
+    @web.authenticated
+    def _authenticate_import(self) -> None:
+        self._authorize("write")
+
+    async def data_received(self, chunk: bytes) -> None:
+        if self._error is not None:
+            return
+        lines = (self._buffer + chunk).split(b"\n")
+        self._buffer = lines.pop()
+        try:
+            for line in lines:
+                self._read_line(line)
+                if len(self._pending) >= self._chat_manager.import_batch_size:
+                    await self._flush()
+        except web.HTTPError as e:
+            self._error = e
+
+    def _read_line(self, line: bytes) -> None:
+        self._line_number += 1
+        if not line.strip():
+            return
+        try:
+            data = json.loads(line)
+            if not isinstance(data, dict):
+                raise TypeError("a message must be a JSON object")
+            data.setdefault("id", str(uuid.uuid4()))
+            message = Message(**data)
+            if not isinstance(message.time, (int, float)):
+                raise TypeError("'time' must be a number of seconds since epoch")
+        except (ValueError, TypeError) as e:
+            raise web.HTTPError(400, f"Invalid message on line {self._line_number}: {e}")
+        self._pending.append(message)
+        self._received += 1
+
+    async def _flush(self) -> None:
+        if not self._pending:
+            return
+        if self._model is None:
+            self._model = await self._get_model(self._path)
+        live = self._chat_manager.get(self._model.get_id()) is self._model
+        if not live and self._chat_manager.is_open_in_room(self._path):
+            raise web.HTTPError(
+                409, f"The chat '{self._path}' was opened in a collaboration room"
+            )
+        try:
+            imported = self._model.import_messages(self._pending)
+        except NotImplementedError as e:
+            raise web.HTTPError(501, str(e))
+        self._pending = []
+        self._imported += imported
+        CHAT_MESSAGES.labels(self._chat_manager.transport, "import").inc(imported)
+
+    @web.authenticated
+    async def post(self):
+        if self._error is None:
+            self._read_line(self._buffer)
+        else:
+            self._pending = []
+        await self._flush()
+        if self._error is not None:
+            raise self._error
+        self.finish(json.dumps({"received": self._received, "imported": self._imported}))
+
+
+class ChatBlobHandler(ChatAPIHandler):
+    """The blob ``digest`` of the chat at ``?path=``: an offloaded mime model
+    (see :mod:`.blobs`), as JSON.
+
+    Blobs are immutable, so the digest is their strong ETag and clients may
+    cache them forever; a request with a matching ``If-None-Match`` header is
+    answered with a 304 without reading the blob.
+    """
+
+    @web.authenticated
+    async def get(self, digest: str):
+        self._authorize("read")
+        path = self._root_dir / self._get_path()
+        self.set_header("Cache-Control", "private, max-age=31536000, immutable")
+        self.set_etag_header()
+        if self.check_etag_header():
+            self.set_status(304)
+            return self.finish()
+        try:
+            data = blobs.read_blob(path, digest)
+        except FileNotFoundError:
+            raise web.HTTPError(404, f"No blob {digest} for chat '{self._get_path()}'")
+        self.set_header("Content-Type", "application/json")
+        self.finish(data)
+
+    def compute_etag(self) -> Optional[str]:
+        return f'"{self.path_args[0]}"'
+
+
+class ChatMessagesHandler(ChatAPIHandler):
+    """A read-only snapshot of the chat at ``?path=``, for viewers that do not
+    need live updates.
+
+    Responds with the chat ``id``, its ``messages`` sent after ``?since=``
+    (seconds since epoch; all by default), archived ones included, oldest
+    first and at most ``?limit=`` of them, and the ``users`` and
+    ``attachments`` of the chat. The messages are as serialized in the chat
+    file: large mime models are references to blobs (see ``ChatBlobHandler``).
+
+    A live chat is read from its model; otherwise the chat is read from its
+    store, without loading a model. The response has a strong ETag, derived
+    from the version of the model or of the chat in its store, so a request
+    with a matching ``If-None-Match`` header is answered with a 304 before
+    reading anything.
+    """
+
+    _etag: Optional[str] = None
+
+    @web.authenticated
+    async def get(self):
+        self._authorize("read")
+        path = self._get_path()
+        since = self._get_number("since", float)
+        limit = self._get_number("limit", int)
+        if limit is not None and limit < 0:
+            raise web.HTTPError(400, "'limit' must be non-negative")
+
+        model = self._chat_manager._model_for_path(path)
+        full_path = self._root_dir / path
+        store = self._store()
+        version = model.get_version() if model is not None else store.version(full_path)
+        if version is None:
+            raise web.HTTPError(404, f"No chat at '{path}'")
+        self._etag = '"%s"' % hashlib.sha1(
+            json.dumps([path, version, since, limit]).encode()
+        ).hexdigest()
+        self.set_header("Cache-Control", "no-cache")
+        self.set_etag_header()
+        if self.check_etag_header():
+            self.set_status(304)
+            return self.finish()
+
+        if model is not None:
+            snapshot = self._model_snapshot(model, since, limit)
+        else:
+            snapshot = self._file_snapshot(store, full_path, since, limit)
+        self.finish(json.dumps(snapshot))
+
+    def compute_etag(self) -> Optional[str]:
+        return self._etag
+
+    def _get_number(self, name: str, kind: type):
+        value = self.get_query_argument(name, None)
+        if value is None:
+            return None
+        try:
+            return kind(value)
+        except ValueError:
+            raise web.HTTPError(400, f"Invalid '{name}' query parameter")
+
+    def _store(self) -> ChatStore:
+        # Under RTC, the chat files are in the JSON format whatever the store.
+        if self._chat_manager.transport == TRANSPORT_RTC:
+            return JsonChatStore()
+        return self._chat_manager.chat_store
+
+    def _model_snapshot(
+        self, model: "BaseChatModel", since: Optional[float], limit: Optional[int]
+    ) -> dict:
+        return {
+            "id": model.get_id(),
+            "messages": model.read_messages(since, limit),
+            "users": {name: asdict(user) for name, user in model.get_users().items()},
+            "attachments": {
+                att_id: asdict(att) for att_id, att in model.get_attachments().items()
+            },
+        }
+
+    def _file_snapshot(
+        self, store: ChatStore, path: Path, since: Optional[float], limit: Optional[int]
+    ) -> dict:
+        content = store.load(path)
+        messages = itertools.chain(
+            store.read_archive(path, content, since), content.get("messages", [])
+        )
+        return {
+            "id": content.get("metadata", {}).get("id"),
+            "messages": chat_file.select_messages(messages, since, limit),
+            "users": content.get("users", {}),
+            "attachments": content.get("attachments", {}),
+        }
@@ -0,0 +1,117 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""
+Prometheus metrics exported by jupyterlab_chat.
+
+The metrics are registered in the default ``prometheus_client`` registry, which
+is the one jupyter_server serves on its ``/metrics`` endpoint, so they appear
+next to the server's own metrics without any extra wiring. ``prometheus_client``
+is a dependency of jupyter_server.
+
+Rates ("messages per second") are derived on the Prometheus side from the
+monotonic counters below. Read https://prometheus.io/docs/practices/naming/ for
+naming conventions for metrics & labels.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+#: Label value for chats served by the WebSocket transport (``WsChatModel``).
+TRANSPORT_WEBSOCKET = "websocket"
+#: Label value for chats served by the collaborative transport (``YChat``).
+TRANSPORT_RTC = "rtc"
+
+CHAT_LIVE_TOTAL = Gauge(
+    "jupyterlab_chat_live_chats_total",
+    "number of chat models currently held in memory, labeled by transport",
+    ["transport"],
+)
+
+CHAT_CONNECTED_CLIENTS_TOTAL = Gauge(
+    "jupyterlab_chat_connected_clients_total",
+    "number of WebSocket clients currently connected to a chat",
+)
+
+#: Under RTC, the clients write their messages to the shared document directly,
+#: without going through the server models: only the messages added and
+#: updated by the server (origin ``server``) are counted for that transport.
+CHAT_MESSAGES = Counter(
+    "jupyterlab_chat_messages",
+    "new chat messages, labeled by transport and origin (client or server)",
+    ["transport", "origin"],
+)
+
+CHAT_MESSAGE_UPDATES = Counter(
+    "jupyterlab_chat_message_updates",
+    "chat message updates (edits, streamed chunks), labeled by transport and origin",
+    ["transport", "origin"],
+)
+
+CHAT_BROADCAST_BYTES = Counter(
+    "jupyterlab_chat_broadcast_bytes",
+    "bytes written to WebSocket clients by chat broadcasts (frame size times recipients)",
+)
+
+CHAT_BROADCAST_DURATION_SECONDS = Histogram(
+    "jupyterlab_chat_broadcast_duration_seconds",
+    "duration in seconds to fan a frame out to every client of a chat",
+)
+
+CHAT_SAVE_DURATION_SECONDS = Histogram(
+    "jupyterlab_chat_save_duration_seconds",
+    "duration in seconds of WebSocket chat model saves to disk",
+)
+
+CHAT_LOAD_DURATION_SECONDS = Histogram(
+    "jupyterlab_chat_load_duration_seconds",
+    "duration in seconds of WebSocket chat model loads from disk",
+)
+
+CHAT_EVICTIONS = Counter(
+    "jupyterlab_chat_evictions",
+    "chat models freed by the chat manager, labeled by transport and reason",
+    ["transport", "reason"],
+)
+
+CHAT_OBSERVER_DURATION_SECONDS = Histogram(
+    "jupyterlab_chat_observer_duration_seconds",
+    "duration in seconds of a single message observer callback, labeled by transport",
+    ["transport"],
+)
+
+CHAT_OBSERVER_LAG_SECONDS = Histogram(
+    "jupyterlab_chat_observer_lag_seconds",
+    "delay in seconds between a message change and its delivery to an asynchronous "
+    "message observer, labeled by transport",
+    ["transport"],
+)
+
+CHAT_OBSERVER_QUEUED_EVENTS = Gauge(
+    "jupyterlab_chat_observer_queued_events",
+    "number of message events waiting in the queues of asynchronous message observers, "
+    "labeled by transport",
+    ["transport"],
+)
+
+CHAT_OBSERVER_DROPPED_EVENTS = Counter(
+    "jupyterlab_chat_observer_dropped_events",
+    "message events dropped or coalesced by the full queue of an asynchronous message "
+    "observer, labeled by transport and overflow policy",
+    ["transport", "policy"],
+)
+
+__all__ = [
+    "CHAT_BROADCAST_BYTES",
+    "CHAT_BROADCAST_DURATION_SECONDS",
+    "CHAT_CONNECTED_CLIENTS_TOTAL",
+    "CHAT_EVICTIONS",
+    "CHAT_LIVE_TOTAL",
+    "CHAT_LOAD_DURATION_SECONDS",
+    "CHAT_MESSAGES",
+    "CHAT_MESSAGE_UPDATES",
+    "CHAT_OBSERVER_DROPPED_EVENTS",
+    "CHAT_OBSERVER_DURATION_SECONDS",
+    "CHAT_OBSERVER_LAG_SECONDS",
+    "CHAT_OBSERVER_QUEUED_EVENTS",
+    "CHAT_SAVE_DURATION_SECONDS",
+    "TRANSPORT_RTC",
+    "TRANSPORT_WEBSOCKET",
+]
@@ -1,12 +1,33 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+import asyncio
+import hashlib
+import itertools
+import json
 from abc import ABC, abstractmethod
-from dataclasses import dataclass, field
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass, field
 from enum import Enum
-from typing import Any, Callable, Literal, Optional, Tuple, Union
+from functools import partial
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Collection,
+    ContextManager,
+    Literal,
+    Optional,
+    TYPE_CHECKING,
+    Tuple,
+    Union,
+)
 from jupyter_server.auth import User as JupyterUser
 
+if TYPE_CHECKING:
+    from .observers import MessageStream
+    from .threadsafe import ThreadSafeChat
+
 
 def message_asdict_factory(data):
     """ Remove None values when converting Message to dict """
@@ -239,6 +260,22 @@ class ChatMessageAction(str, Enum):
     """An existing server message was updated (e.g. a streaming response)."""
 
 
+class OverflowPolicy(str, Enum):
+    """What an asynchronous message observer does when its queue is full (see
+    :meth:`BaseChatModel.observe_messages`)."""
+
+    BLOCK = "block"
+    """Keep every event, and hold back the client whose message produced the
+    event until the observer catches up."""
+
+    DROP_OLDEST = "drop_oldest"
+    """Drop the oldest event waiting in the queue."""
+
+    COALESCE = "coalesce"
+    """Merge the events of a message waiting in the queue into one, delivering
+    its latest state; drop the oldest event if the queue is still full."""
+
+
 @dataclass
 class ChatMessageEvent:
     """A single message change delivered to ``observe_messages`` callbacks."""
@@ -249,9 +286,52 @@ class ChatMessageEvent:
     message: Message
     """The affected message (its current state)."""
 
+    chat_id: Optional[str] = None
+    """The id of the chat, on the events of
+    ``ChatManager.observe_all_messages``."""
+
+
+@dataclass(frozen=True)
+class MessageFilter:
+    """The message events an observer is called for (see
+    :meth:`BaseChatModel.observe_messages`); the unset fields match any event.
+
+    The models index their observers by the actions and senders of their
+    filter, so that an event only wakes the observers it is relevant to.
+    """
+
+    actions: Optional[Collection[ChatMessageAction]] = None
+    """Only the events of these actions."""
+
+    senders: Optional[Collection[str]] = None
+    """Only the messages of these senders (usernames)."""
 
-MessageObserverCallback = Callable[["ChatMessageEvent"], None]
-""" A callback invoked with a :class:`ChatMessageEvent` for each message change. """
+    exclude_senders: Collection[str] = frozenset()
+    """Not the messages of these senders, e.g. the observer's own messages."""
+
+    bot: Optional[bool] = None
+    """Only the messages of bot users (``True``) or of other users (``False``)."""
+
+    mentions: Optional[str] = None
+    """Only the messages mentioning this username."""
+
+    def __post_init__(self):
+        # Accept any collection, e.g. a list of actions, kept as a frozenset.
+        if self.actions is not None:
+            object.__setattr__(
+                self, "actions", frozenset(ChatMessageAction(a) for a in self.actions)
+            )
+        if self.senders is not None:
+            object.__setattr__(self, "senders", frozenset(self.senders))
+        object.__setattr__(self, "exclude_senders", frozenset(self.exclude_senders))
+
+
+MessageObserverCallback = Callable[["ChatMessageEvent"], Union[None, Awaitable[None]]]
+""" A callback invoked with a :class:`ChatMessageEvent` for each message change;
+the awaitable it may return is awaited before its next event. """
+
+MessageBatchObserverCallback = Callable[[list["ChatMessageEvent"]], None]
+""" A callback invoked with the :class:`ChatMessageEvent` list of each commit. """
 
 
 @dataclass
@@ -264,6 +344,7 @@ class MessageObserver:
     """
 
     _handle: Any = field(repr=False, compare=False)
+    _delivery: Any = field(default=None, repr=False, compare=False)
 
 
 class BaseChatModel(ABC):
@@ -285,6 +366,23 @@ class BaseChatModel(ABC):
         """
         ...
 
+    def get_version(self) -> str:
+        """Return an opaque token that changes whenever the content of the chat
+        changes (e.g. to validate a cached copy of the chat).
+
+        By default, a digest of the content of the chat: models should return
+        a token that does not require serializing the chat.
+        """
+        content = [
+            [asdict(message) for message in self.get_messages()],
+            {name: asdict(user) for name, user in self.get_users().items()},
+            {att_id: asdict(att) for att_id, att in self.get_attachments().items()},
+            self.get_metadata(),
+        ]
+        return hashlib.sha1(
+            json.dumps(content, sort_keys=True, default=str).encode()
+        ).hexdigest()
+
     @abstractmethod
     def get_message(self, id: str) -> Optional[Message]:
         ...
@@ -336,12 +434,90 @@ class BaseChatModel(ABC):
     def set_metadata(self, name: str, metadata: Any) -> None:
         ...
 
+    def import_messages(self, messages: list[Message]) -> int:
+        """Insert existing messages (e.g. history migrated from another tool)
+        in one step, keeping their ids, timestamps and senders.
+
+        Messages are placed in timestamp order among the existing ones; those
+        whose id is already in the chat are skipped, so an interrupted import
+        can be replayed. Imported messages are history: no trigger actions run
+        and message observers are not notified. Returns the number of messages
+        inserted.
+
+        Raises ``NotImplementedError`` by default: the other methods of the
+        model cannot insert a message with its id and timestamp.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not import messages")
+
+    def archive_messages(self, count: int) -> int:
+        """Move the ``count`` oldest messages out of the model, into the archive
+        of the chat (see ``chat_file``), in one step.
+
+        Archived messages are history kept out of memory: they are no longer
+        returned by ``get_message(s)`` nor sent to clients, and message
+        observers are not notified. Returns the number of messages archived.
+
+        By default, the model has no archive: nothing is archived.
+        """
+        return 0
+
+    def read_messages(
+        self, since: Optional[float] = None, limit: Optional[int] = None
+    ) -> list[dict]:
+        """The messages sent after ``since`` (all when ``None``), the archived
+        ones included, oldest first and at most ``limit`` of them, as they are
+        serialized in the chat file: a large mime model is a blob reference
+        (see ``blobs``).
+
+        By default, the messages of :meth:`get_messages`: the model has no
+        archive.
+        """
+        messages = (
+            asdict(message, dict_factory=message_asdict_factory)
+            for message in self.get_messages()
+        )
+        selected = (m for m in messages if since is None or m["time"] > since)
+        return list(itertools.islice(selected, limit))
+
+    def batch(self) -> ContextManager[None]:
+        """Group the mutations made in the ``with`` block into one commit.
+
+        Inside the block, changes apply to the in-memory state immediately (so
+        a message added in the block can be read back and edited), but their
+        side effects are deferred to the exit of the outermost block: the
+        collaborative model commits them as a single Y transaction; the
+        WebSocket model writes the chat file once and sends one combined frame.
+        Message observers receive the events of the whole block in one flush,
+        in order, after the commit; the observers registered with
+        :meth:`observe_message_batches` receive them as one list. Batches
+        nest; an exception raised in the block still commits the changes made
+        before it.
+
+        By default, the block does not group anything: each change is its own
+        commit.
+        """
+        return nullcontext()
+
     @abstractmethod
     def observe_messages(
-        self, callback: MessageObserverCallback
+        self,
+        callback: MessageObserverCallback,
+        *,
+        filter: Optional[MessageFilter] = None,
+        asynchronous: bool = False,
+        maxsize: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
     ) -> MessageObserver:
         """Register ``callback`` to be invoked with a :class:`ChatMessageEvent`
-        for each message change.
+        for each message change, or only for the changes selected by
+        ``filter``.
+
+        By default ``callback`` is invoked synchronously, while the message is
+        handled, so a slow callback delays the delivery of the message to the
+        clients. With ``asynchronous``, the events are put in a queue of the
+        observer, and ``callback`` (which may be a coroutine function) is
+        invoked from a task of its own; ``overflow`` tells what happens when
+        ``maxsize`` events are waiting.
 
         Returns a :class:`MessageObserver` handle; pass it to
         :meth:`unobserve_messages` to stop receiving updates and release the
@@ -349,12 +525,67 @@ class BaseChatModel(ABC):
         """
         ...
 
+    def observe_message_batches(
+        self,
+        callback: MessageBatchObserverCallback,
+        *,
+        filter: Optional[MessageFilter] = None,
+    ) -> MessageObserver:
+        """Register ``callback`` to be invoked once per commit of the model
+        (a single change, or a whole :meth:`batch`) with the list of its
+        :class:`ChatMessageEvent`, in order, selected by ``filter`` (if given).
+
+        ``callback`` is invoked synchronously, after the observers of
+        :meth:`observe_messages`, and not for the commits without a selected
+        event. Pass the returned handle to :meth:`unobserve_messages`.
+
+        By default, as each change is its own commit (see :meth:`batch`),
+        ``callback`` is invoked with each event on its own.
+        """
+        return self.observe_messages(lambda event: callback([event]), filter=filter)
+
+    def message_stream(
+        self,
+        filter: Union[MessageFilter, Callable[[ChatMessageEvent], bool], None] = None,
+        maxsize: int = 1000,
+    ) -> "MessageStream":
+        """Return an asynchronous iterator over the message changes, as
+        :class:`ChatMessageEvent` objects, selected by ``filter`` (if given): a
+        :class:`MessageFilter`, or a predicate on the events.
+
+        The events are queued until they are read, with the backpressure of
+        the ``block`` overflow policy of :meth:`observe_messages` beyond
+        ``maxsize`` events. The iterator is an asynchronous context manager;
+        closing it (``aclose()``) releases the subscription, and the iteration
+        ends when the model is freed.
+
+        By default, the stream is fed by a synchronous observer of
+        :meth:`observe_messages`, and the iteration only ends when the stream
+        is closed.
+        """
+        from .observers import MessageStream
+
+        stream = MessageStream(filter, maxsize)
+        observer = self.observe_messages(stream.put, filter=stream.filter)
+        stream._detach = partial(self.unobserve_messages, observer)
+        return stream
+
     @abstractmethod
     def unobserve_messages(self, observer: MessageObserver) -> None:
         """Stop a message observer previously registered via
-        :meth:`observe_messages`."""
+        :meth:`observe_messages` or :meth:`observe_message_batches`."""
         ...
 
+    def threadsafe(
+        self, loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> "ThreadSafeChat":
+        """Return a proxy of this model usable from other threads (e.g. a
+        blocking persona in a thread pool), which runs the calls on ``loop``,
+        by default the running event loop (see ``threadsafe``)."""
+        from .threadsafe import ThreadSafeChat
+
+        return ThreadSafeChat(self, loop)
+
     @abstractmethod
     def broadcast_writing_status(
         self,
@@ -0,0 +1,396 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""
+Asynchronous delivery of the message events to the message observers.
+
+An observer registered with ``observe_messages(callback, asynchronous=True)``
+gets an :class:`AsyncMessageObserver`: the events are put in its own bounded
+queue while the message is handled, and its callback is invoked from its own
+task, so that a slow observer (e.g. an AI persona) only delays itself.
+
+:meth:`BaseChatModel.message_stream` returns a :class:`MessageStream`, the same
+queue iterated by its consumer instead of drained by a callback.
+
+The models keep their observers in a :class:`MessageObserverIndex`, which only
+calls an observer for the events selected by its :class:`MessageFilter`. An
+observer registered with ``observe_message_batches`` is a
+:class:`BatchMessageObserver`, collecting the events of a commit into one list.
+
+``ChatManager.observe_all_messages`` returns an :class:`AllChatsMessageObserver`,
+a single queue fed by an observer on each live chat.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple, Union
+
+from tornado.ioloop import IOLoop
+
+from .metrics import (
+    CHAT_OBSERVER_DROPPED_EVENTS,
+    CHAT_OBSERVER_DURATION_SECONDS,
+    CHAT_OBSERVER_LAG_SECONDS,
+    CHAT_OBSERVER_QUEUED_EVENTS,
+)
+from .models import (
+    BaseChatModel,
+    ChatMessageAction,
+    ChatMessageEvent,
+    MessageBatchObserverCallback,
+    MessageFilter,
+    MessageObserver,
+    MessageObserverCallback,
+    OverflowPolicy,
+)
+
+_log = logging.getLogger(__name__)
+
+#: The actions of the events of a new message, kept when coalesced with the
+#: events of its updates.
+NEW_MESSAGE_ACTIONS = (
+    ChatMessageAction.CLIENT_MSG_RECEIVED,
+    ChatMessageAction.SERVER_MSG_SENT,
+)
+
+
+@dataclass(eq=False)
+class IndexedObserver:
+    """A message observer in a :class:`MessageObserverIndex`."""
+
+    callback: MessageObserverCallback
+    filter: Optional[MessageFilter]
+    order: int
+
+
+class MessageObserverIndex:
+    """The message observers of a model, indexed by the actions and senders
+    selected by their filter.
+
+    An observer is listed under each (action, sender) pair its filter selects,
+    ``None`` standing for any; an event only visits the four lists of its
+    action and sender, and checks the rest of the filters of their observers.
+    """
+
+    def __init__(self):
+        self._index: Dict[Tuple[Optional[str], Optional[str]], List[IndexedObserver]] = {}
+        self._observers: set[IndexedObserver] = set()
+        self._order = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._observers)
+
+    def add(
+        self, callback: MessageObserverCallback, filter: Optional[MessageFilter] = None
+    ) -> IndexedObserver:
+        observer = IndexedObserver(callback, filter, next(self._order))
+        for key in self._keys(filter):
+            self._index.setdefault(key, []).append(observer)
+        self._observers.add(observer)
+        return observer
+
+    def remove(self, observer: IndexedObserver) -> None:
+        if observer not in self._observers:
+            return
+        self._observers.remove(observer)
+        for key in self._keys(observer.filter):
+            observers = self._index[key]
+            observers.remove(observer)
+            if not observers:
+                del self._index[key]
+
+    def match(
+        self, event: ChatMessageEvent, is_bot: Callable[[str], bool]
+    ) -> Iterator[MessageObserverCallback]:
+        """The callbacks of the observers selecting ``event``, in the order
+        they were added; ``is_bot`` tells whether a sender is a bot user."""
+        action, sender = event.action.value, event.message.sender
+        candidates = heapq.merge(
+            *(
+                self._index.get(key, [])
+                for key in ((action, sender), (action, None), (None, sender), (None, None))
+            ),
+            key=lambda observer: observer.order,
+        )
+        for observer in list(candidates):
+            f = observer.filter
+            if f is not None and (
+                sender in f.exclude_senders
+                or (
+                    f.mentions is not None
+                    and f.mentions not in (event.message.mentions or ())
+                )
+                or (f.bot is not None and is_bot(sender) != f.bot)
+            ):
+                continue
+            yield observer.callback
+
+    @staticmethod
+    def _keys(filter: Optional[MessageFilter]) -> List[Tuple[Optional[str], Optional[str]]]:
+        actions: List[Optional[str]] = [None]
+        senders: List[Optional[str]] = [None]
+        if filter is not None and filter.actions is not None:
+            actions = [action.value for action in filter.actions]
+        if filter is not None and filter.senders is not None:
+            senders = list(filter.senders)
+        return [(action, sender) for action in actions for sender in senders]
+
+
+class BatchMessageObserver:
+    """A message observer receiving the events of each commit of a model as
+    one list.
+
+    Its :meth:`put` is added to the :class:`MessageObserverIndex` of the model
+    as a callback, and collects the selected events; the model calls
+    :meth:`flush` once it dispatched the events of a commit.
+    """
+
+    def __init__(self, callback: MessageBatchObserverCallback, transport: str):
+        self.callback = callback
+        self._transport = transport
+        self._events: List[ChatMessageEvent] = []
+
+    def put(self, event: ChatMessageEvent) -> None:
+        self._events.append(event)
+
+    def flush(self) -> None:
+        """Invoke the callback with the events collected since the last flush.
+        Its errors are logged."""
+        events, self._events = self._events, []
+        if not events:
+            return
+        try:
+            with CHAT_OBSERVER_DURATION_SECONDS.labels(self._transport).time():
+                self.callback(events)
+        except Exception:
+            _log.exception("Message batch observer failed")
+
+    def close(self) -> None:
+        self._events = []
+
+
+class AsyncMessageObserver:
+    """The queue and the consumer task of an asynchronous message observer.
+
+    :meth:`put` is the synchronous callback registered on the model. The
+    consumer task is started with the first event, once the event loop runs.
+    """
+
+    def __init__(
+        self,
+        callback: Any,
+        maxsize: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        transport: str = "",
+    ):
+        self.callback = callback
+        self.maxsize = maxsize
+        self.overflow = OverflowPolicy(overflow)
+        self._transport = transport
+        # The events waiting, with the (monotonic) time they were queued; keyed
+        # by message id when coalescing, else by a sequence number.
+        self._pending: OrderedDict[Hashable, tuple[ChatMessageEvent, float]] = OrderedDict()
+        self._sequence = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+
+    @property
+    def full(self) -> bool:
+        return bool(self.maxsize) and len(self._pending) >= self.maxsize
+
+    def put(self, event: ChatMessageEvent) -> None:
+        if self._closed:
+            return
+        queued = CHAT_OBSERVER_QUEUED_EVENTS.labels(self._transport)
+        if self.overflow == OverflowPolicy.COALESCE:
+            pending = self._pending.get(event.message.id)
+            if pending is not None:
+                previous, queued_at = pending
+                action = (
+                    previous.action if previous.action in NEW_MESSAGE_ACTIONS else event.action
+                )
+                self._pending[event.message.id] = (
+                    ChatMessageEvent(action=action, message=event.message),
+                    queued_at,
+                )
+                CHAT_OBSERVER_DROPPED_EVENTS.labels(self._transport, self.overflow.value).inc()
+                return
+        if self.full and self.overflow != OverflowPolicy.BLOCK:
+            self._pending.popitem(last=False)
+            queued.dec()
+            CHAT_OBSERVER_DROPPED_EVENTS.labels(self._transport, self.overflow.value).inc()
+        key = (
+            event.message.id
+            if self.overflow == OverflowPolicy.COALESCE
+            else next(self._sequence)
+        )
+        self._pending[key] = (event, time.monotonic())
+        queued.inc()
+        if self.full:
+            self._room.clear()
+        self._wakeup.set()
+        self._start()
+
+    async def wait_for_room(self) -> None:
+        """Wait until the queue is no longer full; only waits with the
+        ``block`` overflow policy."""
+        while self.overflow == OverflowPolicy.BLOCK and self.full and not self._closed:
+            await self._room.wait()
+
+    def _start(self) -> None:
+        if self._task is not None or self._closed:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            IOLoop.current().add_callback(self._start)
+            return
+        self._task = loop.create_task(self._consume())
+
+    async def get(self) -> Optional[ChatMessageEvent]:
+        """Wait for the next event; ``None`` once the delivery is closed."""
+        while not self._pending:
+            if self._closed:
+                return None
+            self._wakeup.clear()
+            await self._wakeup.wait()
+        _, (event, queued_at) = self._pending.popitem(last=False)
+        CHAT_OBSERVER_QUEUED_EVENTS.labels(self._transport).dec()
+        if not self.full:
+            self._room.set()
+        CHAT_OBSERVER_LAG_SECONDS.labels(self._transport).observe(
+            time.monotonic() - queued_at
+        )
+        return event
+
+    async def _consume(self) -> None:
+        duration = CHAT_OBSERVER_DURATION_SECONDS.labels(self._transport)
+        while (event := await self.get()) is not None:
+            try:
+                with duration.time():
+                    result = self.callback(event)
+                    if inspect.isawaitable(result):
+                        await result
+            except Exception:
+                _log.exception("Message observer failed for %s", event.action)
+
+    def close(self) -> None:
+        """Stop the delivery, dropping the events still waiting."""
+        self._closed = True
+        CHAT_OBSERVER_QUEUED_EVENTS.labels(self._transport).dec(len(self._pending))
+        self._pending.clear()
+        self._room.set()
+        self._wakeup.set()
+        if self._task is not None:
+            self._task.cancel()
+
+
+class AllChatsMessageObserver(AsyncMessageObserver):
+    """The queue of an observer of the messages of all the live chats (see
+    ``ChatManager.observe_all_messages``).
+
+    The manager attaches it to each chat when the chat goes live, and detaches
+    it when the chat is freed. Its events carry the ``chat_id`` of their chat.
+    """
+
+    def __init__(
+        self,
+        callback: Any,
+        filter: Optional[MessageFilter] = None,
+        maxsize: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+        transport: str = "",
+    ):
+        super().__init__(callback, maxsize, overflow, transport)
+        self.filter = filter
+        # The observers registered on the live chats, keyed by chat id.
+        self._chats: Dict[str, Tuple[BaseChatModel, MessageObserver]] = {}
+
+    def attach(self, chat_id: str, model: BaseChatModel) -> None:
+        if self._closed or chat_id in self._chats:
+            return
+        observer = model.observe_messages(partial(self._put_from, chat_id), filter=self.filter)
+        self._chats[chat_id] = (model, observer)
+
+    def detach(self, chat_id: str) -> None:
+        chat = self._chats.pop(chat_id, None)
+        if chat is not None:
+            model, observer = chat
+            model.unobserve_messages(observer)
+
+    def _put_from(self, chat_id: str, event: ChatMessageEvent) -> None:
+        self.put(ChatMessageEvent(action=event.action, message=event.message, chat_id=chat_id))
+
+    def close(self) -> None:
+        for chat_id in list(self._chats):
+            self.detach(chat_id)
+        super().close()
+
+
+class MessageStream(AsyncMessageObserver):
+    """An asynchronous iterator over the message events of a chat, returned by
+    :meth:`BaseChatModel.message_stream`.
+
+    The events selected by the filter are queued, up to ``maxsize`` with the
+    ``block`` overflow policy, until the iterator reads them; the iteration
+    ends when the stream is closed, by :meth:`aclose` or when the model is
+    freed. Use it as an asynchronous context manager to close it on exit::
+
+        async with chat.message_stream() as events:
+            async for event in events:
+                ...
+    """
+
+    def __init__(
+        self,
+        filter: Union[MessageFilter, Callable[[ChatMessageEvent], bool], None] = None,
+        maxsize: int = 1000,
+        transport: str = "",
+    ):
+        super().__init__(None, maxsize, OverflowPolicy.BLOCK, transport)
+        # A declarative filter is matched by the model, a predicate here.
+        self.filter = filter if isinstance(filter, MessageFilter) else None
+        self._predicate = None if isinstance(filter, MessageFilter) else filter
+        # Unregisters the stream from its model; set by the model.
+        self._detach: Optional[Callable[[], None]] = None
+
+    def put(self, event: ChatMessageEvent) -> None:
+        if self._predicate is not None and not self._predicate(event):
+            return
+        super().put(event)
+
+    def _start(self) -> None:
+        # The events are read by the iterator, not by a consumer task.
+        pass
+
+    def __aiter__(self) -> "MessageStream":
+        return self
+
+    async def __anext__(self) -> ChatMessageEvent:
+        event = await self.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    async def __aenter__(self) -> "MessageStream":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Unregister the stream from its model and end the iteration."""
+        if self._detach is not None:
+            self._detach()
+            self._detach = None
+        self.close()
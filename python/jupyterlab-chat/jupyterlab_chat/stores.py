@@ -0,0 +1,450 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""
+Persistence of the WebSocket chat models.
+
+A :class:`ChatStore` loads the content of a chat (see :mod:`.chat_file`) when
+its ``WsChatModel`` is created, and persists the model's changes on each save.
+The store is selected with the ``ChatManager.chat_store_class`` configurable:
+
+- :class:`JsonChatStore` (the default) keeps the chat in its ``.chat`` file,
+  rewritten on every save, optionally segmented.
+- :class:`SQLiteChatStore` keeps the messages as indexed rows of a SQLite
+  database, so a save only writes the messages that changed, and a message or
+  a time range is read without loading the chat. The ``.chat`` file is then a
+  pointer to the chat in the database (its id), and ``jupyter chat export``
+  no longer sees its messages.
+
+The collaborative model (``YChat``) is persisted by jupyter collaboration, and
+always to the ``.chat`` file.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+import sqlite3
+from abc import abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterable, Optional
+
+from jupyter_core.paths import jupyter_data_dir
+from traitlets import Bool, Int, Unicode
+from traitlets.config import LoggingConfigurable
+
+from . import chat_file
+from .utils import ConfigurableABCMeta
+
+
+@dataclass
+class ChatChanges:
+    """The changes of a chat model since its previous save."""
+
+    messages: list[dict] = field(default_factory=list)
+    """ The messages added or updated, in their current state. """
+
+    state: bool = False
+    """ Whether the users, attachments or metadata changed. """
+
+
+class ChatStore(LoggingConfigurable, metaclass=ConfigurableABCMeta):
+    """Loads and persists the content of the chats at the given ``.chat`` file
+    paths. Subclass and select the subclass with the
+    ``ChatManager.chat_store_class`` configurable.
+
+    The methods run on the server event loop, and are called with the absolute
+    path of the ``.chat`` file, which is kept current on in-band renames.
+    """
+
+    @abstractmethod
+    def load(self, path: Path) -> dict:
+        """The content of the chat at ``path``; an empty dict for a new chat."""
+
+    @abstractmethod
+    def save(self, path: Path, content: dict, changes: ChatChanges) -> Optional[dict]:
+        """Persist a chat. ``content`` is the whole content of the chat and
+        ``changes`` what changed in it since its previous save; a store writes
+        either. Returns the content written if it was merged with changes made
+        meanwhile by another process, for the model to adopt, else ``None``."""
+
+    def archive(self, path: Path, content: dict, count: int) -> int:
+        """Move the ``count`` oldest messages of ``content``, the content of the
+        chat at ``path``, out of it and into the archive of the chat, still read
+        by the readers below. The chat itself is persisted by the next save.
+        Returns the number of messages archived."""
+        return chat_file.archive(path, content, count)
+
+    def close(self) -> None:
+        """Release the resources of the store when the server stops."""
+
+    def release(self, path: Path) -> None:
+        """Release what the store keeps about the chat at ``path`` when its
+        model is freed."""
+
+    def version(self, path: Path) -> Optional[str]:
+        """A token changing whenever the chat at ``path`` is saved or archived,
+        e.g. to validate a cached copy of the chat; ``None`` if there is no
+        chat at ``path``."""
+        version = chat_file.file_version(path)
+        return None if version is None else ".".join(map(str, version))
+
+    def move(self, path: Path, new_path: Path) -> None:
+        """Follow the chat at ``path``, renamed to ``new_path``."""
+
+    # The readers below also read the archive of a segmented chat file (see
+    # `chat_file`), only as far as needed.
+
+    def read_message(self, path: Path, msg_id: str) -> Optional[dict]:
+        """The message ``msg_id`` of the chat at ``path``, without loading it
+        into a model."""
+        content = self.load(path)
+        return next(
+            (
+                m
+                for m in itertools.chain(
+                    content.get("messages", []), chat_file.read_archive(path, content)
+                )
+                if m.get("id") == msg_id
+            ),
+            None,
+        )
+
+    def read_messages(
+        self, path: Path, since: Optional[float] = None, limit: Optional[int] = None
+    ) -> list[dict]:
+        """The messages of the chat at ``path`` sent after ``since`` (all when
+        ``None``), oldest first, at most ``limit`` of them."""
+        content = self.load(path)
+        return chat_file.select_messages(
+            itertools.chain(
+                self.read_archive(path, content, since), content.get("messages", [])
+            ),
+            since,
+            limit,
+        )
+
+    def read_archive(
+        self, path: Path, content: dict, since: Optional[float] = None
+    ) -> Iterable[dict]:
+        """The archived messages of the chat at ``path``, whose content (as
+        loaded) is ``content``, oldest first; at least those sent after
+        ``since``."""
+        return chat_file.read_archive(path, content, since)
+
+    def read_history(
+        self, path: Path, before: Optional[float] = None, limit: Optional[int] = None
+    ) -> list[dict]:
+        """The ``limit`` latest messages (all when ``None``) of the chat at
+        ``path`` sent before ``before``, oldest first: a page of history."""
+        return chat_file.read_history(path, self.load(path), before, limit)
+
+
+class JsonChatStore(ChatStore):
+    """Keeps a chat in its ``.chat`` file: the default store.
+
+    With a ``tail_size``, the chat files are segmented: when a chat is opened
+    with ``segment_size`` messages or more beyond its tail, they are moved to
+    a new archive segment, so that a chat is opened (and held in memory) in a
+    time bounded by the size of its tail, not by its age.
+
+    The chat files are read and written under an advisory lock (see
+    :func:`chat_file.lock`). A chat file written by another process since it
+    was last loaded or saved here (e.g. by another server sharing the home
+    directory) is merged by message id rather than overwritten.
+    """
+
+    tail_size = Int(
+        0,
+        config=True,
+        help="""Number of recent messages kept in a chat file; the older ones are
+        archived in segments. 0 keeps every message in the chat file.""",
+    )
+    segment_size = Int(
+        1000,
+        config=True,
+        help="Minimum number of messages archived at once, in one segment.",
+    )
+    compress_segments = Bool(
+        True, config=True, help="Whether to gzip-compress the archive segments."
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # The version (see `chat_file.file_version`) of the chat files as last
+        # loaded or saved by this store.
+        self._versions: dict[Path, Optional[tuple]] = {}
+
+    def load(self, path: Path) -> dict:
+        with chat_file.lock(path):
+            try:
+                content = chat_file.load(path)
+            except (FileNotFoundError, ValueError):
+                return {}
+            overflow = len(content.get("messages", [])) - self.tail_size
+            if self.tail_size and overflow >= self.segment_size and "id" in content.get("metadata", {}):
+                self.archive(path, content, overflow)
+                chat_file.write_atomic(path, chat_file.dumps(content))
+            self._versions[path] = chat_file.file_version(path)
+        return content
+
+    def archive(self, path: Path, content: dict, count: int) -> int:
+        return chat_file.archive(path, content, count, self.compress_segments)
+
+    def release(self, path: Path) -> None:
+        self._versions.pop(path, None)
+
+    def move(self, path: Path, new_path: Path) -> None:
+        # A rename keeps the inode, modification time and size of the file.
+        if path in self._versions:
+            self._versions[new_path] = self._versions.pop(path)
+
+    def save(self, path: Path, content: dict, changes: ChatChanges) -> Optional[dict]:
+        merged = None
+        with chat_file.lock(path):
+            version = chat_file.file_version(path)
+            if version is not None and version != self._versions.get(path):
+                try:
+                    theirs = chat_file.load(path)
+                except ValueError:
+                    theirs = {}
+                if theirs:
+                    self.log.info("Merging the changes made to %s by another process", path)
+                    content = merged = chat_file.merge(
+                        theirs, content, (m["id"] for m in changes.messages)
+                    )
+            chat_file.write_atomic(path, chat_file.dumps(content))
+            self._versions[path] = chat_file.file_version(path)
+        return merged
+
+
+#: Value of the ``store`` key of the ``.chat`` files pointing to a chat kept in
+#: a SQLite database.
+SQLITE_STORE = "sqlite"
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    id TEXT PRIMARY KEY,
+    users TEXT NOT NULL,
+    attachments TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    time REAL NOT NULL,
+    data TEXT NOT NULL,
+    archived INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (chat_id, id)
+);
+CREATE INDEX IF NOT EXISTS messages_by_time ON messages (chat_id, time);
+"""
+
+
+class SQLiteChatStore(ChatStore):
+    """Keeps the chats in a SQLite database, one row per message.
+
+    A chat is keyed by its stable id (``metadata.id``), so renaming its
+    ``.chat`` file needs no change in the database. On its first save, a chat
+    whose messages are in its ``.chat`` file is copied into the database, and
+    the file is replaced by a pointer: the chat id, under ``metadata``, and a
+    ``"store": "sqlite"`` entry.
+
+    Messages are ordered by time, then by insertion. Archived messages stay
+    in the database, flagged so that they are not loaded into the models. The
+    version of a chat is a counter of its saves and archivings.
+    """
+
+    database = Unicode(
+        "",
+        config=True,
+        help="""Path of the SQLite database; defaults to ``chats.sqlite`` in the
+        Jupyter data directory.""",
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        database = Path(self.database or Path(jupyter_data_dir()) / "chats.sqlite")
+        database.parent.mkdir(parents=True, exist_ok=True)
+        self._connection = sqlite3.connect(database)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SQLITE_SCHEMA)
+        # Ids of the chats known to be in the database.
+        self._chat_ids: set[str] = set()
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _chat_id(self, path: Path) -> Optional[str]:
+        """The id of the chat in the database that ``path`` points to."""
+        try:
+            content = chat_file.load(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        chat_id = content.get("metadata", {}).get("id")
+        if not isinstance(chat_id, str) or not self._has_chat(chat_id):
+            return None
+        return chat_id
+
+    def _has_chat(self, chat_id: str) -> bool:
+        if chat_id not in self._chat_ids:
+            row = self._connection.execute(
+                "SELECT 1 FROM chats WHERE id = ?", (chat_id,)
+            ).fetchone()
+            if row is None:
+                return False
+            self._chat_ids.add(chat_id)
+        return True
+
+    def load(self, path: Path) -> dict:
+        try:
+            content = chat_file.load(path)
+        except (FileNotFoundError, ValueError):
+            return {}
+        chat_id = content.get("metadata", {}).get("id")
+        if not isinstance(chat_id, str) or not self._has_chat(chat_id):
+            # A chat not copied into the database yet.
+            return content
+        users, attachments, metadata = self._connection.execute(
+            "SELECT users, attachments, metadata FROM chats WHERE id = ?", (chat_id,)
+        ).fetchone()
+        return chat_file.chat_content(
+            self._select_messages(chat_id, live=True),
+            json.loads(users),
+            json.loads(attachments),
+            json.loads(metadata),
+        )
+
+    def save(self, path: Path, content: dict, changes: ChatChanges) -> Optional[dict]:
+        chat_id = content["metadata"]["id"]
+        with self._connection:
+            if self._has_chat(chat_id):
+                self._upsert_messages(chat_id, changes.messages)
+                if changes.state:
+                    self._upsert_chat(chat_id, content)
+                self._bump_version(chat_id)
+                return None
+            self._upsert_messages(
+                chat_id,
+                itertools.chain(chat_file.read_archive(path, content), content["messages"]),
+            )
+            self._upsert_chat(chat_id, content)
+        self._chat_ids.add(chat_id)
+        self._write_pointer(path, chat_id)
+        return None
+
+    def archive(self, path: Path, content: dict, count: int) -> int:
+        messages = content.get("messages", [])
+        archived, content["messages"] = messages[:count], messages[count:]
+        chat_id = content["metadata"]["id"]
+        if self._has_chat(chat_id):
+            with self._connection:
+                self._connection.executemany(
+                    "UPDATE messages SET archived = 1 WHERE chat_id = ? AND id = ?",
+                    ((chat_id, m["id"]) for m in archived),
+                )
+                self._bump_version(chat_id)
+        else:
+            # Not copied into the database yet: archive in the chat file.
+            content["messages"] = messages
+            return super().archive(path, content, count)
+        return len(archived)
+
+    def version(self, path: Path) -> Optional[str]:
+        chat_id = self._chat_id(path)
+        if chat_id is None:
+            return super().version(path)
+        (version,) = self._connection.execute(
+            "SELECT version FROM chats WHERE id = ?", (chat_id,)
+        ).fetchone()
+        return f"{SQLITE_STORE}.{chat_id}.{version}"
+
+    def read_archive(
+        self, path: Path, content: dict, since: Optional[float] = None
+    ) -> Iterable[dict]:
+        chat_id = content.get("metadata", {}).get("id")
+        if not isinstance(chat_id, str) or not self._has_chat(chat_id):
+            return super().read_archive(path, content, since)
+        rows = self._connection.execute(
+            "SELECT data FROM messages WHERE chat_id = ? AND archived = 1 AND time > ?"
+            " ORDER BY time, rowid",
+            (chat_id, float("-inf") if since is None else since),
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def read_message(self, path: Path, msg_id: str) -> Optional[dict]:
+        chat_id = self._chat_id(path)
+        if chat_id is None:
+            return super().read_message(path, msg_id)
+        row = self._connection.execute(
+            "SELECT data FROM messages WHERE chat_id = ? AND id = ?", (chat_id, msg_id)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def read_messages(
+        self, path: Path, since: Optional[float] = None, limit: Optional[int] = None
+    ) -> list[dict]:
+        chat_id = self._chat_id(path)
+        if chat_id is None:
+            return super().read_messages(path, since, limit)
+        return self._select_messages(chat_id, since, limit)
+
+    def read_history(
+        self, path: Path, before: Optional[float] = None, limit: Optional[int] = None
+    ) -> list[dict]:
+        chat_id = self._chat_id(path)
+        if chat_id is None:
+            return super().read_history(path, before, limit)
+        rows = self._connection.execute(
+            "SELECT data FROM messages WHERE chat_id = ? AND time < ?"
+            " ORDER BY time DESC, rowid DESC LIMIT ?",
+            (chat_id, float("inf") if before is None else before, -1 if limit is None else limit),
+        )
+        return [json.loads(data) for (data,) in rows][::-1]
+
+    def _select_messages(
+        self,
+        chat_id: str,
+        since: Optional[float] = None,
+        limit: Optional[int] = None,
+        live: bool = False,
+    ) -> list[dict]:
+        """The messages of a chat, the archived ones included unless ``live``."""
+        rows = self._connection.execute(
+            "SELECT data FROM messages WHERE chat_id = ? AND time > ?"
+            + (" AND archived = 0" if live else "")
+            + " ORDER BY time, rowid LIMIT ?",
+            (chat_id, float("-inf") if since is None else since, -1 if limit is None else limit),
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def _upsert_messages(self, chat_id: str, messages: Iterable[dict]) -> None:
+        self._connection.executemany(
+            "INSERT INTO messages (chat_id, id, time, data) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (chat_id, id) DO UPDATE SET time = excluded.time, data = excluded.data",
+            ((chat_id, m["id"], m.get("time", 0), json.dumps(m)) for m in messages),
+        )
+
+    def _upsert_chat(self, chat_id: str, content: dict) -> None:
+        self._connection.execute(
+            "INSERT INTO chats (id, users, attachments, metadata) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (id) DO UPDATE SET users = excluded.users,"
+            " attachments = excluded.attachments, metadata = excluded.metadata",
+            (
+                chat_id,
+                json.dumps(content["users"]),
+                json.dumps(content["attachments"]),
+                json.dumps(content["metadata"]),
+            ),
+        )
+
+    def _bump_version(self, chat_id: str) -> None:
+        self._connection.execute(
+            "UPDATE chats SET version = version + 1 WHERE id = ?", (chat_id,)
+        )
+
+    def _write_pointer(self, path: Path, chat_id: str) -> None:
+        pointer = chat_file.chat_content([], {}, {}, {"id": chat_id})
+        pointer["store"] = SQLITE_STORE
+        chat_file.write_atomic(path, chat_file.dumps(pointer))
@@ -0,0 +1,170 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the relaying of WebSocket chats between server processes."""
+import asyncio
+import json
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, List, cast
+
+import pytest
+
+from jupyterlab_chat.backplane import (
+    ALL_CHATS,
+    MAX_WRITE_BUFFER_SIZE,
+    InMemoryBackplane,
+    UnixSocketBackplane,
+)
+from jupyterlab_chat.chat_manager import ChatManager
+from jupyterlab_chat.models import Message, NewMessage, User
+
+if TYPE_CHECKING:
+    from jupyter_server.serverapp import ServerApp
+
+
+class _FakeHandler:
+    def __init__(self):
+        self.frames: List[dict] = []
+
+    def write_message(self, message):
+        self.frames.append(json.loads(message))
+
+
+def _make_manager(tmp_path: Path, **config) -> ChatManager:
+    settings = {"server_root_dir": str(tmp_path)}
+    serverapp = cast(
+        "ServerApp", SimpleNamespace(web_app=SimpleNamespace(settings=settings))
+    )
+    return ChatManager(serverapp, rtc_enabled=False, start_poller=False, **config)
+
+
+@pytest.fixture
+def managers(tmp_path: Path):
+    """Two managers relaying to each other, as two server processes: the first
+    one persists the chats."""
+    owner = _make_manager(tmp_path, backplane_class=InMemoryBackplane)
+    worker = _make_manager(
+        tmp_path, backplane_class=InMemoryBackplane, persist_chats=False
+    )
+    yield owner, worker
+    owner.stop()
+    worker.stop()
+
+
+def _saved(tmp_path: Path) -> dict:
+    return json.loads((tmp_path / "chat.chat").read_text())
+
+
+def test_changes_are_relayed_and_persisted_once(tmp_path: Path, managers) -> None:
+    owner, worker = managers
+    model = worker.ws_open("chat.chat")
+    model.set_user(User(username="alice"))
+    msg_id = model.add_message(NewMessage(body="hello", sender="alice"))
+
+    # The owner opened the chat to persist it, with the id of the worker.
+    relayed = owner.get(model.get_id())
+    assert relayed is not None
+    assert [m.body for m in relayed.get_messages()] == ["hello"]
+    saved = _saved(tmp_path)
+    assert saved["metadata"]["id"] == model.get_id()
+    assert [m["id"] for m in saved["messages"]] == [msg_id]
+    assert "alice" in saved["users"]
+
+    # The changes made by the owner reach the clients of the worker.
+    client = _FakeHandler()
+    worker.ws_subscribe(model, "client", client)
+    relayed.update_message(Message(id=msg_id, body="edited", time=0, sender="alice"))
+    assert model.get_message(msg_id).body == "edited"  # type: ignore[union-attr]
+    assert client.frames[-1]["message"]["body"] == "edited"
+    assert _saved(tmp_path)["messages"][0]["body"] == "edited"
+
+
+def test_only_the_owner_writes(tmp_path: Path, managers) -> None:
+    owner, worker = managers
+    owner.backplane.close()
+    model = worker.ws_open("chat.chat")
+    model.add_message(NewMessage(body="hello", sender="alice"))
+    assert not (tmp_path / "chat.chat").exists()
+
+
+async def test_unix_socket_backplane(tmp_path: Path) -> None:
+    socket_path = str(tmp_path / "bp.sock")
+    first = UnixSocketBackplane(socket_path=socket_path, start_broker=True)
+    second = UnixSocketBackplane(socket_path=socket_path, reconnect_interval_s=0.05)
+    received: List[tuple] = []
+
+    async def wait_for(condition) -> None:
+        for _ in range(100):
+            if condition():
+                return
+            await asyncio.sleep(0.02)
+
+    try:
+        first.subscribe(ALL_CHATS, lambda data: received.append(("first", data)))
+        await wait_for(lambda: first._writer is not None)
+        # Published before the connection to the broker: sent once connected.
+        second.publish("chat-b", {"n": 1})
+        second.subscribe("chat-a", lambda data: received.append(("second", data)))
+        await wait_for(lambda: received)
+        first.publish("chat-a", {"n": 2})
+        first.publish("chat-c", {"n": 3})
+        await wait_for(lambda: len(received) == 2)
+        await asyncio.sleep(0.05)
+        assert received == [("first", {"n": 1}), ("second", {"n": 2})]
+    finally:
+        first.close()
+        second.close()
+
+
+async def test_unix_socket_backplane_waits_for_a_slow_broker(tmp_path: Path) -> None:
+    backplane = UnixSocketBackplane(socket_path=str(tmp_path / "bp.sock"))
+    # Connected to a broker that does not read.
+    backplane._task = asyncio.ensure_future(asyncio.sleep(3600))
+    buffered = [MAX_WRITE_BUFFER_SIZE]
+    drained = asyncio.Event()
+    written: List[dict] = []
+
+    async def drain() -> None:
+        await drained.wait()
+        buffered[0] = 0
+
+    backplane._writer = cast(Any, SimpleNamespace(
+        transport=SimpleNamespace(get_write_buffer_size=lambda: buffered[0]),
+        write=lambda frame: written.append(json.loads(frame)["data"]),
+        drain=drain,
+    ))
+    try:
+        backplane.publish("chat", {"n": 1})
+        backplane.publish("chat", {"n": 2})
+        await asyncio.sleep(0)
+        # Nothing more is buffered until the broker catches up.
+        assert written == [] and len(backplane._pending) == 2
+        drained.set()
+        for _ in range(10):
+            await asyncio.sleep(0)
+        assert written == [{"n": 1}, {"n": 2}]
+        backplane.publish("chat", {"n": 3})
+        assert written[-1] == {"n": 3}
+    finally:
+        backplane._writer = None
+        backplane.close()
+
+
+async def test_unix_socket_backplane_without_broker(tmp_path: Path, caplog) -> None:
+    (tmp_path / "file").write_text("")
+    backplane = UnixSocketBackplane(
+        socket_path=str(tmp_path / "file" / "bp.sock"),
+        start_broker=True,
+        reconnect_interval_s=0.05,
+        log=logging.getLogger("test_backplane"),
+    )
+    try:
+        backplane.subscribe("chat", lambda data: None)
+        await asyncio.sleep(0.1)
+        # The failure is logged, and the backplane keeps trying to connect.
+        errors = [r for r in caplog.records if r.levelno == logging.ERROR]
+        assert len(errors) == 1 and "Could not start" in errors[0].getMessage()
+        assert backplane._task is not None and not backplane._task.done()
+    finally:
+        backplane.close()
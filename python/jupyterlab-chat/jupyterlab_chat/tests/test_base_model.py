@@ -0,0 +1,157 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the default implementations of ``BaseChatModel``, on a model
+implementing only its abstract methods."""
+import time
+import uuid
+from typing import Any, List, Optional
+
+import pytest
+
+from jupyterlab_chat.models import (
+    BaseChatModel,
+    ChatMessageAction,
+    ChatMessageEvent,
+    Message,
+    MessageFilter,
+    MessageObserver,
+    NewMessage,
+    User,
+)
+
+
+class MinimalChat(BaseChatModel):
+    """A chat kept in memory, as a third-party model could implement it."""
+
+    def __init__(self):
+        self.messages: List[Message] = []
+        self.users: dict = {}
+        self.metadata: dict = {}
+        self.observers: List[tuple] = []
+
+    def get_id(self) -> str:
+        return "minimal"
+
+    def get_path(self) -> str:
+        return "minimal.chat"
+
+    def get_message(self, id):
+        return next((m for m in self.messages if m.id == id), None)
+
+    def get_messages(self):
+        return list(self.messages)
+
+    def get_users(self):
+        return dict(self.users)
+
+    def get_metadata(self):
+        return dict(self.metadata)
+
+    def get_attachments(self):
+        return {}
+
+    def add_message(self, new_message, trigger_actions=None):
+        message = Message(
+            id=str(uuid.uuid4()),
+            body=new_message.body,
+            time=time.time(),
+            sender=new_message.sender,
+        )
+        self.messages.append(message)
+        self._emit(ChatMessageAction.SERVER_MSG_SENT, message)
+        return message.id
+
+    def update_message(self, update, append=False, trigger_actions=None):
+        message = self.get_message(update.id)
+        if message is not None:
+            message.body = message.body + update.body if append else update.body
+            self._emit(ChatMessageAction.SERVER_MSG_UPDATED, message)
+
+    def set_attachment(self, attachment):
+        raise NotImplementedError
+
+    def set_user(self, user):
+        self.users[user.username] = user
+
+    def set_metadata(self, name, metadata):
+        self.metadata[name] = metadata
+
+    def observe_messages(
+        self, callback, *, filter=None, asynchronous=False, maxsize=1000, overflow=None
+    ):
+        entry = (callback, filter)
+        self.observers.append(entry)
+        return MessageObserver(_handle=entry)
+
+    def unobserve_messages(self, observer):
+        self.observers.remove(observer._handle)
+
+    def broadcast_writing_status(self, user: User, status: Optional[dict] = None) -> None:
+        pass
+
+    def _emit(self, action: ChatMessageAction, message: Message) -> None:
+        for callback, filter in list(self.observers):
+            if filter is None or filter.actions is None or action in filter.actions:
+                callback(ChatMessageEvent(action=action, message=message))
+
+
+def test_batch_and_batch_observers() -> None:
+    chat = MinimalChat()
+    batches: List[List[Any]] = []
+    observer = chat.observe_message_batches(
+        lambda events: batches.append([e.message.body for e in events]),
+        filter=MessageFilter(actions=[ChatMessageAction.SERVER_MSG_SENT]),
+    )
+
+    # Without grouping, each change is its own batch.
+    with chat.batch():
+        msg_id = chat.add_message(NewMessage(body="a", sender="bot"))
+        chat.update_message(Message(id=msg_id, body="b", time=0, sender="bot"), append=True)
+        chat.add_message(NewMessage(body="c", sender="bot"))
+    chat.unobserve_messages(observer)
+    chat.add_message(NewMessage(body="d", sender="bot"))
+
+    assert batches == [["a"], ["c"]]
+
+
+def test_import_messages_is_not_supported() -> None:
+    chat = MinimalChat()
+    with pytest.raises(NotImplementedError):
+        chat.import_messages([Message(id="m", body="old", time=1.0, sender="a")])
+
+
+def test_archive_messages_archives_nothing() -> None:
+    chat = MinimalChat()
+    chat.add_message(NewMessage(body="kept", sender="a"))
+    assert chat.archive_messages(1) == 0
+    assert len(chat.get_messages()) == 1
+
+
+def test_version_and_read_messages() -> None:
+    chat = MinimalChat()
+    first = chat.add_message(NewMessage(body="first", sender="a"))
+    chat.messages[0].time = 10.0
+    version = chat.get_version()
+    assert chat.get_version() == version
+
+    second = chat.add_message(NewMessage(body="second", sender="a"))
+    chat.messages[1].time = 20.0
+    assert chat.get_version() != version
+    version = chat.get_version()
+    chat.set_user(User(username="a"))
+    assert chat.get_version() != version
+
+    assert [m["id"] for m in chat.read_messages()] == [first, second]
+    assert [m["id"] for m in chat.read_messages(since=10.0)] == [second]
+    assert [m["id"] for m in chat.read_messages(limit=1)] == [first]
+
+
+async def test_message_stream() -> None:
+    chat = MinimalChat()
+    async with chat.message_stream(lambda e: e.message.sender != "me") as stream:
+        chat.add_message(NewMessage(body="mine", sender="me"))
+        chat.add_message(NewMessage(body="theirs", sender="them"))
+        event = await stream.__anext__()
+        assert event.message.body == "theirs"
+    # Closing the stream releases its observer.
+    assert chat.observers == []
@@ -0,0 +1,194 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for ``BaseChatModel.batch()`` on both backends."""
+import asyncio
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from jupyterlab_chat.models import (
+    ChatMessageAction,
+    ChatMessageEvent,
+    FileAttachment,
+    NewMessage,
+    User,
+)
+from jupyterlab_chat.websocket_model import WsChatModel
+from jupyterlab_chat.ychat import YChat
+
+PERSONA = User(username="persona", name="Persona", display_name="Persona", bot=True)
+
+
+def _persona_turn(model) -> str:
+    """What a persona typically does when it replies: register itself, attach
+    files, tag the chat, post a reply and then edit it."""
+    model.set_user(PERSONA)
+    attachments = [
+        model.set_attachment(FileAttachment(value="a.py")),
+        model.set_attachment(FileAttachment(value="b.py")),
+    ]
+    model.set_metadata("persona", "busy")
+    msg_id = model.add_message(NewMessage(body="Thinking", sender="persona"), [])
+    reply = model.get_message(msg_id)
+    assert reply is not None
+    reply.body = "Done"
+    reply.attachments = attachments
+    model.update_message(reply)
+    return msg_id
+
+
+# --------------------------------------------------------------------------
+# WebSocket model
+# --------------------------------------------------------------------------
+def _ws_model(tmp_path: Path, monkeypatch) -> tuple:
+    (tmp_path / "chat.chat").write_text("{}")
+    model = WsChatModel(path="chat.chat", root_dir=tmp_path)
+    model.load_from_file()
+    frames: List[dict] = []
+    model.handlers["client"] = SimpleNamespace(  # type: ignore[assignment]
+        write_message=lambda frame: frames.append(json.loads(frame))
+    )
+    saves: List[int] = []
+    save = model.save
+
+    def counted_save() -> None:
+        saves.append(1)
+        save()
+
+    monkeypatch.setattr(model, "save", counted_save)
+    return model, frames, saves
+
+
+def test_ws_batch_commits_once(tmp_path: Path, monkeypatch) -> None:
+    model, frames, saves = _ws_model(tmp_path, monkeypatch)
+    events: List[ChatMessageEvent] = []
+    model.observe_messages(events.append)
+
+    with model.batch():
+        msg_id = _persona_turn(model)
+        # Nothing is written, sent or notified before the batch commits...
+        assert saves == [] and frames == [] and events == []
+        # ...but the in-memory state is already up to date.
+        assert model.get_message(msg_id).body == "Done"  # type: ignore[union-attr]
+
+    assert len(saves) == 1
+    # The reply is sent once, in its final state, with resolved attachments.
+    assert len(frames) == 1
+    assert frames[0]["type"] == "msg"
+    assert frames[0]["message"]["body"] == "Done"
+    assert [a["value"] for a in frames[0]["message"]["attachments"]] == ["a.py", "b.py"]
+    assert [e.action for e in events] == [
+        ChatMessageAction.SERVER_MSG_SENT,
+        ChatMessageAction.SERVER_MSG_UPDATED,
+    ]
+
+    saved = json.loads((tmp_path / "chat.chat").read_text())
+    assert saved["metadata"]["persona"] == "busy"
+    assert "persona" in saved["users"]
+    assert len(saved["attachments"]) == 2
+
+
+def test_ws_batch_combines_frames(tmp_path: Path, monkeypatch) -> None:
+    model, frames, saves = _ws_model(tmp_path, monkeypatch)
+
+    with model.batch():
+        with model.batch():  # nested batches commit with the outermost one
+            model.add_message(NewMessage(body="1", sender="persona"), [])
+        assert frames == []
+        model.add_message(NewMessage(body="2", sender="persona"), [])
+
+    assert len(saves) == 1
+    assert len(frames) == 1
+    assert frames[0]["type"] == "batch"
+    assert [f["message"]["body"] for f in frames[0]["frames"]] == ["1", "2"]
+
+
+def test_ws_batch_observers_receive_one_list(tmp_path: Path, monkeypatch) -> None:
+    model, _, _ = _ws_model(tmp_path, monkeypatch)
+    batches: List[List[ChatMessageEvent]] = []
+    observer = model.observe_message_batches(batches.append)
+
+    with model.batch():
+        _persona_turn(model)
+    model.add_message(NewMessage(body="alone", sender="persona"), [])
+
+    assert [[e.action for e in batch] for batch in batches] == [
+        [ChatMessageAction.SERVER_MSG_SENT, ChatMessageAction.SERVER_MSG_UPDATED],
+        [ChatMessageAction.SERVER_MSG_SENT],
+    ]
+    model.unobserve_messages(observer)
+    model.add_message(NewMessage(body="unobserved", sender="persona"), [])
+    assert len(batches) == 2
+
+
+def test_ws_batch_commits_on_error(tmp_path: Path, monkeypatch) -> None:
+    model, frames, saves = _ws_model(tmp_path, monkeypatch)
+
+    with pytest.raises(RuntimeError):
+        with model.batch():
+            model.add_message(NewMessage(body="kept", sender="persona"), [])
+            raise RuntimeError("persona failed")
+
+    assert len(saves) == 1
+    assert [f["message"]["body"] for f in frames] == ["kept"]
+
+
+def test_ws_metadata_only_batch_is_saved(tmp_path: Path, monkeypatch) -> None:
+    model, frames, saves = _ws_model(tmp_path, monkeypatch)
+
+    model.set_metadata("outside", True)
+    assert saves == []
+    with model.batch():
+        model.set_metadata("inside", True)
+
+    assert len(saves) == 1
+    assert frames == []
+
+
+# --------------------------------------------------------------------------
+# Collaborative model (YChat)
+# --------------------------------------------------------------------------
+@pytest.mark.asyncio
+async def test_ychat_batch_is_one_transaction() -> None:
+    chat = YChat()
+    chat.set_id("test-chat")
+    chat.dirty = False
+    events: List[ChatMessageEvent] = []
+    chat.observe_messages(events.append)
+    updates: list = []
+    chat.ydoc.observe(updates.append)
+
+    with chat.batch():
+        msg_id = _persona_turn(chat)
+        assert updates == [] and events == []
+
+    assert len(updates) == 1
+    assert [e.action for e in events] == [ChatMessageAction.SERVER_MSG_SENT]
+    assert events[0].message.body == "Done"
+    assert chat.get_message(msg_id).body == "Done"  # type: ignore[union-attr]
+    assert chat.get_metadata()["persona"] == "busy"
+    assert len(chat.get_attachments()) == 2
+    await asyncio.sleep(0)
+
+
+@pytest.mark.asyncio
+async def test_ychat_batch_observers_receive_one_list() -> None:
+    chat = YChat()
+    chat.set_id("test-chat")
+    chat.dirty = False
+    chat.set_user(PERSONA)
+    batches: List[List[ChatMessageEvent]] = []
+    chat.observe_message_batches(batches.append)
+
+    with chat.batch():
+        first = chat.add_message(NewMessage(body="1", sender="persona"), [])
+        second = chat.add_message(NewMessage(body="2", sender="persona"), [])
+        # Both messages are indexed within the batch.
+        assert chat.get_message(first).body == "1"  # type: ignore[union-attr]
+        assert chat.get_message(second).body == "2"  # type: ignore[union-attr]
+
+    assert [[e.message.body for e in batch] for batch in batches] == [["1", "2"]]
+    await asyncio.sleep(0)
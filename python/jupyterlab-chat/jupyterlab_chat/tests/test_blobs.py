@@ -0,0 +1,102 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the offloading of large mime models to blobs."""
+import json
+from dataclasses import asdict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from tornado.httpclient import HTTPClientError
+
+from jupyterlab_chat import blobs
+from jupyterlab_chat.blobs import BLOB_KEY, BLOBS_DIR
+from jupyterlab_chat.models import Message, MimeModel, NewMessage
+from jupyterlab_chat.websocket_model import WsChatModel
+
+#: A mime model larger than the threshold of the tests.
+LARGE = {"data": {"image/png": "A" * 5000}, "metadata": {}}
+
+
+def test_large_mime_models_are_offloaded(tmp_path: Path) -> None:
+    model = WsChatModel(path="chat.chat", root_dir=tmp_path, blob_min_size=1000)
+    model.load_from_file()
+    frames: List[dict] = []
+    model.handlers["client"] = SimpleNamespace(  # type: ignore[assignment]
+        write_message=lambda frame: frames.append(json.loads(frame))
+    )
+    first = model.add_message(NewMessage(body="plot", sender="a", mime_model=LARGE))  # type: ignore[arg-type]
+    model.add_message(NewMessage(body="same plot", sender="a", mime_model=LARGE))  # type: ignore[arg-type]
+    small = {"data": {"text/plain": "ok"}}
+    model.add_message(NewMessage(body="text", sender="a", mime_model=small))  # type: ignore[arg-type]
+
+    # Stored once, and referenced from the file and the frames.
+    blobs = list((tmp_path / BLOBS_DIR).iterdir())
+    assert len(blobs) == 1
+    digest = blobs[0].name
+    saved = json.loads((tmp_path / "chat.chat").read_text())
+    assert [m["mime_model"] for m in saved["messages"]] == [
+        {BLOB_KEY: digest, "size": blobs[0].stat().st_size},
+        {BLOB_KEY: digest, "size": blobs[0].stat().st_size},
+        small,
+    ]
+    assert frames[0]["message"]["mime_model"][BLOB_KEY] == digest
+    # Server-side consumers read the mime model itself.
+    assert model.get_message(first).mime_model == LARGE  # type: ignore[union-attr]
+    model.update_message(Message(id=first, body="edited", time=0, sender="a"))
+    assert model.get_messages()[0].mime_model == LARGE
+
+    reloaded = WsChatModel(path="chat.chat", root_dir=tmp_path, blob_min_size=1000)
+    reloaded.load_from_file()
+    assert reloaded.get_messages()[1].mime_model == LARGE
+
+
+def test_blob_cache_is_bounded_by_size(tmp_path: Path, monkeypatch) -> None:
+    monkeypatch.setattr(blobs, "CACHE_MAX_SIZE", 10)
+    cache = blobs._BlobCache()
+    for name, data in (("a", b"12345"), ("b", b"123456"), ("c", b"x" * 11)):
+        (tmp_path / name).write_bytes(data)
+        assert cache.read(tmp_path / name) == data
+    # "a" is evicted to make room for "b", and "c" is too large to be kept.
+    assert list(cache._blobs) == [tmp_path / "b"]
+
+
+# --------------------------------------------------------------------------
+# REST endpoint
+# --------------------------------------------------------------------------
+@pytest.fixture
+def jp_server_config():
+    return {
+        "ServerApp": {"jpserver_extensions": {"jupyterlab_chat": True}},
+        "ChatManager": {"blob_min_size": 1000},
+    }
+
+
+async def test_blob_endpoint(jp_fetch, jp_serverapp) -> None:
+    manager = jp_serverapp.web_app.settings["chat_manager"]
+    model = await manager.create("chat.chat")
+    mime_model = MimeModel(data=LARGE["data"], metadata={}, trusted=True)
+    msg_id = model.add_message(NewMessage(body="plot", sender="a", mime_model=mime_model))
+    digest = model._messages[model._indexes_by_id[msg_id]]["mime_model"][BLOB_KEY]
+
+    response = await jp_fetch(
+        "api", "jupyter-chat", "blobs", digest, params={"path": "chat.chat"}
+    )
+    assert json.loads(response.body) == asdict(mime_model)
+    assert response.headers["ETag"] == f'"{digest}"'
+    assert "immutable" in response.headers["Cache-Control"]
+
+    response = await jp_fetch(
+        "api", "jupyter-chat", "blobs", digest,
+        params={"path": "chat.chat"},
+        headers={"If-None-Match": f'"{digest}"'},
+        raise_error=False,
+    )
+    assert response.code == 304
+
+    with pytest.raises(HTTPClientError) as e:
+        await jp_fetch(
+            "api", "jupyter-chat", "blobs", "0" * 64, params={"path": "chat.chat"}
+        )
+    assert e.value.code == 404
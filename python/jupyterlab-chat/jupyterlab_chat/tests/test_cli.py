@@ -0,0 +1,178 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the chat file format and the ``jupyter chat`` command."""
+import io
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List
+
+import jupyterlab_chat
+from jupyterlab_chat import chat_file
+from jupyterlab_chat.cli import archive_file
+from jupyterlab_chat.models import NewMessage
+from jupyterlab_chat.websocket_model import WsChatModel
+
+#: Runs the command with this copy of the package, from any directory.
+ENV = {
+    **os.environ,
+    "PYTHONPATH": os.pathsep.join(
+        [str(Path(jupyterlab_chat.__file__).parents[1]), os.environ.get("PYTHONPATH", "")]
+    ),
+}
+
+
+def _chat(**overrides) -> dict:
+    content = {
+        "messages": [
+            {"id": "m1", "body": "hello @bob", "time": 1.0, "sender": "alice", "mentions": ["bob"]},
+            {
+                "id": "m2",
+                "body": "see attached",
+                "time": 2.0,
+                "sender": "alice",
+                "attachments": ["a1"],
+                "deleted": True,
+            },
+        ],
+        "users": {
+            "alice": {"username": "alice"},
+            "bob": {"username": "bob"},
+            "carol": {"username": "carol"},
+        },
+        "attachments": {"a1": {"type": "file", "value": "data.csv"}},
+        "metadata": {"id": "chat-id"},
+    }
+    content.update(overrides)
+    return content
+
+
+def _run(*args: str, cwd: Path) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-m", "jupyterlab_chat.cli", *args],
+        cwd=cwd,
+        env=ENV,
+        capture_output=True,
+        text=True,
+    )
+
+
+def test_validate_reports_problems() -> None:
+    assert chat_file.validate(_chat()) == []
+    assert chat_file.validate({}) == []
+    messages = [
+        {"id": "m1", "body": "", "time": 2.0, "sender": "a"},
+        {"id": "m1", "body": "", "time": 1.0, "sender": "a", "colour": "red"},
+        {"id": "m3", "body": "", "sender": "a", "attachments": ["missing"]},
+    ]
+    problems = chat_file.validate(_chat(messages=messages))
+    assert problems == [
+        "message 1 has unknown fields ['colour']",
+        "message 1 has a duplicate id 'm1'",
+        "message 1 is out of time order",
+        "message 2 has no valid 'time'",
+        "message 2 refers to a missing attachment 'missing'",
+    ]
+    assert chat_file.validate({"users": []}) == ["'users' is not a JSON dict"]
+
+
+def test_validate_reports_wrong_types() -> None:
+    messages = [
+        {"id": ["m1"], "body": "", "time": 1.0, "sender": "a"},
+        {"id": {"m": 2}, "body": "", "time": 2.0, "sender": "a", "attachments": "abc"},
+        {"id": "m3", "body": "", "time": 3.0, "sender": "a", "mentions": None},
+        {"id": "m4", "body": "", "time": 4.0, "sender": "a", "attachments": None},
+    ]
+    assert chat_file.validate(_chat(messages=messages)) == [
+        "message 0 has no valid 'id'",
+        "message 1 has no valid 'id'",
+        "message 1 has no valid 'attachments'",
+        "message 2 has no valid 'mentions'",
+    ]
+
+
+def test_compact_removes_unneeded_content() -> None:
+    content = _chat()
+    assert chat_file.compact(content) == {"deleted_bodies": 1, "attachments": 1, "users": 1}
+    deleted = content["messages"][1]
+    assert deleted["body"] == "" and "attachments" not in deleted
+    assert content["attachments"] == {}
+    # The mentioned user is kept.
+    assert sorted(content["users"]) == ["alice", "bob"]
+    assert chat_file.compact(content) == {"deleted_bodies": 0, "attachments": 0, "users": 0}
+
+
+def test_normalize_round_trip() -> None:
+    content = {"metadata": {"id": "x"}, "extra": 1, "messages": []}
+    normalized = chat_file.normalize(content)
+    assert list(normalized) == [*chat_file.CHAT_FILE_KEYS, "extra"]
+    assert json.loads(chat_file.dumps(normalized)) == normalized
+
+
+def test_export_messages() -> None:
+    out = io.StringIO()
+    assert chat_file.export_messages(_chat(), out) == 2
+    lines = out.getvalue().splitlines()
+    assert [json.loads(line)["id"] for line in lines] == ["m1", "m2"]
+
+
+def test_cli_maintenance(tmp_path: Path) -> None:
+    files: List[Path] = []
+    for i in range(4):
+        path = tmp_path / "shared" / f"chat-{i}.chat"
+        path.parent.mkdir(exist_ok=True)
+        path.write_text(json.dumps(_chat()))
+        files.append(path)
+    broken = tmp_path / "shared" / "hidden" / "broken.chat"
+    broken.parent.mkdir()
+    broken.write_text("[]")
+
+    result = _run("validate", "shared", "--jobs=2", cwd=tmp_path)
+    assert result.returncode == 1
+    assert "broken.chat: a chat file must contain a JSON object" in result.stdout
+
+    result = _run("format", "--check", *map(str, files), cwd=tmp_path)
+    assert result.returncode == 1
+    assert result.stdout.count("would be reformatted") == 4
+
+    result = _run("compact", "--dry-run", str(files[0]), cwd=tmp_path)
+    assert result.returncode == 0
+    assert "would remove 1 deleted-message bodies" in result.stdout
+    assert json.loads(files[0].read_text()) == _chat()
+
+    result = _run("compact", "--jobs=2", *map(str, files), cwd=tmp_path)
+    assert result.returncode == 0, result.stderr
+    for path in files:
+        content = chat_file.load(path)
+        assert content["attachments"] == {}
+        assert path.read_text() == chat_file.dumps(chat_file.normalize(content))
+    assert _run("format", "--check", *map(str, files), cwd=tmp_path).returncode == 0
+
+    result = _run("archive", "--keep=1", str(files[0]), cwd=tmp_path)
+    assert result.returncode == 0, result.stderr
+    assert "archived 1 messages" in result.stdout
+    assert [m["id"] for m in chat_file.load(files[0])["messages"]] == ["m2"]
+
+    # The export includes the archived messages.
+    result = _run("export", str(files[0]), "--output=out.ndjson", cwd=tmp_path)
+    assert result.returncode == 0, result.stderr
+    exported = (tmp_path / "out.ndjson").read_text().splitlines()
+    assert [json.loads(line)["id"] for line in exported] == ["m1", "m2"]
+
+
+def test_rewrite_of_an_open_chat_is_merged(tmp_path: Path) -> None:
+    path = tmp_path / "open.chat"
+    path.write_text(json.dumps(_chat()))
+    model = WsChatModel(path="open.chat", root_dir=tmp_path)
+    model.load_from_file()
+
+    assert archive_file(path, keep=1) == (False, ["archived 1 messages"])
+    model.add_message(NewMessage(body="after", sender="alice"))
+
+    # The server merged the archiving rather than overwriting it.
+    content = chat_file.load(path)
+    assert [m["id"] for m in content["messages"]][:1] == ["m2"]
+    assert content["messages"][-1]["body"] == "after"
+    assert content[chat_file.SEGMENTS_KEY][0]["count"] == 1
@@ -8,10 +8,11 @@ from types import SimpleNamespace
 from typing import TYPE_CHECKING, cast
 
 import jupyter_server
+import pytest
 from jupyter_events import EventLogger
 
 from jupyterlab_chat.chat_manager import ChatManager
-from jupyterlab_chat.models import NewMessage
+from jupyterlab_chat.models import ChatMessageAction, MessageFilter, NewMessage
 from jupyterlab_chat.websocket_model import WsChatModel
 
 if TYPE_CHECKING:
@@ -252,3 +253,69 @@ def test_client_connected_and_disconnected_events(tmp_path):
         ]
 
     asyncio.run(run())
+
+
+def test_observe_all_messages(tmp_path):
+    """The observer of all the chats follows the chats going live and being
+    freed, and tags the events with their chat id."""
+
+    async def run():
+        mgr = _make_manager(tmp_path, [])
+        (tmp_path / "a.chat").write_text("{}")
+        (tmp_path / "b.chat").write_text("{}")
+        received: list = []
+
+        async def callback(event):
+            received.append((event.chat_id, event.message.body))
+
+        a = mgr.ws_open("a.chat")
+        observer = mgr.observe_all_messages(
+            callback, MessageFilter(actions=[ChatMessageAction.SERVER_MSG_SENT])
+        )
+        b = mgr.ws_open("b.chat")
+        a.add_message(NewMessage(body="in a", sender="bot"))
+        msg_id = b.add_message(NewMessage(body="in b", sender="bot"))
+        b.update_message(b.get_message(msg_id), append=True)
+        await mgr.wait_for_observers(b)
+        await _drain()
+        assert received == [(a.get_id(), "in a"), (b.get_id(), "in b")]
+
+        # Freed chats are detached, reopened ones attached again.
+        mgr.ws_client_gone(a.get_id())
+        assert list(observer._chats) == [b.get_id()]
+        a = mgr.ws_open("a.chat")
+        a.add_message(NewMessage(body="reopened", sender="bot"))
+        await _drain()
+        assert received[-1] == (a.get_id(), "reopened")
+
+        mgr.unobserve_all_messages(observer)
+        assert not a._message_observers and not b._message_observers
+        mgr.stop()
+
+    asyncio.run(run())
+
+
+def test_wait_for_chat(tmp_path):
+    """Waiters for a chat, by path, share a future resolved when the chat goes
+    live; a live chat is returned at once, by path or id."""
+
+    async def run():
+        mgr = _make_manager(tmp_path, [])
+        (tmp_path / "w.chat").write_text("{}")
+
+        first = asyncio.ensure_future(mgr.wait_for_chat("w.chat", timeout=5))
+        second = asyncio.ensure_future(mgr.wait_for_chat("w.chat"))
+        await asyncio.sleep(0)
+        assert len(mgr._chat_waiters) == 1 and not first.done()
+
+        model = mgr.ws_open("w.chat")
+        assert await first is model and await second is model
+        assert await mgr.wait_for_chat(model.get_id()) is model
+        assert mgr._chat_waiters == {}
+
+        with pytest.raises(asyncio.TimeoutError):
+            await mgr.wait_for_chat("missing.chat", timeout=0.01)
+        assert mgr._chat_waiters == {}
+        mgr.stop()
+
+    asyncio.run(run())
@@ -0,0 +1,181 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the bulk message import: ``BaseChatModel.import_messages`` and
+the ``POST /api/jupyter-chat/import`` endpoint."""
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+from tornado.httpclient import HTTPClientError
+
+from jupyterlab_chat.models import ChatMessageEvent, Message, NewMessage
+from jupyterlab_chat.websocket_model import WsChatModel
+from jupyterlab_chat.ychat import YChat
+
+
+def _history(*times: float) -> List[Message]:
+    return [
+        Message(id=f"old-{t}", body=f"at {t}", time=t, sender="someone")
+        for t in times
+    ]
+
+
+def test_ws_import_merges_in_time_order(tmp_path: Path) -> None:
+    (tmp_path / "chat.chat").write_text("{}")
+    model = WsChatModel(path="chat.chat", root_dir=tmp_path)
+    model.load_from_file()
+    model.import_messages(_history(10.0, 30.0))
+    frames: List[dict] = []
+    model.handlers["client"] = SimpleNamespace(  # type: ignore[assignment]
+        write_message=lambda frame: frames.append(json.loads(frame))
+    )
+    events: List[ChatMessageEvent] = []
+    model.observe_messages(events.append)
+
+    # Unsorted input, with a message that is already in the chat.
+    assert model.import_messages(_history(40.0, 20.0, 10.0, 5.0)) == 3
+
+    assert [m.time for m in model.get_messages()] == [5.0, 10.0, 20.0, 30.0, 40.0]
+    assert model.get_message("old-20.0").body == "at 20.0"  # type: ignore[union-attr]
+    # One notification of the live clients, and none of the observers.
+    assert len(frames) == 1 and frames[0]["type"] == "batch"
+    assert len(frames[0]["frames"]) == 3
+    assert events == []
+    saved = json.loads((tmp_path / "chat.chat").read_text())
+    assert [m["time"] for m in saved["messages"]] == [5.0, 10.0, 20.0, 30.0, 40.0]
+
+
+def test_ychat_import_is_one_transaction() -> None:
+    chat = YChat()
+    chat.set_id("test-chat")
+    chat.dirty = False
+    chat.import_messages(_history(10.0, 30.0))
+    events: List[ChatMessageEvent] = []
+    chat.observe_messages(events.append)
+    updates: list = []
+    chat.ydoc.observe(updates.append)
+
+    history = _history(40.0, 20.0, 10.0, 5.0)
+    assert chat.import_messages(history) == 3
+
+    assert len(updates) == 1
+    # The messages of the caller are left untouched.
+    assert all(m.raw_time is None for m in history)
+    messages = chat.get_messages()
+    assert [m.time for m in messages] == [5.0, 10.0, 20.0, 30.0, 40.0]
+    assert all(m.raw_time is False for m in messages)
+    assert chat.get_message("old-40.0").body == "at 40.0"  # type: ignore[union-attr]
+    assert events == []
+
+
+# --------------------------------------------------------------------------
+# REST endpoint
+# --------------------------------------------------------------------------
+@pytest.fixture
+def jp_server_config():
+    return {
+        "ServerApp": {"jpserver_extensions": {"jupyterlab_chat": True}},
+        "ChatManager": {"import_batch_size": 100},
+    }
+
+
+def _ndjson(messages: List[dict]) -> bytes:
+    return "".join(json.dumps(m) + "\n" for m in messages).encode()
+
+
+async def test_import_endpoint(jp_fetch, jp_root_dir, jp_serverapp, monkeypatch) -> None:
+    batches: List[int] = []
+    import_messages = WsChatModel.import_messages
+
+    def counted_import(self: WsChatModel, messages: List[Message]) -> int:
+        batches.append(len(messages))
+        return import_messages(self, messages)
+
+    monkeypatch.setattr(WsChatModel, "import_messages", counted_import)
+    lines = [
+        {"id": f"m{i}", "body": f"message {i}", "sender": "migrated", "time": 1000.0 - i}
+        for i in range(250)
+    ]
+    response = await jp_fetch(
+        "api", "jupyter-chat", "import",
+        method="POST",
+        params={"path": "imported.chat"},
+        body=_ndjson(lines),
+    )
+
+    assert json.loads(response.body) == {"received": 250, "imported": 250}
+    # The body arrives in a single chunk, still imported in batches.
+    assert batches == [100, 100, 50]
+    model = jp_serverapp.web_app.settings["chat_manager"]._model_for_path("imported.chat")
+    assert len(model.get_messages()) == 250
+    saved = json.loads((jp_root_dir / "imported.chat").read_text())
+    times = [m["time"] for m in saved["messages"]]
+    assert times == sorted(times)
+    assert saved["messages"][0]["sender"] == "migrated"
+
+    # Importing again is a no-op.
+    response = await jp_fetch(
+        "api", "jupyter-chat", "import",
+        method="POST",
+        params={"path": "imported.chat"},
+        body=_ndjson(lines),
+    )
+    assert json.loads(response.body) == {"received": 250, "imported": 0}
+
+
+async def test_import_endpoint_rejects_invalid_line(jp_fetch) -> None:
+    body = _ndjson([{"body": "ok", "sender": "a", "time": 1.0}]) + b'{"body": "no time"}\n'
+    with pytest.raises(HTTPClientError) as e:
+        await jp_fetch(
+            "api", "jupyter-chat", "import",
+            method="POST",
+            params={"path": "invalid.chat"},
+            body=body,
+        )
+    assert e.value.code == 400
+    assert e.value.response is not None
+    assert "line 2" in json.loads(e.value.response.body)["message"]
+
+
+async def test_import_endpoint_into_a_chat_not_open_under_rtc(
+    jp_fetch, jp_root_dir, jp_serverapp, monkeypatch
+) -> None:
+    chat_manager = jp_serverapp.web_app.settings["chat_manager"]
+    monkeypatch.setattr(chat_manager, "_rtc_enabled", True)
+    lines = [
+        {"id": f"m{i}", "body": f"message {i}", "sender": "migrated", "time": float(i)}
+        for i in range(150)
+    ]
+    response = await jp_fetch(
+        "api", "jupyter-chat", "import",
+        method="POST",
+        params={"path": "closed.chat"},
+        body=_ndjson(lines),
+    )
+
+    assert json.loads(response.body) == {"received": 150, "imported": 150}
+    # Written to the file, without making the chat live.
+    assert chat_manager._model_for_path("closed.chat") is None
+    saved = json.loads((jp_root_dir / "closed.chat").read_text())
+    assert len(saved["messages"]) == 150
+
+    # A room opening during an import stops it after the batches committed.
+    import_messages = WsChatModel.import_messages
+
+    def import_then_open(self: WsChatModel, messages: List[Message]) -> int:
+        chat_manager._opening_room_paths.add("opened.chat")
+        return import_messages(self, messages)
+
+    monkeypatch.setattr(WsChatModel, "import_messages", import_then_open)
+    with pytest.raises(HTTPClientError) as e:
+        await jp_fetch(
+            "api", "jupyter-chat", "import",
+            method="POST",
+            params={"path": "opened.chat"},
+            body=_ndjson(lines),
+        )
+    assert e.value.code == 409
+    saved = json.loads((jp_root_dir / "opened.chat").read_text())
+    assert len(saved["messages"]) == 100
@@ -23,3 +23,60 @@ def test_import_ychat_standalone():
     assert result.returncode == 0, (
         "Importing jupyterlab_chat.ychat failed:\n" + result.stderr
     )
+
+
+#: Cumulative import time budget of ``import jupyterlab_chat``, in microseconds.
+#: The package itself loads ``jupyter_ydoc`` (see its ``__init__``) and
+#: ``rtc_lib``, ~0.1-0.2s; loading the WebSocket stack adds 1-2s.
+IMPORT_TIME_BUDGET_US = 600_000
+
+#: Modules that belong to one transport and must not be loaded by the package
+#: import; ``_load_jupyter_server_extension`` imports them when that transport
+#: is picked.
+TRANSPORT_MODULES = (
+    "jupyterlab_chat.websocket_handler",
+    "jupyterlab_chat.websocket_model",
+    "jupyterlab_chat.chat_manager",
+    "jupyter_events",
+)
+
+
+def _importtime(statement: str) -> dict:
+    """Cumulative import time in microseconds of every module imported by
+    ``statement``, from ``python -X importtime`` in a fresh subprocess."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_package_import_is_transport_agnostic():
+    times = _importtime("import jupyterlab_chat")
+
+    loaded = [name for name in TRANSPORT_MODULES if name in times]
+    assert loaded == [], f"`import jupyterlab_chat` loaded {loaded}"
+    assert times["jupyterlab_chat"] < IMPORT_TIME_BUDGET_US, (
+        f"`import jupyterlab_chat` took {times['jupyterlab_chat'] / 1000:.0f}ms"
+    )
+
+
+def test_lazy_exports_still_resolve():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "from jupyterlab_chat import BaseChatModel, WSChatHandler",
+        ],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
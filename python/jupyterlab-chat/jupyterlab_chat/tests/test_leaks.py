@@ -0,0 +1,132 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Retained-memory regression tests for freed chat models.
+
+Opens and frees thousands of chats and asserts that nothing survives the free:
+no model instance (they must be garbage collected), no EventLogger listener,
+no message observer closure, and a flat traced-memory footprint. A leak here
+only shows up in production as a slowly growing RSS on long-running servers.
+"""
+import asyncio
+import gc
+import sys
+import tracemalloc
+import weakref
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Callable, Tuple, cast
+
+import jupyter_server
+from jupyter_events import EventLogger
+
+from jupyterlab_chat.chat_manager import ChatManager
+from jupyterlab_chat.models import NewMessage
+from jupyterlab_chat.websocket_model import CONTENTS_EVENT_SCHEMA_ID
+from jupyterlab_chat.ychat import YChat
+
+if TYPE_CHECKING:
+    from jupyter_server.serverapp import ServerApp
+
+#: Number of chats opened and freed per test.
+CYCLES = 1000
+
+#: Number of those cycles run under tracemalloc (which slows them down ~5x).
+TRACED_CYCLES = 250
+
+#: Chat files the cycles rotate over, so saves stay small. pathlib interns the
+#: path components: the names are interned (and kept alive) here so that the
+#: cycles never add or remove interned strings, which could resize the
+#: interpreter-wide interned-string table and count as retained memory.
+CHAT_FILES = [sys.intern(f"chat-{i}.chat") for i in range(10)]
+
+#: Traced memory the traced cycles may retain once warmed up (interpreter
+#: caches, free-list growth); leaking a model, or even a few hundred bytes per
+#: chat, exceeds it.
+RETAINED_BYTES_BUDGET = 64 * 1024
+
+
+def _event_logger() -> EventLogger:
+    logger = EventLogger()
+    logger.register_event_schema(
+        Path(jupyter_server.__file__).parent
+        / "event_schemas"
+        / "contents_service"
+        / "v1.yaml"
+    )
+    return logger
+
+
+def _contents_listeners(logger: EventLogger) -> int:
+    return len(logger._modified_listeners[CONTENTS_EVENT_SCHEMA_ID]) + len(
+        logger._unmodified_listeners[CONTENTS_EVENT_SCHEMA_ID]
+    )
+
+
+def _run_cycles(cycle: Callable[[int], weakref.ref]) -> Tuple[list, int]:
+    """Run ``cycle`` ``CYCLES`` times.
+
+    Returns the weak references to the models of the untraced cycles, and the
+    traced bytes still allocated after the last ``TRACED_CYCLES`` runs (whose
+    references are dropped, so as not to count them).
+    """
+    refs = [cycle(i) for i in range(CYCLES - TRACED_CYCLES)]  # also warms up
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        for i in range(CYCLES - TRACED_CYCLES, CYCLES):
+            cycle(i)
+        gc.collect()
+        return refs, tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+
+def test_freed_ws_chats_leave_no_residue(tmp_path: Path) -> None:
+    async def run():
+        logger = _event_logger()
+        settings = {"event_logger": logger, "server_root_dir": str(tmp_path)}
+        serverapp = cast(
+            "ServerApp", SimpleNamespace(web_app=SimpleNamespace(settings=settings))
+        )
+        mgr = ChatManager(serverapp, rtc_enabled=False, start_poller=False)
+        listeners = _contents_listeners(logger)
+
+        def cycle(i: int) -> weakref.ref:
+            model = mgr.ws_open(CHAT_FILES[i % len(CHAT_FILES)])
+            model.handlers["client"] = SimpleNamespace(  # type: ignore[assignment]
+                write_message=lambda frame: None
+            )
+            observer = model.observe_messages(lambda event: None)
+            model.add_message(NewMessage(body=f"message {i}", sender="agent"))
+            model.unobserve_messages(observer)
+            model.handlers.clear()
+            mgr.ws_client_gone(model.get_id())
+            return weakref.ref(model)
+
+        refs, retained = _run_cycles(cycle)
+
+        assert mgr._chats_by_id == {}
+        assert mgr._last_activity_by_id == {}
+        assert _contents_listeners(logger) == listeners
+        assert all(ref() is None for ref in refs)
+        assert retained < RETAINED_BYTES_BUDGET
+        mgr.stop()
+
+    asyncio.run(run())
+
+
+def test_unobserved_ychat_is_collected() -> None:
+    def cycle(i: int) -> weakref.ref:
+        chat = YChat()
+        chat.set_id(f"chat-{i}")
+        observer = chat.observe_messages(lambda event: None)
+        chat.add_message(NewMessage(body=f"message {i}", sender="agent"))
+        chat.unobserve_messages(observer)
+        chat.unobserve()
+        return weakref.ref(chat)
+
+    refs, retained = _run_cycles(cycle)
+
+    assert all(ref() is None for ref in refs)
+    assert retained < RETAINED_BYTES_BUDGET
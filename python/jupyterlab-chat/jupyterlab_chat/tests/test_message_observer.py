@@ -15,7 +15,10 @@ from pycrdt import Map
 from jupyterlab_chat.models import (
     ChatMessageAction,
     ChatMessageEvent,
+    Message,
+    MessageFilter,
     NewMessage,
+    OverflowPolicy,
     User,
 )
 from jupyterlab_chat.websocket_model import WsChatModel
@@ -112,6 +115,132 @@ def test_ws_observer_error_is_isolated(tmp_path: Path) -> None:
     assert len(good) == 1
 
 
+def test_ws_filtered_observers(tmp_path: Path) -> None:
+    model = _ws_model(tmp_path)
+    model.set_user(User(username="bot", bot=True))
+    new: List[str] = []
+    from_humans: List[str] = []
+    mentioning: List[str] = []
+    model.observe_messages(
+        lambda e: new.append(e.message.body),
+        filter=MessageFilter(
+            actions=[ChatMessageAction.SERVER_MSG_SENT], exclude_senders=["other"]
+        ),
+    )
+    model.observe_messages(
+        lambda e: from_humans.append(e.message.body), filter=MessageFilter(bot=False)
+    )
+    token = model.observe_messages(
+        lambda e: mentioning.append(e.message.body),
+        filter=MessageFilter(senders=["alice", "bot"], mentions="bot"),
+    )
+
+    streamed = model.add_message(NewMessage(body="", sender="bot"))
+    model.update_message(
+        Message(id=streamed, body="chunk", time=0, sender="bot"), append=True
+    )
+    model.add_message(NewMessage(body="by other", sender="other"))
+    message = Message(id="m", body="@bot", time=0, sender="alice", mentions=["bot"])
+    model._emit_message_event(ChatMessageAction.CLIENT_MSG_RECEIVED, message)
+
+    # A message without mentions, e.g. read with null mentions.
+    unmentioned = Message(
+        id="n", body="hi", time=0, sender="alice", mentions=None  # type: ignore[arg-type]
+    )
+    model._emit_message_event(ChatMessageAction.CLIENT_MSG_RECEIVED, unmentioned)
+
+    assert new == [""]
+    assert from_humans == ["by other", "@bot", "hi"]
+    assert mentioning == ["@bot"]
+    model.unobserve_messages(token)
+    assert len(model._message_observers) == 2
+
+
+@pytest.mark.asyncio
+async def test_ws_async_observer_does_not_delay_delivery(tmp_path: Path) -> None:
+    model = _ws_model(tmp_path)
+    release = asyncio.Event()
+    events: List[ChatMessageEvent] = []
+
+    async def slow(event: ChatMessageEvent) -> None:
+        await release.wait()
+        events.append(event)
+
+    token = model.observe_messages(slow, asynchronous=True)
+    model.add_message(NewMessage(body="1", sender="agent"))
+    model.add_message(NewMessage(body="2", sender="agent"))
+    # Handled (and saved) without waiting for the observer.
+    assert len(model.get_messages()) == 2 and events == []
+
+    release.set()
+    for _ in range(10):
+        await asyncio.sleep(0)
+    assert [e.message.body for e in events] == ["1", "2"]
+    model.unobserve_messages(token)
+
+
+@pytest.mark.asyncio
+async def test_ws_async_observer_overflow(tmp_path: Path) -> None:
+    model = _ws_model(tmp_path)
+    dropped: List[ChatMessageEvent] = []
+    coalesced: List[ChatMessageEvent] = []
+    blocked: List[ChatMessageEvent] = []
+    model.observe_messages(
+        dropped.append, asynchronous=True, maxsize=2, overflow=OverflowPolicy.DROP_OLDEST
+    )
+    model.observe_messages(
+        coalesced.append, asynchronous=True, maxsize=2, overflow=OverflowPolicy.COALESCE
+    )
+    blocking = model.observe_messages(blocked.append, asynchronous=True, maxsize=2)
+
+    streamed = model.add_message(NewMessage(body="", sender="agent"))
+    for chunk in "abc":
+        model.update_message(
+            Message(id=streamed, body=chunk, time=0, sender="agent"), append=True
+        )
+    model.add_message(NewMessage(body="next", sender="agent"))
+
+    # The full blocking queue holds back the clients until it is drained.
+    assert blocking._delivery.full
+    await asyncio.wait_for(model.wait_for_observers(), timeout=1)
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+    assert [e.message.body for e in dropped] == ["abc", "next"]
+    # The updates of the streamed message are delivered once, as its creation.
+    assert [(e.action, e.message.body) for e in coalesced] == [
+        (ChatMessageAction.SERVER_MSG_SENT, "abc"),
+        (ChatMessageAction.SERVER_MSG_SENT, "next"),
+    ]
+    assert len(blocked) == 5
+    model.dispose()
+
+
+@pytest.mark.asyncio
+async def test_ws_message_stream(tmp_path: Path) -> None:
+    model = _ws_model(tmp_path)
+    async with model.message_stream(
+        filter=lambda e: e.action == ChatMessageAction.SERVER_MSG_SENT, maxsize=1
+    ) as stream:
+        msg_id = model.add_message(NewMessage(body="1", sender="agent"))
+        # Filtered out, so it does not take room in the stream.
+        model.update_message(Message(id=msg_id, body="1", time=0, sender="agent"))
+        # A full stream holds back the clients until it is read.
+        waiting = asyncio.ensure_future(model.wait_for_observers())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        assert (await stream.__anext__()).message.body == "1"
+        await asyncio.wait_for(waiting, timeout=1)
+    # Closing the stream unregisters it.
+    assert not model._message_observers and model._async_observers == []
+
+    stream = model.message_stream()
+    model.add_message(NewMessage(body="2", sender="agent"))
+    model.dispose()
+    # Freeing the model ends the iteration.
+    assert [event async for event in stream] == []
+
+
 # --------------------------------------------------------------------------
 # Collaborative model (YChat)
 # --------------------------------------------------------------------------
@@ -167,3 +296,75 @@ async def test_ychat_timestamp_update_preserves_insert_event() -> None:
     assert len(events) == 1
     assert events[0].message.body == "from human"
     assert chat.get_messages()[0].raw_time is False
+
+
+@pytest.mark.asyncio
+async def test_ychat_message_stream() -> None:
+    chat = YChat()
+    chat.set_id("test-chat")
+    chat.dirty = False
+    stream = chat.message_stream()
+    _insert_ymessage(chat, {"id": "m1", "body": "first", "time": 1.0, "sender": "human"})
+    _insert_ymessage(chat, {"id": "m2", "body": "second", "time": 2.0, "sender": "human"})
+
+    received: List[str] = []
+    async for event in stream:
+        received.append(event.message.body)
+        if len(received) == 2:
+            await stream.aclose()
+    assert received == ["first", "second"]
+    _insert_ymessage(chat, {"id": "m3", "body": "after", "time": 3.0, "sender": "human"})
+    assert chat._async_observers == [] and not stream._pending
+
+
+def test_ychat_filtered_observers() -> None:
+    chat = YChat()
+    chat.set_id("test-chat")
+    chat.dirty = False
+    chat.set_user(User(username="bot", name="B", display_name="B", bot=True))
+    from_bots: List[str] = []
+    token = chat.observe_messages(
+        lambda e: from_bots.append(e.message.body),
+        filter=MessageFilter(actions=[ChatMessageAction.SERVER_MSG_SENT]),
+    )
+    _insert_ymessage(chat, {"id": "m1", "body": "human", "time": 1.0, "sender": "human"})
+    _insert_ymessage(chat, {"id": "m2", "body": "bot", "time": 2.0, "sender": "bot"})
+    assert from_bots == ["bot"]
+
+    # The messages array is only observed while there are observers.
+    chat.unobserve_messages(token)
+    assert chat._message_observers_subscription is None
+
+
+def test_ychat_edit_events_are_coalesced_per_transaction() -> None:
+    chat = YChat()
+    chat.set_id("test-chat")
+    chat.dirty = False
+    chat.set_user(User(username="bot", name="B", display_name="B", bot=True))
+    _insert_ymessage(chat, {"id": "m1", "body": "", "time": 1.0, "sender": "bot"})
+    _insert_ymessage(chat, {"id": "m2", "body": "hi", "time": 2.0, "sender": "human"})
+    events: List[ChatMessageEvent] = []
+    chat.observe_messages(events.append)
+
+    with chat.batch():
+        for chunk in "abc":
+            chat.update_message(
+                Message(id="m1", body=chunk, time=1.0, sender="bot"), append=True
+            )
+    chat.update_message(Message(id="m2", body="hello", time=2.0, sender="human"))
+    # The server timestamping of a message is not an edit.
+    chat._ymessages[1].update({"time": 3.0, "raw_time": False})
+
+    assert [(e.action, e.message.id, e.message.body) for e in events] == [
+        (ChatMessageAction.SERVER_MSG_UPDATED, "m1", "abc"),
+        (ChatMessageAction.CLIENT_MSG_EDITED, "m2", "hello"),
+    ]
+
+    # A message added and edited in one transaction is one new message.
+    events.clear()
+    with chat.batch():
+        _insert_ymessage(chat, {"id": "m3", "body": "", "time": 4.0, "sender": "bot"})
+        chat._ymessages[2]["body"] = "streamed"
+    assert [(e.action, e.message.body) for e in events] == [
+        (ChatMessageAction.SERVER_MSG_SENT, "streamed")
+    ]
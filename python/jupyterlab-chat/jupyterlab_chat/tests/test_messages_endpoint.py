@@ -0,0 +1,85 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the ``GET /api/jupyter-chat/messages`` snapshot endpoint."""
+import json
+
+import pytest
+from tornado.httpclient import HTTPClientError
+
+from jupyterlab_chat import chat_file
+from jupyterlab_chat.models import NewMessage
+
+
+@pytest.fixture
+def jp_server_config():
+    return {"ServerApp": {"jpserver_extensions": {"jupyterlab_chat": True}}}
+
+
+async def _get(jp_fetch, etag=None, **params):
+    headers = {"If-None-Match": etag} if etag else {}
+    return await jp_fetch(
+        "api", "jupyter-chat", "messages",
+        params=params,
+        headers=headers,
+        raise_error=False,
+    )
+
+
+async def test_snapshot_of_a_chat_file(jp_fetch, jp_root_dir) -> None:
+    messages = [
+        {"id": f"m{i}", "body": str(i), "time": float(i), "sender": "a"} for i in range(5)
+    ]
+    (jp_root_dir / "team.chat").write_text(chat_file.dumps(chat_file.chat_content(
+        messages, {"a": {"username": "a"}}, {}, {"id": "team-id"}
+    )))
+
+    response = await _get(jp_fetch, path="team.chat", since="1", limit="2")
+    assert response.code == 200
+    snapshot = json.loads(response.body)
+    assert snapshot["id"] == "team-id"
+    assert [m["id"] for m in snapshot["messages"]] == ["m2", "m3"]
+    assert snapshot["users"] == {"a": {"username": "a"}}
+
+    etag = response.headers["ETag"]
+    assert (await _get(jp_fetch, etag, path="team.chat", since="1", limit="2")).code == 304
+    # Another page of the chat is another representation.
+    assert (await _get(jp_fetch, etag, path="team.chat", since="3")).code == 200
+
+    messages.append({"id": "m5", "body": "5", "time": 5.0, "sender": "a"})
+    (jp_root_dir / "team.chat").write_text(chat_file.dumps(chat_file.chat_content(
+        messages, {}, {}, {"id": "team-id"}
+    )))
+    response = await _get(jp_fetch, etag, path="team.chat", since="1", limit="2")
+    assert response.code == 200
+
+
+async def test_snapshot_of_a_live_chat(jp_fetch, jp_serverapp) -> None:
+    manager = jp_serverapp.web_app.settings["chat_manager"]
+    model = await manager.create("live.chat")
+    model.add_message(NewMessage(body="hello", sender="a"))
+
+    response = await _get(jp_fetch, path="live.chat")
+    assert [m["body"] for m in json.loads(response.body)["messages"]] == ["hello"]
+    etag = response.headers["ETag"]
+    assert (await _get(jp_fetch, etag, path="live.chat")).code == 304
+
+    model.add_message(NewMessage(body="again", sender="a"))
+    response = await _get(jp_fetch, etag, path="live.chat")
+    assert response.code == 200
+    assert len(json.loads(response.body)["messages"]) == 2
+
+    # Archived messages are part of the snapshot, as for a chat file.
+    etag = response.headers["ETag"]
+    assert model.archive_messages(1) == 1
+    response = await _get(jp_fetch, etag, path="live.chat")
+    assert response.code == 200
+    assert [m["body"] for m in json.loads(response.body)["messages"]] == ["hello", "again"]
+
+
+async def test_snapshot_errors(jp_fetch) -> None:
+    assert (await _get(jp_fetch, path="missing.chat")).code == 404
+    assert (await _get(jp_fetch, path="../outside.chat")).code == 404
+    assert (await _get(jp_fetch, path="x.chat", since="yesterday")).code == 400
+    with pytest.raises(HTTPClientError) as e:
+        await jp_fetch("api", "jupyter-chat", "messages")
+    assert e.value.code == 400
@@ -0,0 +1,140 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the Prometheus metrics emitted by the WebSocket transport and the
+ChatManager."""
+import asyncio
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Optional, cast
+
+from prometheus_client import REGISTRY
+
+from jupyterlab_chat.chat_manager import ChatManager
+from jupyterlab_chat.models import NewMessage
+from jupyterlab_chat.websocket_model import WsChatModel
+from jupyterlab_chat.ychat import YChat
+
+if TYPE_CHECKING:
+    from jupyter_server.serverapp import ServerApp
+
+
+def _sample(name: str, **labels: str) -> float:
+    value: Optional[float] = REGISTRY.get_sample_value(name, labels)
+    return value or 0.0
+
+
+def _ws_model(tmp_path: Path) -> WsChatModel:
+    (tmp_path / "chat.chat").write_text("{}")
+    model = WsChatModel(path="chat.chat", root_dir=tmp_path)
+    model.load_from_file()
+    return model
+
+
+def test_save_and_load_are_timed(tmp_path: Path) -> None:
+    saves = _sample("jupyterlab_chat_save_duration_seconds_count")
+    loads = _sample("jupyterlab_chat_load_duration_seconds_count")
+
+    model = _ws_model(tmp_path)
+    model.save()
+
+    assert _sample("jupyterlab_chat_load_duration_seconds_count") == loads + 1
+    assert _sample("jupyterlab_chat_save_duration_seconds_count") == saves + 1
+
+
+def test_server_messages_and_updates_are_counted(tmp_path: Path) -> None:
+    labels = {"transport": "websocket", "origin": "server"}
+    sent = _sample("jupyterlab_chat_messages_total", **labels)
+    updated = _sample("jupyterlab_chat_message_updates_total", **labels)
+
+    model = _ws_model(tmp_path)
+    msg_id = model.add_message(NewMessage(body="hi", sender="agent"))
+    message = model.get_message(msg_id)
+    assert message is not None
+    message.body = " there"
+    model.update_message(message, append=True)
+
+    assert _sample("jupyterlab_chat_messages_total", **labels) == sent + 1
+    assert _sample("jupyterlab_chat_message_updates_total", **labels) == updated + 1
+
+
+def test_rtc_server_messages_and_updates_are_counted() -> None:
+    labels = {"transport": "rtc", "origin": "server"}
+    sent = _sample("jupyterlab_chat_messages_total", **labels)
+    updated = _sample("jupyterlab_chat_message_updates_total", **labels)
+
+    async def run() -> None:
+        chat = YChat()
+        chat.set_id("test-chat")
+        msg_id = chat.add_message(NewMessage(body="hi", sender="agent"))
+        message = chat.get_message(msg_id)
+        assert message is not None
+        message.body = " there"
+        chat.update_message(message, append=True)
+
+    asyncio.run(run())
+    assert _sample("jupyterlab_chat_messages_total", **labels) == sent + 1
+    assert _sample("jupyterlab_chat_message_updates_total", **labels) == updated + 1
+
+
+def test_broadcast_bytes_and_fan_out(tmp_path: Path) -> None:
+    model = _ws_model(tmp_path)
+    frames: list = []
+    for client_id in ("client-1", "client-2"):
+        model.handlers[client_id] = SimpleNamespace(  # type: ignore[assignment]
+            write_message=frames.append
+        )
+    sent_bytes = _sample("jupyterlab_chat_broadcast_bytes_total")
+    fan_outs = _sample("jupyterlab_chat_broadcast_duration_seconds_count")
+
+    frame = json.dumps({"type": "writing", "user": {"username": "é"}})
+    model.broadcast(frame)
+
+    assert frames == [frame, frame]
+    assert _sample("jupyterlab_chat_broadcast_bytes_total") == (
+        sent_bytes + 2 * len(frame.encode())
+    )
+    assert _sample("jupyterlab_chat_broadcast_duration_seconds_count") == fan_outs + 1
+
+
+def test_observer_callbacks_are_timed(tmp_path: Path) -> None:
+    observed = _sample(
+        "jupyterlab_chat_observer_duration_seconds_count", transport="websocket"
+    )
+    model = _ws_model(tmp_path)
+    model.observe_messages(lambda event: None)
+    model.observe_messages(lambda event: None)
+
+    model.add_message(NewMessage(body="hi", sender="agent"))
+
+    assert _sample(
+        "jupyterlab_chat_observer_duration_seconds_count", transport="websocket"
+    ) == observed + 2
+
+
+def test_manager_tracks_live_chats_and_evictions(tmp_path: Path) -> None:
+    async def run():
+        # No event logger: lifecycle events are irrelevant to the metrics.
+        settings = {"server_root_dir": str(tmp_path)}
+        serverapp = cast(
+            "ServerApp", SimpleNamespace(web_app=SimpleNamespace(settings=settings))
+        )
+        mgr = ChatManager(serverapp, rtc_enabled=False, start_poller=False)
+        evicted = _sample(
+            "jupyterlab_chat_evictions_total", transport="websocket", reason="closed"
+        )
+
+        (tmp_path / "a.chat").write_text("{}")
+        (tmp_path / "b.chat").write_text("{}")
+        a = mgr.ws_open("a.chat")
+        mgr.ws_open("b.chat")
+        assert _sample("jupyterlab_chat_live_chats_total", transport="websocket") == 2
+
+        mgr.ws_client_gone(a.get_id())
+        assert _sample("jupyterlab_chat_live_chats_total", transport="websocket") == 1
+        assert _sample(
+            "jupyterlab_chat_evictions_total", transport="websocket", reason="closed"
+        ) == evicted + 1
+        mgr.stop()
+
+    asyncio.run(run())
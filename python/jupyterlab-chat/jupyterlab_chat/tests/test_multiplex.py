@@ -0,0 +1,85 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the multiplexed WebSocket endpoint serving several chats."""
+import asyncio
+import json
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from jupyterlab_chat.models import NewMessage
+from jupyterlab_chat.websocket_handler import _ChatChannel
+
+
+@pytest.fixture
+def jp_server_config():
+    return {"ServerApp": {"jpserver_extensions": {"jupyterlab_chat": True}}}
+
+
+async def _read(ws) -> dict:
+    return json.loads(await asyncio.wait_for(ws.read_message(), timeout=5))
+
+
+async def _subscribe(ws, path: str) -> dict:
+    ws.write_message(json.dumps({
+        "type": "subscribe", "path": path, "user": {"username": "alice"}
+    }))
+    frame = await _read(ws)
+    assert frame["type"] == "connection" and frame["path"] == path
+    assert frame["chat_id"] == frame["id"]
+    return frame
+
+
+async def test_one_connection_serves_several_chats(jp_ws_fetch, jp_serverapp) -> None:
+    manager = jp_serverapp.web_app.settings["chat_manager"]
+    ws = await jp_ws_fetch("api", "jupyter-chat", "ws", "multiplex")
+    first = await _subscribe(ws, "first.chat")
+    second = await _subscribe(ws, "second.chat")
+    assert first["chat_id"] != second["chat_id"]
+    assert "alice" in first["users"]
+
+    ws.write_message(json.dumps({"chat_id": second["chat_id"], "body": "hello"}))
+    frame = await _read(ws)
+    assert frame["chat_id"] == second["chat_id"]
+    assert frame["type"] == "msg" and frame["message"]["body"] == "hello"
+    assert [m.body for m in manager.get(second["chat_id"]).get_messages()] == ["hello"]
+    assert manager.get(first["chat_id"]).get_messages() == []
+
+    # Frames broadcast by the server are tagged too.
+    manager.get(first["chat_id"]).add_message(NewMessage(body="hi", sender="bot"))
+    frame = await _read(ws)
+    assert frame["chat_id"] == first["chat_id"] and frame["message"]["body"] == "hi"
+
+    # Leaving the last subscription of a chat frees it.
+    ws.write_message(json.dumps({"type": "unsubscribe", "chat_id": first["chat_id"]}))
+    ws.write_message(json.dumps({"chat_id": second["chat_id"], "body": "sync"}))
+    assert (await _read(ws))["chat_id"] == second["chat_id"]
+    assert manager.get(first["chat_id"]) is None
+    assert manager.get(second["chat_id"]).handlers
+
+    ws.close()
+    for _ in range(50):
+        if manager.get(second["chat_id"]) is None:
+            break
+        await asyncio.sleep(0.05)
+    assert manager.get(second["chat_id"]) is None
+
+
+async def test_subscribe_without_path(jp_ws_fetch) -> None:
+    ws = await jp_ws_fetch("api", "jupyter-chat", "ws", "multiplex")
+    ws.write_message(json.dumps({"type": "subscribe"}))
+    assert (await _read(ws))["type"] == "error"
+    ws.close()
+
+
+def test_channel_tags_every_frame() -> None:
+    frames: List[str] = []
+    connection = SimpleNamespace(write_message=frames.append)
+    channel = _ChatChannel(connection, "chat-id")  # type: ignore[arg-type]
+    channel.write_message(json.dumps({"type": "msg"}))
+    channel.write_message("{}")
+    assert [json.loads(frame) for frame in frames] == [
+        {"chat_id": "chat-id", "type": "msg"},
+        {"chat_id": "chat-id"},
+    ]
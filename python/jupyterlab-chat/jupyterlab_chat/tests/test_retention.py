@@ -0,0 +1,122 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the retention policy applied by ChatManager."""
+import json
+import threading
+import time
+from dataclasses import asdict
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, cast
+
+from jupyterlab_chat import chat_file
+from jupyterlab_chat.chat_manager import ChatManager
+from jupyterlab_chat.models import Message, message_asdict_factory
+from jupyterlab_chat.stores import JsonChatStore
+from jupyterlab_chat.ychat import YChat
+
+if TYPE_CHECKING:
+    from jupyter_server.serverapp import ServerApp
+
+
+def _make_manager(tmp_path: Path, **config) -> ChatManager:
+    settings = {"server_root_dir": str(tmp_path)}
+    serverapp = cast(
+        "ServerApp", SimpleNamespace(web_app=SimpleNamespace(settings=settings))
+    )
+    return ChatManager(serverapp, rtc_enabled=False, start_poller=False, **config)
+
+
+def _history(count: int, start: float = 0.0):
+    return [
+        Message(id=f"m{i}", body=str(i), time=start + i, sender="a") for i in range(count)
+    ]
+
+
+def _write_chat(path: Path, count: int, start: float = 0.0) -> None:
+    path.write_text(chat_file.dumps(chat_file.chat_content(
+        [asdict(m, dict_factory=message_asdict_factory) for m in _history(count, start)],
+        {},
+        {},
+        {"id": path.stem},
+    )))
+
+
+async def test_retention_archives_live_and_on_disk_chats(tmp_path: Path) -> None:
+    mgr = _make_manager(tmp_path, retention_max_messages=100, retention_min_archived=5)
+    live = mgr.ws_open("live.chat")
+    live.import_messages(_history(150))
+    (tmp_path / "sub").mkdir()
+    _write_chat(tmp_path / "sub" / "closed.chat", 105)
+    # Too few expired messages to be archived.
+    _write_chat(tmp_path / "few.chat", 104)
+
+    assert await mgr.apply_retention() == 50 + 5
+
+    messages = live.get_messages()
+    assert len(messages) == 100 and messages[0].id == "m50"
+    assert live.get_message("m49") is None
+    assert live.get_message("m50") == messages[0]
+    store = JsonChatStore()
+    assert [m["id"] for m in store.read_history(tmp_path / "live.chat", limit=101)][:2] == [
+        "m49", "m50"
+    ]
+    closed = chat_file.load(tmp_path / "sub" / "closed.chat")
+    assert len(closed["messages"]) == 100
+    assert closed[chat_file.SEGMENTS_KEY][0]["count"] == 5
+    assert chat_file.SEGMENTS_KEY not in chat_file.load(tmp_path / "few.chat")
+    # Nothing left to archive.
+    assert await mgr.apply_retention() == 0
+
+
+async def test_retention_archives_files_in_a_thread(tmp_path: Path, monkeypatch) -> None:
+    mgr = _make_manager(tmp_path, retention_max_messages=100, retention_min_archived=5)
+    threads = []
+    archive = JsonChatStore.archive
+
+    def recorded_archive(self, path, content, count):
+        threads.append(threading.get_ident())
+        return archive(self, path, content, count)
+
+    monkeypatch.setattr(JsonChatStore, "archive", recorded_archive)
+    _write_chat(tmp_path / "closed.chat", 110)
+
+    assert await mgr.apply_retention() == 10
+    assert len(threads) == 1 and threads[0] != threading.get_ident()
+    assert len(chat_file.load(tmp_path / "closed.chat")["messages"]) == 100
+
+
+async def test_retention_by_age(tmp_path: Path) -> None:
+    mgr = _make_manager(
+        tmp_path,
+        retention_max_age_s=3600,
+        retention_min_archived=1,
+        retention_scan_files=False,
+    )
+    live = mgr.ws_open("live.chat")
+    now = time.time()
+    live.import_messages(_history(3, start=now - 7200))
+    live.import_messages([Message(id="recent", body="", time=now, sender="a")])
+    assert await mgr.apply_retention() == 3
+    assert [m.id for m in live.get_messages()] == ["recent"]
+
+
+def test_ychat_archive_messages(tmp_path: Path) -> None:
+    chat = YChat()
+    chat.set_id("chat-id")
+    chat.dirty = False
+    chat.import_messages(_history(10))
+    chat.room_id, chat.initial_path, chat.root_dir = None, "chat.chat", tmp_path
+    updates: list = []
+    chat.ydoc.observe(updates.append)
+
+    assert chat.archive_messages(4) == 4
+
+    assert len(updates) == 1
+    assert [m.id for m in chat.get_messages()] == [f"m{i}" for i in range(4, 10)]
+    assert chat.get_message("m5").body == "5"  # type: ignore[union-attr]
+    content = json.loads(chat.get())
+    assert content[chat_file.SEGMENTS_KEY][0]["count"] == 4
+    assert [m["id"] for m in chat_file.read_archive(tmp_path / "chat.chat", content)] == [
+        "m0", "m1", "m2", "m3"
+    ]
@@ -0,0 +1,233 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the chat stores persisting the WebSocket chat models."""
+import json
+import os
+from pathlib import Path
+from types import SimpleNamespace
+from typing import List
+
+import pytest
+
+from jupyterlab_chat import chat_file
+from jupyterlab_chat.chat_file import ARCHIVE_DIR, SEGMENTS_KEY
+from jupyterlab_chat.models import Message, NewMessage, User
+from jupyterlab_chat.stores import (
+    SQLITE_STORE,
+    ChatChanges,
+    JsonChatStore,
+    SQLiteChatStore,
+)
+from jupyterlab_chat.websocket_model import WsChatModel
+from jupyterlab_chat.ychat import YChat
+
+
+class RecordingStore(JsonChatStore):
+    """A JSON store recording the changes it is given."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.changes: List[ChatChanges] = []
+
+    def save(self, path: Path, content: dict, changes: ChatChanges) -> None:
+        self.changes.append(changes)
+        super().save(path, content, changes)
+
+
+@pytest.fixture
+def sqlite_store(tmp_path: Path):
+    store = SQLiteChatStore(database=str(tmp_path / "chats.sqlite"))
+    yield store
+    store.close()
+
+
+def _model(tmp_path: Path, store) -> WsChatModel:
+    model = WsChatModel(path="chat.chat", root_dir=tmp_path, store=store)
+    model.load_from_file()
+    return model
+
+
+def test_saves_hand_over_the_changes(tmp_path: Path) -> None:
+    store = RecordingStore()
+    model = _model(tmp_path, store)
+    first = model.add_message(NewMessage(body="first", sender="alice"))
+    second = model.add_message(NewMessage(body="second", sender="alice"))
+    model.update_message(Message(id=first, body="edited", time=0, sender="alice"))
+
+    # The first save also carries the new chat id.
+    assert [(c.state, [m["id"] for m in c.messages]) for c in store.changes] == [
+        (True, [first]),
+        (False, [second]),
+        (False, [first]),
+    ]
+    assert store.changes[-1].messages[0]["body"] == "edited"
+    saved = json.loads((tmp_path / "chat.chat").read_text())
+    assert [m["body"] for m in saved["messages"]] == ["edited", "second"]
+
+
+def test_sqlite_store_round_trip(tmp_path: Path, sqlite_store: SQLiteChatStore) -> None:
+    # A chat whose messages are in its file is copied on its first save.
+    legacy = {
+        "messages": [{"id": "old", "body": "legacy", "time": 1.0, "sender": "bob"}],
+        "users": {},
+        "attachments": {},
+        "metadata": {"id": "chat-id"},
+    }
+    (tmp_path / "chat.chat").write_text(json.dumps(legacy))
+    model = _model(tmp_path, sqlite_store)
+    model.set_user(User(username="alice"))
+    msg_id = model.add_message(NewMessage(body="hello", sender="alice"))
+
+    pointer = json.loads((tmp_path / "chat.chat").read_text())
+    assert pointer["store"] == SQLITE_STORE
+    assert pointer["messages"] == [] and pointer["metadata"] == {"id": "chat-id"}
+
+    reloaded = _model(tmp_path, sqlite_store)
+    assert [m.id for m in reloaded.get_messages()] == ["old", msg_id]
+    assert list(reloaded.get_users()) == ["alice"]
+    assert reloaded.get_id() == "chat-id"
+
+    path = tmp_path / "chat.chat"
+    version = sqlite_store.version(path)
+    reloaded.update_message(Message(id="old", body="edited", time=0, sender="bob"))
+    # The pointer file is left untouched, the version of the chat is not.
+    assert sqlite_store.version(path) != version
+    assert sqlite_store.read_message(path, "old")["body"] == "edited"  # type: ignore[index]
+    assert sqlite_store.read_message(path, "missing") is None
+    assert [m["id"] for m in sqlite_store.read_messages(path, since=1.0)] == [msg_id]
+    assert [m["id"] for m in sqlite_store.read_messages(path, limit=1)] == ["old"]
+
+    version = sqlite_store.version(path)
+    assert reloaded.archive_messages(1) == 1
+    assert sqlite_store.version(path) != version
+    assert [m["id"] for m in sqlite_store.read_archive(path, pointer)] == ["old"]
+    assert [m["id"] for m in reloaded.read_messages()] == ["old", msg_id]
+
+
+def test_sqlite_store_saves_only_changed_rows(
+    tmp_path: Path, sqlite_store: SQLiteChatStore
+) -> None:
+    model = _model(tmp_path, sqlite_store)
+    ids = model.import_messages(
+        [Message(id=f"m{i}", body=str(i), time=float(i), sender="a") for i in range(100)]
+    )
+    assert ids == 100
+    statements: List[str] = []
+    sqlite_store._connection.set_trace_callback(statements.append)
+    model.update_message(Message(id="m50", body="edited", time=0, sender="a"))
+    sqlite_store._connection.set_trace_callback(None)
+
+    upserts = [s for s in statements if s.startswith("INSERT")]
+    assert len(upserts) == 1 and "'m50'" in upserts[0]
+    assert sqlite_store.read_message(tmp_path / "chat.chat", "m50")["body"] == "edited"  # type: ignore[index]
+
+
+def test_segmented_chat_file(tmp_path: Path) -> None:
+    path = tmp_path / "chat.chat"
+    path.write_text(json.dumps({
+        "messages": [
+            {"id": f"m{i}", "body": str(i), "time": float(i), "sender": "a"}
+            for i in range(250)
+        ],
+        "metadata": {"id": "chat-id"},
+    }))
+    store = JsonChatStore(tail_size=50, segment_size=100)
+
+    # Opening the chat archives the messages beyond the tail.
+    model = _model(tmp_path, store)
+    messages = model.get_messages()
+    assert len(messages) == 50 and messages[0].id == "m200"
+    model.add_message(NewMessage(body="new", sender="a"))
+    saved = json.loads(path.read_text())
+    assert len(saved["messages"]) == 51
+    assert [(s["count"], s["start"], s["end"]) for s in saved[SEGMENTS_KEY]] == [
+        (200, 0.0, 199.0)
+    ]
+    assert (tmp_path / ARCHIVE_DIR / "chat-id" / "000000.json.gz").exists()
+    # Too few messages beyond the tail for a new segment.
+    assert len(_model(tmp_path, store).get_messages()) == 51
+
+    assert store.read_message(path, "m3")["body"] == "3"  # type: ignore[index]
+    assert [m["id"] for m in store.read_messages(path, since=197.0, limit=4)] == [
+        "m198", "m199", "m200", "m201"
+    ]
+    history = store.read_history(path, before=210.0, limit=20)
+    assert [m["id"] for m in history] == [f"m{i}" for i in range(190, 210)]
+
+
+def test_ychat_keeps_the_segment_manifest() -> None:
+    manifest = [{"file": "000000.json.gz", "count": 2, "start": 1.0, "end": 2.0}]
+    chat = YChat()
+    chat.set(json.dumps({
+        "messages": [{"id": "m3", "body": "", "time": 3.0, "sender": "a"}],
+        "metadata": {"id": "chat-id"},
+        SEGMENTS_KEY: manifest,
+    }))
+    content = json.loads(chat.get())
+    assert content[SEGMENTS_KEY] == manifest
+    assert [m["id"] for m in content["messages"]] == ["m3"]
+
+
+def test_concurrent_writers_are_merged(tmp_path: Path) -> None:
+    # Two servers sharing the chat file, each with its own store.
+    first, second = _model(tmp_path, JsonChatStore()), _model(tmp_path, JsonChatStore())
+    frames: List[dict] = []
+    second.handlers["client"] = SimpleNamespace(  # type: ignore[assignment]
+        write_message=lambda frame: frames.append(json.loads(frame))
+    )
+    first.set_user(User(username="alice"))
+    edited = first.add_message(NewMessage(body="from first", sender="alice"))
+    second.add_message(NewMessage(body="from second", sender="bob"))
+
+    saved = json.loads((tmp_path / "chat.chat").read_text())
+    assert [m["body"] for m in saved["messages"]] == ["from first", "from second"]
+    assert "alice" in saved["users"]
+    # The second model adopted the message of the first one, and sent it.
+    assert [m.body for m in second.get_messages()] == ["from first", "from second"]
+    assert {f["message"]["body"] for f in frames if f["type"] == "msg"} == {
+        "from first", "from second"
+    }
+
+    # An edit made by the first server is not reverted by the second one.
+    first.update_message(Message(id=edited, body="edited", time=0, sender="alice"))
+    second.add_message(NewMessage(body="again", sender="bob"))
+    saved = json.loads((tmp_path / "chat.chat").read_text())
+    assert [m["body"] for m in saved["messages"]] == ["edited", "from second", "again"]
+
+
+def test_json_store_follows_renamed_and_freed_chats(tmp_path: Path, monkeypatch) -> None:
+    store = JsonChatStore()
+    model = _model(tmp_path, store)
+    model.add_message(NewMessage(body="before", sender="alice"))
+    merges: List[dict] = []
+    monkeypatch.setattr(chat_file, "merge", lambda theirs, *args: merges.append(theirs))
+
+    (tmp_path / "chat.chat").rename(tmp_path / "moved.chat")
+    model._on_path_change("moved.chat")
+    model.add_message(NewMessage(body="after", sender="alice"))
+
+    # The renamed file is not taken for a file written by another process.
+    assert merges == []
+    assert list(store._versions) == [tmp_path / "moved.chat"]
+    model.dispose()
+    assert store._versions == {}
+
+
+@pytest.mark.skipif(os.name == "nt", reason="fcntl is not available on Windows")
+def test_chat_file_lock(tmp_path: Path, monkeypatch) -> None:
+    import fcntl
+
+    monkeypatch.setenv("JUPYTER_RUNTIME_DIR", str(tmp_path / "runtime"))
+    chats = tmp_path / "chats"
+    chats.mkdir()
+    path = chats / "chat.chat"
+    with chat_file.lock(path):
+        fd = os.open(chat_file.lock_path(path), os.O_RDWR)
+        try:
+            with pytest.raises(BlockingIOError):
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        finally:
+            os.close(fd)
+    # No lock file is left next to the chat.
+    assert list(chats.iterdir()) == []
+    assert chat_file.lock_path(path).parent == tmp_path / "runtime" / chat_file.LOCK_DIR
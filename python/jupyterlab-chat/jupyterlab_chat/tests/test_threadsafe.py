@@ -0,0 +1,93 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the thread-safe proxy of the chat models."""
+import asyncio
+import json
+import threading
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from jupyterlab_chat.models import Message, NewMessage, User
+from jupyterlab_chat.websocket_model import WsChatModel
+from jupyterlab_chat.ychat import YChat
+
+
+class _FakeHandler:
+    def __init__(self):
+        self.frames: List[dict] = []
+
+    def write_message(self, message):
+        self.frames.append(json.loads(message))
+
+
+@pytest.mark.asyncio
+async def test_calls_from_threads_run_on_the_loop(tmp_path: Path, monkeypatch) -> None:
+    model = WsChatModel(path="chat.chat", root_dir=tmp_path)
+    chat = model.threadsafe()
+    threads: List[int] = []
+    add_message = model.add_message
+
+    def record(new_message: NewMessage) -> str:
+        threads.append(threading.get_ident())
+        return add_message(new_message)
+
+    monkeypatch.setattr(model, "add_message", record)
+
+    def persona() -> str:
+        msg_id = chat.add_message(NewMessage(body="hello", sender="bot"))
+        return chat.get_message(msg_id).body  # type: ignore[union-attr]
+
+    assert await asyncio.get_running_loop().run_in_executor(None, persona) == "hello"
+    assert threads == [threading.get_ident()]
+
+
+@pytest.mark.asyncio
+async def test_calls_queued_together_are_batched(tmp_path: Path) -> None:
+    model = WsChatModel(path="chat.chat", root_dir=tmp_path)
+    client = _FakeHandler()
+    model.handlers["client"] = client  # type: ignore[assignment]
+    msg_id = model.add_message(NewMessage(body="", sender="bot"))
+    chat = model.threadsafe()
+    futures = []
+
+    def stream() -> None:
+        for chunk in "abcd":
+            futures.append(
+                chat.update_message(
+                    Message(id=msg_id, body=chunk, time=0, sender="bot"), append=True
+                )
+            )
+
+    # The loop is held while the thread streams, as when it is busy.
+    thread = threading.Thread(target=stream)
+    thread.start()
+    thread.join()
+    await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+
+    assert model.get_message(msg_id).body == "abcd"  # type: ignore[union-attr]
+    # One frame for the new message, one for the four updates.
+    assert len(client.frames) == 2
+    assert json.loads((tmp_path / "chat.chat").read_text())["messages"][0]["body"] == "abcd"
+
+
+@pytest.mark.asyncio
+async def test_errors_and_calls_from_the_loop() -> None:
+    chat = YChat()
+    chat.set_id("test-chat")
+    proxy = chat.threadsafe()
+
+    # From the loop itself, the calls run at once.
+    proxy.set_user(User(username="bot", bot=True))
+    assert "bot" in proxy.get_users()
+
+    def failing() -> None:
+        proxy._call(chat.get_messages, "unexpected")
+
+    with pytest.raises(TypeError):
+        await asyncio.get_running_loop().run_in_executor(None, failing)
+
+    # The calls not waited for keep their errors in their future.
+    future = proxy._submit(chat.get_messages, "unexpected")
+    assert isinstance(future.exception(), TypeError)
@@ -0,0 +1,101 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""Tests for the per-frame latency tracing of the WebSocket handler."""
+import asyncio
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, cast
+
+from jupyterlab_chat.chat_manager import ChatManager
+from jupyterlab_chat.tracing import NULL_TRACE, FrameTrace, TraceExporter
+from jupyterlab_chat.websocket_handler import WSChatHandler
+from jupyterlab_chat.websocket_model import WsChatModel
+
+if TYPE_CHECKING:
+    from jupyter_server.serverapp import ServerApp
+
+
+class _CollectingExporter(TraceExporter):
+    traces: list = []
+
+    def export(self, trace: FrameTrace) -> None:
+        self.traces.append(trace)
+
+
+def _setup(tmp_path: Path, **config):
+    settings: dict = {"server_root_dir": str(tmp_path)}
+    serverapp = cast(
+        "ServerApp", SimpleNamespace(web_app=SimpleNamespace(settings=settings))
+    )
+    mgr = ChatManager(serverapp, rtc_enabled=False, start_poller=False, **config)
+    settings["chat_manager"] = mgr
+    (tmp_path / "chat.chat").write_text("{}")
+    model = mgr.ws_open("chat.chat")
+
+    # A handler bound to the model without a tornado connection.
+    handler = WSChatHandler.__new__(WSChatHandler)
+    handler.application = SimpleNamespace(settings=settings)  # type: ignore[assignment]
+    handler._path = "chat.chat"
+    handler._client_id = "client-1"
+    handler._model = model
+    frames: list = []
+    model.handlers["client-1"] = SimpleNamespace(  # type: ignore[assignment]
+        write_message=frames.append
+    )
+    return mgr, model, handler, frames
+
+
+def _send(handler: WSChatHandler, payload: dict) -> None:
+    asyncio.run(handler.on_message(json.dumps(payload)))
+
+
+def test_tracing_is_disabled_by_default(tmp_path: Path) -> None:
+    mgr, _, handler, frames = _setup(tmp_path)
+    assert mgr.start_trace("chat.chat") is NULL_TRACE
+
+    _send(handler, {"body": "hi", "user": {"username": "jovyan"}})
+
+    msg = json.loads(frames[-1])
+    assert msg["type"] == "msg"
+    assert "trace" not in msg
+    mgr.stop()
+
+
+def test_new_message_stages_are_exported(tmp_path: Path) -> None:
+    _CollectingExporter.traces = []
+    mgr, model, handler, frames = _setup(
+        tmp_path, trace_exporter_class=_CollectingExporter
+    )
+    model.observe_messages(lambda event: None)
+
+    _send(handler, {"body": "hi", "user": {"username": "jovyan"}})
+
+    (trace,) = _CollectingExporter.traces
+    assert trace.path == "chat.chat"
+    assert list(trace.timings) == ["decode", "order", "save", "broadcast", "observers"]
+    assert all(duration >= 0 for duration in trace.timings.values())
+    # Echoing the trace in frames is a separate opt-in.
+    assert "trace" not in json.loads(frames[-1])
+    mgr.stop()
+
+
+def test_trace_is_echoed_in_msg_frames(tmp_path: Path) -> None:
+    _CollectingExporter.traces = []
+    mgr, model, handler, frames = _setup(
+        tmp_path, trace_exporter_class=_CollectingExporter, trace_in_frames=True
+    )
+
+    _send(handler, {"body": "hi", "user": {"username": "jovyan"}})
+    msg_id = model._messages[0]["id"]
+    _send(handler, {"is_update": True, "id": msg_id, "body": "edited"})
+
+    new_trace, update_trace = _CollectingExporter.traces
+    new_frame = json.loads(frames[-2])
+    update_frame = json.loads(frames[-1])
+    assert new_frame["trace"]["id"] == new_trace.trace_id
+    # Timings known when the frame is broadcast are echoed.
+    assert set(new_frame["trace"]["timings"]) == {"decode", "order", "save"}
+    assert update_frame["trace"]["id"] == update_trace.trace_id
+    assert "order" not in update_trace.timings
+    mgr.stop()
@@ -2,6 +2,7 @@
 # Distributed under the terms of the Modified BSD License.
 """Tests for the WebSocket writing-status relay (RTC-free typing indicator)."""
 
+import asyncio
 import json
 
 from jupyterlab_chat.models import User
@@ -62,13 +63,18 @@ def test_broadcast_writing_status_preserves_bot_flag(tmp_path):
 def test_broadcast_writing_status_stop(tmp_path):
     model, handler = _model_with_client(tmp_path)
 
+    model.broadcast_writing_status(User(username="bot"), {"typingIndicator": "x"})
     model.broadcast_writing_status(User(username="bot"), None)
 
-    frame = json.loads(handler.messages[0])
+    frame = json.loads(handler.messages[1])
     assert frame["state"] is False
     assert frame["user"]["username"] == "bot"
     assert "typingIndicator" not in frame
 
+    # Nothing changed: no frame.
+    model.broadcast_writing_status(User(username="bot"), None)
+    assert len(handler.messages) == 2
+
 
 def test_writing_is_not_persisted(tmp_path):
     model, _ = _model_with_client(tmp_path)
@@ -77,3 +83,48 @@ def test_writing_is_not_persisted(tmp_path):
 
     # Ephemeral: broadcasting a writing status must not create/modify the file.
     assert not (tmp_path / "chat.chat").exists()
+
+
+def test_writing_statuses_are_throttled(tmp_path):
+    async def run():
+        model = WsChatModel(
+            path="chat.chat", root_dir=tmp_path, writing_status_interval_s=0.05
+        )
+        handler = _FakeHandler()
+        model.handlers["client-1"] = handler  # type: ignore[assignment]
+        bot, other = User(username="bot"), User(username="other")
+
+        model.broadcast_writing_status(bot, {"typingIndicator": "1"})
+        for indicator in "234":
+            model.broadcast_writing_status(bot, {"typingIndicator": indicator})
+        model.broadcast_writing_status(other, {"typingIndicator": "x"})
+        model.broadcast_writing_status(other, None)
+        assert len(handler.messages) == 1
+
+        # The changes of the interval are sent at its end, once per writer.
+        await asyncio.sleep(0.1)
+        frames = [json.loads(m) for m in handler.messages]
+        assert [(f["user"]["username"], f.get("typingIndicator")) for f in frames] == [
+            ("bot", "1"),
+            ("bot", "4"),
+        ]
+        model.dispose()
+
+    asyncio.run(run())
+
+
+def test_stale_writers_expire(tmp_path):
+    async def run():
+        model = WsChatModel(
+            path="chat.chat", root_dir=tmp_path, writing_status_expiry_s=0.05
+        )
+        handler = _FakeHandler()
+        model.handlers["client-1"] = handler  # type: ignore[assignment]
+
+        model.broadcast_writing_status(User(username="bot"), {"typingIndicator": "x"})
+        await asyncio.sleep(0.1)
+        frames = [json.loads(m) for m in handler.messages]
+        assert [f["state"] for f in frames] == [True, False]
+        model.dispose()
+
+    asyncio.run(run())
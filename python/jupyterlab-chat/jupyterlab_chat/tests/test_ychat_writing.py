@@ -126,3 +126,16 @@ def test_no_awareness_is_a_noop():
     chat.broadcast_writing_status(BOT2, {"messageID": "m2"})
     usernames = {w["user"]["username"] for w in _published_writers(chat)}
     assert usernames == {"bot", "bot-2"}
+
+
+def test_writer_changes_are_coalesced_within_the_interval():
+    chat = _chat_with_room_awareness()
+    chat._writers.interval_s = 60
+    chat.broadcast_writing_status(BOT, {"typingIndicator": "1"})
+    chat.broadcast_writing_status(BOT, {"typingIndicator": "2"})
+    chat.broadcast_writing_status(BOT2, {"typingIndicator": "x"})
+
+    assert _published_writers(chat) == [{"user": asdict(BOT), "typingIndicator": "1"}]
+    chat._writers.flush()
+    assert [w.get("typingIndicator") for w in _published_writers(chat)] == ["2", "x"]
+    chat._writers.close()
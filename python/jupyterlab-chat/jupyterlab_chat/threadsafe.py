@@ -0,0 +1,139 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""
+Access to a chat model from other threads than the server event loop.
+
+Neither model may be used outside the event loop of the server, while many
+persona and LLM client libraries are blocking and run in thread pools.
+``chat.threadsafe()`` returns a :class:`ThreadSafeChat`, whose methods marshal
+the calls onto the event loop. The calls queued before the loop runs them are
+run together in one ``batch()`` of the model, so that the chunks of a reply
+streamed from several threads make one commit.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import threading
+from typing import Any, Callable, Optional, Union
+
+from .models import (
+    BaseChatModel,
+    FileAttachment,
+    Message,
+    NewMessage,
+    NotebookAttachment,
+    User,
+)
+
+_log = logging.getLogger(__name__)
+
+
+class ThreadSafeChat:
+    """A proxy of a chat model usable from any thread.
+
+    The methods returning a value wait for the event loop to run the call and
+    return its result (or raise its error). :meth:`update_message` and
+    :meth:`broadcast_writing_status` do not wait: they return a
+    ``concurrent.futures.Future``, and their errors are logged, so that a
+    streaming thread is not held back by the event loop. The calls are run in
+    the order they were made.
+
+    Called from the event loop itself, the methods run the calls at once.
+    """
+
+    def __init__(
+        self, model: BaseChatModel, loop: Optional[asyncio.AbstractEventLoop] = None
+    ):
+        self.model = model
+        self._loop = loop or asyncio.get_running_loop()
+        self._lock = threading.Lock()
+        # The calls waiting for the event loop, with their future and whether
+        # their caller waits for them.
+        self._pending: list[tuple[Callable, tuple, concurrent.futures.Future, bool]] = []
+
+    def add_message(self, new_message: NewMessage) -> str:
+        return self._call(self.model.add_message, new_message)
+
+    def update_message(
+        self, update: Message, append: bool = False
+    ) -> concurrent.futures.Future:
+        return self._submit(self.model.update_message, update, append)
+
+    def broadcast_writing_status(
+        self, user: User, status: Optional[dict] = None
+    ) -> concurrent.futures.Future:
+        return self._submit(self.model.broadcast_writing_status, user, status)
+
+    def set_user(self, user: User) -> None:
+        self._call(self.model.set_user, user)
+
+    def set_attachment(self, attachment: Union[FileAttachment, NotebookAttachment]) -> str:
+        return self._call(self.model.set_attachment, attachment)
+
+    def get_id(self) -> str:
+        return self._call(self.model.get_id)
+
+    def get_path(self) -> str:
+        return self._call(self.model.get_path)
+
+    def get_message(self, id: str) -> Optional[Message]:
+        return self._call(self.model.get_message, id)
+
+    def get_messages(self) -> list[Message]:
+        return self._call(self.model.get_messages)
+
+    def get_users(self) -> dict[str, User]:
+        return self._call(self.model.get_users)
+
+    def get_metadata(self) -> dict[str, Any]:
+        return self._call(self.model.get_metadata)
+
+    def get_attachments(self) -> dict[str, Union[FileAttachment, NotebookAttachment]]:
+        return self._call(self.model.get_attachments)
+
+    def _on_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    def _call(self, method: Callable, *args: Any) -> Any:
+        """Run ``method`` on the event loop and return its result."""
+        if self._on_loop():
+            return method(*args)
+        return self._enqueue(method, args, wait=True).result()
+
+    def _submit(self, method: Callable, *args: Any) -> concurrent.futures.Future:
+        """Run ``method`` on the event loop, without waiting for it."""
+        if self._on_loop():
+            future: concurrent.futures.Future = concurrent.futures.Future()
+            try:
+                future.set_result(method(*args))
+            except Exception as e:
+                _log.exception("Chat call %s failed", method.__name__)
+                future.set_exception(e)
+            return future
+        return self._enqueue(method, args, wait=False)
+
+    def _enqueue(self, method: Callable, args: tuple, wait: bool) -> concurrent.futures.Future:
+        future: concurrent.futures.Future = concurrent.futures.Future()
+        with self._lock:
+            self._pending.append((method, args, future, wait))
+            first = len(self._pending) == 1
+        if first:
+            self._loop.call_soon_threadsafe(self._run_pending)
+        return future
+
+    def _run_pending(self) -> None:
+        with self._lock:
+            calls, self._pending = self._pending, []
+        with self.model.batch():
+            for method, args, future, wait in calls:
+                try:
+                    future.set_result(method(*args))
+                except Exception as e:
+                    if not wait:
+                        _log.exception("Chat call %s failed", method.__name__)
+                    future.set_exception(e)
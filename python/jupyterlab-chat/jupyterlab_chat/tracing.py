@@ -0,0 +1,142 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""
+Per-frame latency tracing for the WebSocket transport.
+
+``WSChatHandler.on_message`` records how long each stage of handling a client
+frame takes (decode, ordering and index rebuild, save, broadcast and observer
+dispatch) on a :class:`FrameTrace`, and hands the finished trace to the
+configured :class:`TraceExporter`.
+
+Tracing is disabled by default: the :class:`NullTraceExporter` makes the
+ChatManager hand out the shared :data:`NULL_TRACE`, whose stages are a reusable
+no-op context manager, so a disabled tracer costs no clock reads and no
+allocations per frame.
+"""
+from __future__ import annotations
+
+import logging
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from typing import Iterator, Optional
+
+_log = logging.getLogger(__name__)
+
+#: Stage names recorded by the WebSocket handler, in handling order.
+STAGE_DECODE = "decode"
+STAGE_ORDER = "order"
+STAGE_SAVE = "save"
+STAGE_BROADCAST = "broadcast"
+STAGE_OBSERVERS = "observers"
+
+
+class FrameTrace:
+    """Timings of the stages spent handling one incoming WebSocket frame."""
+
+    #: Whether this trace records anything. ``False`` only for :data:`NULL_TRACE`.
+    enabled = True
+
+    def __init__(self, path: str):
+        self.trace_id: str = uuid.uuid4().hex
+        """ Server-side id of the trace, echoed to clients when enabled. """
+
+        self.path = path
+        """ Path of the chat the frame was sent to. """
+
+        self.received: float = time.time()
+        """ Wall-clock time (seconds since epoch) the frame was received. """
+
+        self.timings: dict[str, float] = {}
+        """ Duration in seconds of each recorded stage, keyed by stage name. """
+
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Record the duration of the enclosed block under ``name``."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    @property
+    def total(self) -> float:
+        """Seconds elapsed since the frame was received."""
+        return time.perf_counter() - self._start
+
+    def to_frame(self) -> dict:
+        """The trace as echoed to clients in an outgoing ``msg`` frame."""
+        return {
+            "id": self.trace_id,
+            "received": self.received,
+            "timings": dict(self.timings),
+        }
+
+
+class _NullFrameTrace(FrameTrace):
+    """A trace that records nothing; see :data:`NULL_TRACE`."""
+
+    enabled = False
+
+    def __init__(self):
+        self.trace_id = ""
+        self.path = ""
+        self.received = 0.0
+        self.timings = {}
+        self._stage: AbstractContextManager[None] = nullcontext()
+
+    def stage(self, name: str) -> AbstractContextManager[None]:  # type: ignore[override]
+        return self._stage
+
+    @property
+    def total(self) -> float:
+        return 0.0
+
+
+#: The shared no-op trace handed out while tracing is disabled.
+NULL_TRACE: FrameTrace = _NullFrameTrace()
+
+
+class TraceExporter(ABC):
+    """Receives finished frame traces.
+
+    Subclass and override :meth:`export`, then select the subclass with the
+    ``ChatManager.trace_exporter_class`` configurable. :meth:`export` runs on
+    the server event loop after each traced frame, so it must be cheap (e.g.
+    append to a buffer flushed elsewhere).
+    """
+
+    #: Whether frames are traced at all when this exporter is selected.
+    enabled = True
+
+    @abstractmethod
+    def export(self, trace: FrameTrace) -> None:
+        ...
+
+
+class NullTraceExporter(TraceExporter):
+    """The default exporter: disables tracing entirely."""
+
+    enabled = False
+
+    def export(self, trace: FrameTrace) -> None:
+        pass
+
+
+class LoggingTraceExporter(TraceExporter):
+    """Logs every finished trace at ``DEBUG`` level."""
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.log = logger or _log
+
+    def export(self, trace: FrameTrace) -> None:
+        self.log.debug(
+            "Chat frame %s on '%s' handled in %.6fs: %s",
+            trace.trace_id,
+            trace.path,
+            trace.total,
+            ", ".join(f"{name}={duration:.6f}s" for name, duration in trace.timings.items()),
+        )
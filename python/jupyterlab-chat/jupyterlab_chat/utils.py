@@ -4,8 +4,11 @@
 """Utility functions for jupyter-chat."""
 
 import re
+from abc import ABCMeta
 from typing import TYPE_CHECKING, Set
 
+from traitlets.traitlets import MetaHasTraits
+
 if TYPE_CHECKING:
     from .models import Message
     from .ychat import YChat
@@ -31,3 +34,8 @@ def find_mentions(message: "Message", chat: "YChat") -> None:
             mentioned_usernames.append(username)
 
     message.mentions = mentioned_usernames
+
+
+class ConfigurableABCMeta(MetaHasTraits, ABCMeta):
+    """The metaclass of the abstract configurable classes, which cannot derive
+    from ``ABC`` as the metaclass of ``Configurable`` is ``MetaHasTraits``."""
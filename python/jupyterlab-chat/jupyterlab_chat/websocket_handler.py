@@ -5,12 +5,26 @@ import json
 import time
 import uuid
 from pathlib import Path
-from typing import Dict
+from typing import Any, Dict, Optional
 
 from jupyter_server.base.handlers import JupyterHandler
 from tornado import web, websocket
 
+from .metrics import (
+    CHAT_MESSAGE_UPDATES,
+    CHAT_MESSAGES,
+    TRANSPORT_WEBSOCKET,
+)
 from .models import ChatMessageAction, User
+from .tracing import (
+    NULL_TRACE,
+    STAGE_BROADCAST,
+    STAGE_DECODE,
+    STAGE_OBSERVERS,
+    STAGE_ORDER,
+    STAGE_SAVE,
+    FrameTrace,
+)
 from .websocket_model import WsChatModel
 
 
@@ -45,32 +59,45 @@ class WSChatHandler(JupyterHandler, websocket.WebSocketHandler):
         if result is not None:
             await result
 
-    def _parse_client_user(self):
-        """Parse the optional client-provided identity from the connect query.
+    def _client_user(self, data: Any = None) -> User:
+        """The identity of the connecting user.
 
-        Returns a ``User`` built from the frontend's ``user`` query argument, or
-        ``None`` when it is absent or malformed.
+        Prefer the client-provided identity ``data`` (matching collaborative
+        mode, where the user is set on the frontend) so it equals the frontend's
+        own identity and is excluded from its own mention suggestions. Fall back
+        to the authenticated server user for older clients that do not send
+        their identity, or send a malformed one.
         """
+        if isinstance(data, dict) and data.get("username"):
+            username = data["username"]
+            return User(
+                username=username,
+                name=data.get("name") or username,
+                display_name=data.get("display_name") or username,
+                initials=data.get("initials") or username[0].upper(),
+                color=data.get("color"),
+                avatar_url=data.get("avatar_url"),
+            )
+        current_user = self.current_user
+        return User(
+            username=current_user.username,
+            name=current_user.name or current_user.username,
+            display_name=current_user.display_name or current_user.username,
+            initials=current_user.initials or current_user.username[0].upper(),
+            color=getattr(current_user, "color", None),
+            avatar_url=getattr(current_user, "avatar_url", None),
+        )
+
+    def _parse_client_user(self) -> Any:
+        """The client-provided identity in the ``user`` query argument, or
+        ``None`` when it is absent or not valid JSON."""
         raw = self.get_query_argument("user", None)
         if not raw:
             return None
         try:
-            data = json.loads(raw)
+            return json.loads(raw)
         except (json.JSONDecodeError, TypeError):
             return None
-        if not isinstance(data, dict):
-            return None
-        username = data.get("username")
-        if not username:
-            return None
-        return User(
-            username=username,
-            name=data.get("name") or username,
-            display_name=data.get("display_name") or username,
-            initials=data.get("initials") or username[0].upper(),
-            color=data.get("color"),
-            avatar_url=data.get("avatar_url"),
-        )
 
     def open(self, *args: str, **kwargs: str):
         path = self.get_query_argument("path", None)
@@ -80,72 +107,87 @@ class WSChatHandler(JupyterHandler, websocket.WebSocketHandler):
 
         self._path = path
         self._client_id = uuid.uuid4().hex
+        self._model = self._subscribe(
+            path, self._client_id, self, self._parse_client_user()
+        )
 
+    def _subscribe(
+        self, path: str, client_id: str, channel: Any, client_user: Any = None
+    ) -> WsChatModel:
+        """Subscribe ``channel`` (this connection, or one of its channels) to
+        the chat at ``path``, and send it the chat history."""
         # The manager owns get-or-create and emits the `opened` lifecycle event
         # (once, when the model is first created).
         model = self._chat_manager.ws_open(path)
-        self._model = model
-        model.handlers[self._client_id] = self
-
-        # Register the connecting user. Prefer the client-provided identity
-        # (matching collaborative mode, where the user is set on the frontend)
-        # so it equals the frontend's own identity and is excluded from its own
-        # mention suggestions. Fall back to the authenticated server user for
-        # older clients that do not send their identity.
-        current_user = self.current_user
-        user = self._parse_client_user() or User(
-            username=current_user.username,
-            name=current_user.name or current_user.username,
-            display_name=current_user.display_name or current_user.username,
-            initials=current_user.initials or current_user.username[0].upper(),
-            color=getattr(current_user, "color", None),
-            avatar_url=getattr(current_user, "avatar_url", None),
-        )
-        model.set_user(user)
+        self._chat_manager.ws_subscribe(model, client_id, channel)
+        model.set_user(self._client_user(client_user))
 
         # Send full history so the client can render existing messages
-        self.write_message(json.dumps({
+        channel.write_message(json.dumps({
             "type": "connection",
-            "client_id": self._client_id,
+            "client_id": client_id,
             "id": model.get_id(),
+            "path": model.get_path(),
             "messages": [model.resolve_message(m) for m in model._messages],
             "users": model._users,
         }))
 
         # Notify existing clients about the updated users map
         users_update = json.dumps({"type": "users", "users": model._users})
-        for client_id, handler in list(model.handlers.items()):
-            if client_id != self._client_id:
+        for other_id, handler in list(model.handlers.items()):
+            if other_id != client_id:
                 try:
                     handler.write_message(users_update)
                 except websocket.WebSocketClosedError:
                     pass
 
-        self.log.info("WS chat client %s connected to model '%s'", self._client_id, path)
-        self._chat_manager.on_client_connect(path, self._client_id, model.get_id())
+        self.log.info("WS chat client %s connected to model '%s'", client_id, path)
+        self._chat_manager.on_client_connect(path, client_id, model.get_id())
+        return model
 
-    async def on_message(self, raw: str | bytes) -> None:
+    def _decode(self, raw: str | bytes, trace: FrameTrace) -> Optional[dict]:
         try:
-            data = json.loads(raw)
+            with trace.stage(STAGE_DECODE):
+                data = json.loads(raw)
         except json.JSONDecodeError:
             self.log.error("Invalid JSON received on WS chat connection")
-            return
+            return None
+        return data if isinstance(data, dict) else None
 
-        path = self._path
-        if not path:
+    async def on_message(self, raw: str | bytes) -> None:
+        path = getattr(self, "_path", None)
+        # A no-op trace unless a trace exporter is configured on the manager.
+        trace = self._chat_manager.start_trace(path or "")
+        data = self._decode(raw, trace)
+        if data is None or not path:
             return
 
         model = getattr(self, "_model", None)
         if model is None:
             return
-        self._chat_manager.ws_activity(model.get_id())
+        self._handle_message(data, model, trace)
+        # Hold back this client while a blocking message observer catches up.
+        await self._chat_manager.wait_for_observers(model)
 
+    def _handle_message(self, data: dict, model: WsChatModel, trace: FrameTrace) -> None:
+        self._chat_manager.ws_activity(model.get_id())
         if data.get("is_update"):
-            self._handle_update_message(data, model)
+            self._handle_update_message(data, model, trace)
         else:
-            self._handle_new_message(data, model)
+            self._handle_new_message(data, model, trace)
+        self._chat_manager.finish_trace(trace)
+
+    def _msg_frame(self, model: WsChatModel, message: dict, trace: FrameTrace) -> str:
+        """Serialize the ``msg`` frame broadcast for ``message``, echoing the
+        server-side trace when the manager is configured to."""
+        frame: dict = {"type": "msg", "message": model.resolve_message(message)}
+        if trace.enabled and self._chat_manager.trace_in_frames:
+            frame["trace"] = trace.to_frame()
+        return json.dumps(frame)
 
-    def _handle_new_message(self, data: dict, model: WsChatModel) -> None:
+    def _handle_new_message(
+        self, data: dict, model: WsChatModel, trace: FrameTrace = NULL_TRACE
+    ) -> None:
         timestamp = time.time()
         # Prefer the client-provided identity as the sender, matching the
         # collaborative mode where the sender is set on the frontend. Fall back
@@ -157,6 +199,7 @@ class WSChatHandler(JupyterHandler, websocket.WebSocketHandler):
             sender = client_user["username"]
             if model._users.get(sender) != client_user:
                 model._users[sender] = client_user
+                model._mark_unsaved()
                 new_user_registered = True
         else:
             sender = self.current_user.username
@@ -173,28 +216,35 @@ class WSChatHandler(JupyterHandler, websocket.WebSocketHandler):
                 message[key] = data[key]
         if "attachments" in data:
             message["attachments"] = self._store_attachments(data["attachments"], model)
+        model._offload(message)
 
-        idx = next(
-            (i for i, m in enumerate(model._messages) if m.get("time", 0) > timestamp),
-            len(model._messages),
-        )
-        model._messages.insert(idx, message)
-        model._indexes_by_id = {m["id"]: i for i, m in enumerate(model._messages)}
-        model.save()
-        # If we learned a new sender identity, tell all clients first so they can
-        # resolve the sender (display name/avatar) when the message arrives.
-        if new_user_registered:
-            model.broadcast(json.dumps({"type": "users", "users": model._users}))
-        model.broadcast(
-            json.dumps({"type": "msg", "message": model.resolve_message(message)})
-        )
-        received = model.get_message(message["id"])
-        if received is not None:
-            model._emit_message_event(
-                ChatMessageAction.CLIENT_MSG_RECEIVED, received
+        with trace.stage(STAGE_ORDER):
+            idx = next(
+                (i for i, m in enumerate(model._messages) if m.get("time", 0) > timestamp),
+                len(model._messages),
             )
+            model._messages.insert(idx, message)
+            model._indexes_by_id = {m["id"]: i for i, m in enumerate(model._messages)}
+            model._mark_unsaved(message["id"])
+        with trace.stage(STAGE_SAVE):
+            model.save()
+        with trace.stage(STAGE_BROADCAST):
+            # If we learned a new sender identity, tell all clients first so they
+            # can resolve the sender (display name/avatar) when the message arrives.
+            if new_user_registered:
+                model.broadcast(json.dumps({"type": "users", "users": model._users}))
+            model.broadcast(self._msg_frame(model, message, trace))
+        CHAT_MESSAGES.labels(TRANSPORT_WEBSOCKET, "client").inc()
+        with trace.stage(STAGE_OBSERVERS):
+            received = model.get_message(message["id"])
+            if received is not None:
+                model._emit_message_event(
+                    ChatMessageAction.CLIENT_MSG_RECEIVED, received
+                )
 
-    def _handle_update_message(self, data: dict, model: WsChatModel) -> None:
+    def _handle_update_message(
+        self, data: dict, model: WsChatModel, trace: FrameTrace = NULL_TRACE
+    ) -> None:
         msg_id = data.get("id")
         if not msg_id:
             return
@@ -207,15 +257,18 @@ class WSChatHandler(JupyterHandler, websocket.WebSocketHandler):
                 msg[key] = data[key]
         if "attachments" in data:
             msg["attachments"] = self._store_attachments(data["attachments"], model)
-        model.save()
-        model.broadcast(
-            json.dumps({"type": "msg", "message": model.resolve_message(msg)})
-        )
-        edited = model.get_message(msg_id)
-        if edited is not None:
-            model._emit_message_event(
-                ChatMessageAction.CLIENT_MSG_EDITED, edited
-            )
+        model._mark_unsaved(msg_id)
+        with trace.stage(STAGE_SAVE):
+            model.save()
+        with trace.stage(STAGE_BROADCAST):
+            model.broadcast(self._msg_frame(model, msg, trace))
+        CHAT_MESSAGE_UPDATES.labels(TRANSPORT_WEBSOCKET, "client").inc()
+        with trace.stage(STAGE_OBSERVERS):
+            edited = model.get_message(msg_id)
+            if edited is not None:
+                model._emit_message_event(
+                    ChatMessageAction.CLIENT_MSG_EDITED, edited
+                )
 
     def _store_attachments(self, attachments: list[dict], model: WsChatModel) -> list[str]:
         """Store attachment dicts via the model's set_attachment, return their IDs."""
@@ -231,22 +284,96 @@ class WSChatHandler(JupyterHandler, websocket.WebSocketHandler):
             ) or str(uuid.uuid4())
             model._attachments[att_id] = att
             ids.append(att_id)
+        model._mark_unsaved()
         return ids
 
     def on_close(self) -> None:
-        path = self._path
+        path = getattr(self, "_path", None)
         if not path:
             return
 
         client_id = getattr(self, "_client_id", None)
         model = getattr(self, "_model", None)
         if model and client_id:
-            model.handlers.pop(client_id, None)
-            self._chat_manager.on_client_disconnect(
-                model.get_path(), client_id, model.get_id()
-            )
-            if not model.handlers:
-                # Don't free immediately: the manager reclaims the model after a
-                # grace period of inactivity unless a client reconnects.
-                self._chat_manager.ws_client_gone(model.get_id())
+            self._chat_manager.ws_unsubscribe(model, client_id)
+        self.log.info("WS chat client %s disconnected", client_id)
+
+
+class _ChatChannel:
+    """The channel of one chat on a multiplexed connection.
+
+    Registered in the model handlers in place of the connection, it tags the
+    frames broadcast by the chat with its id. The frames are JSON objects, so
+    the tag is spliced in rather than re-serializing each frame.
+    """
+
+    def __init__(self, connection: websocket.WebSocketHandler, chat_id: str):
+        self._connection = connection
+        self._prefix = '{"chat_id": %s' % json.dumps(chat_id)
+
+    def write_message(self, message: str) -> None:
+        members = message[1:].lstrip()
+        separator = "" if members.startswith("}") else ", "
+        self._connection.write_message(self._prefix + separator + members)
+
+
+class MultiplexedWSChatHandler(WSChatHandler):
+    """
+    WebSocket handler serving several chats over one connection.
+
+    The client subscribes to a chat with ``{"type": "subscribe", "path": ...,
+    "user": ...}`` and receives its ``connection`` frame; from then on every
+    frame of the chat, in either direction, carries its ``chat_id``. A chat is
+    left with ``{"type": "unsubscribe", "chat_id": ...}``, or when the
+    connection closes. Each subscription is a client of its chat, with the
+    connection's client id.
+    """
+
+    def open(self, *args: str, **kwargs: str):
+        self._client_id = uuid.uuid4().hex
+        self._subscriptions: Dict[str, WsChatModel] = {}
+
+    async def on_message(self, raw: str | bytes) -> None:
+        trace = self._chat_manager.start_trace("")
+        data = self._decode(raw, trace)
+        if data is None:
+            return
+        kind = data.get("type")
+        chat_id = data.get("chat_id")
+        if kind == "subscribe":
+            self._on_subscribe(data)
+        elif not isinstance(chat_id, str):
+            return
+        elif kind == "unsubscribe":
+            model = self._subscriptions.pop(chat_id, None)
+            if model is not None:
+                self._chat_manager.ws_unsubscribe(model, self._client_id)
+        else:
+            model = self._subscriptions.get(chat_id)
+            if model is None:
+                return
+            if trace.enabled:
+                trace.path = model.get_path()
+            self._handle_message(data, model, trace)
+            await self._chat_manager.wait_for_observers(model)
+
+    def _on_subscribe(self, data: dict) -> None:
+        path = data.get("path")
+        if not isinstance(path, str) or not path:
+            self.write_message(json.dumps({
+                "type": "error", "error": "Missing 'path' in subscribe frame"
+            }))
+            return
+        # The chat id is only known once the model is open; the channel then
+        # takes the place of the connection in the model handlers.
+        model = self._chat_manager.ws_open(path)
+        chat_id = model.get_id()
+        self._subscriptions[chat_id] = self._subscribe(
+            path, self._client_id, _ChatChannel(self, chat_id), data.get("user")
+        )
+
+    def on_close(self) -> None:
+        client_id = getattr(self, "_client_id", None)
+        for model in getattr(self, "_subscriptions", {}).values():
+            self._chat_manager.ws_unsubscribe(model, client_id)
         self.log.info("WS chat client %s disconnected", client_id)
@@ -1,32 +1,72 @@
 # Copyright (c) Jupyter Development Team.
 # Distributed under the terms of the Modified BSD License.
 
+import bisect
+import heapq
+import itertools
 import json
 import logging
 import os
 import time
 import uuid
+from contextlib import contextmanager
 from dataclasses import asdict
+from functools import partial
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Union,
+)
 
 from jupyter_events import EventLogger
 from jupyter_server.services.contents.manager import ContentsManager
 from tornado import websocket
 
+from . import blobs, chat_file
+from .metrics import (
+    CHAT_BROADCAST_BYTES,
+    CHAT_BROADCAST_DURATION_SECONDS,
+    CHAT_LOAD_DURATION_SECONDS,
+    CHAT_MESSAGE_UPDATES,
+    CHAT_MESSAGES,
+    CHAT_OBSERVER_DURATION_SECONDS,
+    CHAT_SAVE_DURATION_SECONDS,
+    TRANSPORT_WEBSOCKET,
+)
 from .models import (
     BaseChatModel,
     ChatMessageAction,
     ChatMessageEvent,
     FileAttachment,
     Message,
+    MessageBatchObserverCallback,
+    MessageFilter,
     MessageObserver,
     MessageObserverCallback,
     NewMessage,
     NotebookAttachment,
+    OverflowPolicy,
     User,
     message_asdict_factory,
 )
+from .observers import (
+    AsyncMessageObserver,
+    BatchMessageObserver,
+    MessageObserverIndex,
+    MessageStream,
+)
+from .stores import ChatChanges, ChatStore, JsonChatStore
+from .writers import WriterChange, WritersThrottle
+
+if TYPE_CHECKING:
+    from .backplane import ChatBackplane
 
 _log = logging.getLogger(__name__)
 
@@ -49,16 +89,58 @@ class WsChatModel(BaseChatModel):
         path: str,
         root_dir: Path,
         event_logger: Optional[EventLogger] = None,
+        store: Optional[ChatStore] = None,
+        blob_min_size: int = 0,
+        backplane: Optional["ChatBackplane"] = None,
+        persist: bool = True,
+        writing_status_interval_s: float = 0,
+        writing_status_expiry_s: float = 0,
     ):
         self.path = path
         self.root_dir = root_dir
+        self.store = store or JsonChatStore()
+        # The backplane the saved changes are published on, for the other
+        # processes hosting the chat (see `backplane`), and whether this
+        # process writes the chat to its store.
+        self.backplane = backplane
+        self.persist = persist
+        # Mime models this large or larger are offloaded to blobs (see
+        # `blobs`); 0 keeps them inline.
+        self.blob_min_size = blob_min_size
+        # The users currently writing, whose changes are broadcast at most
+        # once per interval (see `writers`). Ephemeral.
+        self._writers = WritersThrottle(
+            self._broadcast_writers, writing_status_interval_s, writing_status_expiry_s
+        )
         self.handlers: Dict[str, websocket.WebSocketHandler] = {}
         self._messages: list[dict] = []
         self._indexes_by_id: dict[str, int] = {}
         self._users: Dict[str, dict] = {}
         self._attachments: Dict[str, dict] = {}
         self._metadata: Dict[str, object] = {}
-        self._message_observers: List[MessageObserverCallback] = []
+        # The manifest of the archive segments of a segmented chat file, whose
+        # messages are not loaded (see `chat_file`).
+        self._segments: list[dict] = []
+        self._message_observers = MessageObserverIndex()
+        self._async_observers: List[AsyncMessageObserver] = []
+        self._batch_observers: List[BatchMessageObserver] = []
+
+        # Changes not saved yet, handed to the store on the next save: the ids
+        # of the changed messages (an ordered set), and whether the users,
+        # attachments or metadata changed.
+        self._unsaved_message_ids: Dict[str, None] = {}
+        self._unsaved_state = False
+        # Number of changes made to this instance (see `get_version()`).
+        self._revision = 0
+        self._instance_id = uuid.uuid4().hex
+
+        # State of the open batch (see `batch()`): its nesting depth, whether
+        # the chat file must be written on commit, the ids of the messages to
+        # send (an ordered set) and the buffered observer events.
+        self._batch_depth = 0
+        self._batch_dirty = False
+        self._batch_message_ids: Dict[str, None] = {}
+        self._batch_events: List[ChatMessageEvent] = []
 
         # Track in-band moves: a rename via the ContentsManager updates our
         # tracked path, so subsequent saves go to the file's new location. This
@@ -76,41 +158,198 @@ class WsChatModel(BaseChatModel):
     # ------------------------------------------------------------------
 
     def to_dict(self) -> dict:
-        return {
-            "messages": self._messages,
-            "users": self._users,
-            "attachments": self._attachments,
-            "metadata": self._metadata,
-        }
+        return chat_file.chat_content(
+            self._messages, self._users, self._attachments, self._metadata, self._segments
+        )
 
+    @CHAT_LOAD_DURATION_SECONDS.time()
     def load_from_file(self) -> None:
-        full_path = self.root_dir / self.path
-        try:
-            with open(full_path) as f:
-                content = json.load(f)
-            self._messages = content.get("messages", [])
-            self._users = content.get("users", {})
-            self._attachments = content.get("attachments", {})
-            self._metadata = content.get("metadata", {})
-        except (FileNotFoundError, json.JSONDecodeError):
-            self._metadata = {}
+        content = self.store.load(self.root_dir / self.path)
+        self._messages = content.get("messages", [])
+        self._users = content.get("users", {})
+        self._attachments = content.get("attachments", {})
+        self._metadata = content.get("metadata", {})
+        self._segments = content.get(chat_file.SEGMENTS_KEY, [])
+        if self.blob_min_size:
+            for msg_dict in self._messages:
+                self._offload(msg_dict)
         # A stable id lives in the chat file's metadata (same as the
         # collaborative model). Generate one if the file has none yet; it is
         # persisted on the next save.
-        self._metadata.setdefault("id", uuid.uuid4().hex)
+        if "id" not in self._metadata:
+            self._metadata["id"] = uuid.uuid4().hex
+            self._unsaved_state = True
         self._indexes_by_id = {m["id"]: i for i, m in enumerate(self._messages) if "id" in m}
 
+    @CHAT_SAVE_DURATION_SECONDS.time()
     def save(self) -> None:
-        full_path = self.root_dir / self.path
-        with open(full_path, "w") as f:
-            json.dump(self.to_dict(), f, indent=2)
+        """Persist the chat with its store, along with the changes recorded by
+        :meth:`_mark_unsaved` since the previous save, and publish the changes
+        on the backplane."""
+        changes = self._pop_changes()
+        if self.persist:
+            self._write(changes)
+        if self.backplane is not None and (changes.messages or changes.state):
+            relayed: dict = {
+                "chat_id": self.get_id(),
+                "path": self.path,
+                "messages": changes.messages,
+            }
+            if changes.state:
+                relayed.update(
+                    users=self._users,
+                    attachments=self._attachments,
+                    metadata=self._metadata,
+                )
+            self.backplane.publish(self.get_id(), relayed)
+
+    def _write(self, changes: ChatChanges) -> None:
+        merged = self.store.save(self.root_dir / self.path, self.to_dict(), changes)
+        if merged is not None:
+            self._adopt(merged)
+
+    def _adopt(self, merged: dict) -> None:
+        """Adopt the content written by the store after merging it with the
+        changes made to the chat file by another process, and send the
+        messages they changed to the clients."""
+        previous = {m["id"]: m for m in self._messages}
+        self._messages = merged["messages"]
+        self._indexes_by_id = {m["id"]: i for i, m in enumerate(self._messages)}
+        self._segments = merged.get(chat_file.SEGMENTS_KEY, [])
+        self._revision += 1
+        if merged["users"] != self._users:
+            self._users = merged["users"]
+            self.broadcast(json.dumps({"type": "users", "users": self._users}))
+        self._attachments = merged["attachments"]
+        self._metadata = merged["metadata"]
+        self._broadcast_messages(
+            m["id"] for m in self._messages if previous.get(m["id"]) != m
+        )
+
+    def _pop_changes(self) -> ChatChanges:
+        changes = ChatChanges(
+            messages=[
+                self._messages[idx]
+                for idx in map(self._indexes_by_id.get, self._unsaved_message_ids)
+                if idx is not None
+            ],
+            state=self._unsaved_state,
+        )
+        self._unsaved_message_ids = {}
+        self._unsaved_state = False
+        return changes
+
+    def apply_relayed(self, relayed: dict) -> None:
+        """Apply the changes saved by another process hosting the chat, as
+        published by :meth:`save`: persist them if this process owns the
+        persistence, and send them to the clients of this process. Message
+        observers only see the changes made in their process."""
+        message_ids: List[str] = []
+        for msg_dict in relayed.get("messages", []):
+            idx = self._indexes_by_id.get(msg_dict["id"])
+            if idx is None:
+                times = [m.get("time", 0) for m in self._messages]
+                self._messages.insert(bisect.bisect_right(times, msg_dict["time"]), msg_dict)
+                self._indexes_by_id = {m["id"]: i for i, m in enumerate(self._messages)}
+            else:
+                self._messages[idx] = msg_dict
+            self._mark_unsaved(msg_dict["id"])
+            message_ids.append(msg_dict["id"])
+        if "users" in relayed:
+            self._users.update(relayed["users"])
+            self._attachments.update(relayed.get("attachments", {}))
+            self._metadata.update(relayed.get("metadata", {}))
+            self._mark_unsaved()
+        changes = self._pop_changes()
+        if self.persist:
+            self._write(changes)
+        if "users" in relayed:
+            self.broadcast(json.dumps({"type": "users", "users": self._users}))
+        self._broadcast_messages(message_ids)
+
+    def _mark_unsaved(self, msg_id: Optional[str] = None) -> None:
+        """Record that the message ``msg_id`` changed, or the users, attachments
+        or metadata when ``None``, for the next save."""
+        self._revision += 1
+        if msg_id is None:
+            self._unsaved_state = True
+        else:
+            self._unsaved_message_ids[msg_id] = None
 
     def broadcast(self, message: str) -> None:
-        for handler in list(self.handlers.values()):
-            try:
-                handler.write_message(message)
-            except websocket.WebSocketClosedError:
-                pass
+        if not self.handlers:
+            return
+        handlers = list(self.handlers.values())
+        with CHAT_BROADCAST_DURATION_SECONDS.time():
+            for handler in handlers:
+                try:
+                    handler.write_message(message)
+                except websocket.WebSocketClosedError:
+                    pass
+        CHAT_BROADCAST_BYTES.inc(len(message.encode()) * len(handlers))
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._commit_batch()
+
+    def _commit_batch(self) -> None:
+        """Write, broadcast and notify the changes buffered by the batch.
+
+        Each changed message is sent once, in its final state; several are
+        wrapped in a single ``batch`` frame.
+        """
+        dirty, message_ids, events = (
+            self._batch_dirty,
+            self._batch_message_ids,
+            self._batch_events,
+        )
+        self._batch_dirty = False
+        self._batch_message_ids = {}
+        self._batch_events = []
+        if dirty:
+            self.save()
+        self._broadcast_messages(message_ids)
+        self._dispatch_message_events(events)
+
+    def _broadcast_messages(self, message_ids: Iterable[str]) -> None:
+        """Send the current state of messages to all clients, as one frame."""
+        if not self.handlers:
+            return
+        frames = [
+            {"type": "msg", "message": self.resolve_message(self._messages[idx])}
+            for idx in (self._indexes_by_id.get(msg_id) for msg_id in message_ids)
+            if idx is not None
+        ]
+        if len(frames) == 1:
+            self.broadcast(json.dumps(frames[0]))
+        elif frames:
+            self.broadcast(json.dumps({"type": "batch", "frames": frames}))
+
+    def _mark_batch_dirty(self) -> None:
+        # Outside a batch, attachments, users and metadata are persisted with
+        # the next message; a batch writes them on commit.
+        self._mark_unsaved()
+        if self._batch_depth:
+            self._batch_dirty = True
+
+    def _message_changed(self, msg_id: str) -> None:
+        """Persist and broadcast a changed message, or defer it to the batch."""
+        self._mark_unsaved(msg_id)
+        if self._batch_depth:
+            self._batch_dirty = True
+            self._batch_message_ids[msg_id] = None
+            return
+        self.save()
+        msg_dict = self._messages[self._indexes_by_id[msg_id]]
+        self.broadcast(
+            json.dumps({"type": "msg", "message": self.resolve_message(msg_dict)})
+        )
 
     def broadcast_writing_status(self, user: User, status=None) -> None:
         """Broadcast an ephemeral writing status for ``user`` to all clients.
@@ -119,19 +358,35 @@ class WsChatModel(BaseChatModel):
         ``status`` is ``None`` (stopped) or a mapping with optional
         ``messageID``/``typingIndicator``. The full user object is included so
         recipients can display the writer (and tell bots from humans via
-        ``user.bot``) without having seen a message from them.
+        ``user.bot``) without having seen a message from them. The statuses
+        are throttled: a status that did not change is not sent again.
         """
-        payload: dict = {
-            "type": "writing",
-            "user": asdict(user),
-            "state": status is not None,
-        }
-        if status:
-            for key in ("messageID", "typingIndicator"):
-                value = status.get(key)
-                if value is not None:
-                    payload[key] = value
-        self.broadcast(json.dumps(payload))
+        self._writers.set(user, status)
+
+    def _broadcast_writers(self, changes: List[WriterChange]) -> None:
+        """Send a ``writing`` frame for each writer that changed."""
+        for user, writer in changes:
+            payload: dict = {"type": "writing", "user": user, "state": writer is not None}
+            if writer is not None:
+                payload.update((k, v) for k, v in writer.items() if k != "user")
+            self.broadcast(json.dumps(payload))
+
+    def _offload(self, msg_dict: dict) -> None:
+        """Offload the mime model of a message to a blob if it is large."""
+        if msg_dict.get("mime_model") is not None:
+            msg_dict["mime_model"] = blobs.offload(
+                self.root_dir / self.path, msg_dict["mime_model"], self.blob_min_size
+            )
+
+    def _to_message(self, msg_dict: dict) -> Message:
+        """The :class:`Message` of a stored message, with its mime model read
+        back from its blob if offloaded."""
+        if blobs.is_blob_ref(msg_dict.get("mime_model")):
+            msg_dict = dict(msg_dict)
+            msg_dict["mime_model"] = blobs.resolve(
+                self.root_dir / self.path, msg_dict["mime_model"]
+            )
+        return Message(**msg_dict)
 
     def resolve_message(self, message: dict) -> dict:
         """Return a copy of a message with attachment IDs replaced by full objects."""
@@ -155,6 +410,11 @@ class WsChatModel(BaseChatModel):
         # collaborative model). Create one lazily if it does not exist yet.
         return self._metadata.setdefault("id", uuid.uuid4().hex)  # type: ignore[return-value]
 
+    def get_version(self) -> str:
+        # Every change goes through `_mark_unsaved`; the instance id tells apart
+        # the models successively loaded for a chat.
+        return f"{self._instance_id}.{self._revision}"
+
     def get_path(self) -> str:
         # The WebSocket model does not use file IDs; its path is tracked
         # in-process and kept current on in-band moves (see _on_contents_event).
@@ -185,10 +445,18 @@ class WsChatModel(BaseChatModel):
         """Point the model at ``new_path`` (the file's new location)."""
         if new_path != self.path:
             _log.info("Chat file moved: '%s' -> '%s'", self.path, new_path)
+            self.store.move(self.root_dir / self.path, self.root_dir / new_path)
             self.path = new_path
 
     def dispose(self) -> None:
-        """Remove the ContentsManager event listener when the model is freed."""
+        """Remove the ContentsManager event listener and stop the asynchronous
+        message observers when the model is freed."""
+        for delivery in self._async_observers:
+            delivery.close()
+        self._async_observers = []
+        self._batch_observers = []
+        self._writers.close()
+        self.store.release(self.root_dir / self.path)
         if self._event_logger is not None:
             self._event_logger.remove_listener(
                 schema_id=CONTENTS_EVENT_SCHEMA_ID,
@@ -199,10 +467,10 @@ class WsChatModel(BaseChatModel):
         idx = self._indexes_by_id.get(id)
         if idx is None:
             return None
-        return Message(**self._messages[idx])
+        return self._to_message(self._messages[idx])
 
     def get_messages(self) -> list[Message]:
-        return [Message(**msg_dict) for msg_dict in self._messages]
+        return [self._to_message(msg_dict) for msg_dict in self._messages]
 
     def get_users(self) -> dict[str, User]:
         return {
@@ -236,16 +504,15 @@ class WsChatModel(BaseChatModel):
                 callback(message, self)
 
         msg_dict = asdict(message, dict_factory=message_asdict_factory)
+        self._offload(msg_dict)
         idx = next(
             (i for i, m in enumerate(self._messages) if m.get("time", 0) > timestamp),
             len(self._messages),
         )
         self._messages.insert(idx, msg_dict)
         self._indexes_by_id = {m["id"]: i for i, m in enumerate(self._messages)}
-        self.save()
-        self.broadcast(
-            json.dumps({"type": "msg", "message": self.resolve_message(msg_dict)})
-        )
+        self._message_changed(msg_id)
+        CHAT_MESSAGES.labels(TRANSPORT_WEBSOCKET, "server").inc()
         self._emit_message_event(ChatMessageAction.SERVER_MSG_SENT, message)
         return msg_id
 
@@ -268,16 +535,61 @@ class WsChatModel(BaseChatModel):
         for key, value in update_dict.items():
             if value is not None or key in msg_dict:
                 msg_dict[key] = value
-        self.save()
-        self.broadcast(
-            json.dumps({"type": "msg", "message": self.resolve_message(msg_dict)})
-        )
+        self._offload(msg_dict)
+        self._message_changed(update.id)
+        CHAT_MESSAGE_UPDATES.labels(TRANSPORT_WEBSOCKET, "server").inc()
         updated = self.get_message(update.id)
         if updated is not None:
             self._emit_message_event(
                 ChatMessageAction.SERVER_MSG_UPDATED, updated
             )
 
+    def import_messages(self, messages: list[Message]) -> int:
+        new = {
+            message.id: asdict(message, dict_factory=message_asdict_factory)
+            for message in messages
+            if message.id not in self._indexes_by_id
+        }
+        if not new:
+            return 0
+        for msg_dict in new.values():
+            self._offload(msg_dict)
+        # Both sides are sorted by time: merge them in a single pass.
+        imported = sorted(new.values(), key=lambda m: m["time"])
+        self._messages = list(
+            heapq.merge(self._messages, imported, key=lambda m: m.get("time", 0))
+        )
+        self._indexes_by_id = {m["id"]: i for i, m in enumerate(self._messages)}
+        # One write and one frame, as a batch of changed messages.
+        with self.batch():
+            for msg_id in new:
+                self._message_changed(msg_id)
+        return len(new)
+
+    def read_messages(
+        self, since: Optional[float] = None, limit: Optional[int] = None
+    ) -> list[dict]:
+        content = {"metadata": self._metadata, chat_file.SEGMENTS_KEY: self._segments}
+        archive = self.store.read_archive(self.root_dir / self.path, content, since)
+        return chat_file.select_messages(
+            itertools.chain(archive, self._messages), since, limit
+        )
+
+    def archive_messages(self, count: int) -> int:
+        """Move the oldest messages to the archive of the store, then persist
+        the chat, rebuilding the id index once."""
+        content = self.to_dict()
+        archived = self.store.archive(self.root_dir / self.path, content, count)
+        if not archived:
+            return 0
+        self._messages = content["messages"]
+        self._segments = content.get(chat_file.SEGMENTS_KEY, [])
+        self._indexes_by_id = {m["id"]: i for i, m in enumerate(self._messages)}
+        self._mark_batch_dirty()
+        if not self._batch_depth:
+            self.save()
+        return archived
+
     def set_attachment(
         self, attachment: Union[FileAttachment, NotebookAttachment]
     ) -> str:
@@ -292,40 +604,111 @@ class WsChatModel(BaseChatModel):
             None,
         ) or str(uuid.uuid4())
         self._attachments[att_id] = att_dict
+        self._mark_batch_dirty()
         return att_id
 
     def set_user(self, user: User) -> None:
         self._users[user.username] = asdict(user)
+        self._mark_batch_dirty()
 
     def set_metadata(self, name: str, metadata: Any) -> None:
         self._metadata[name] = metadata
+        self._mark_batch_dirty()
 
     # ------------------------------------------------------------------
     # Message observers
     # ------------------------------------------------------------------
 
     def observe_messages(
-        self, callback: MessageObserverCallback
+        self,
+        callback: MessageObserverCallback,
+        *,
+        filter: Optional[MessageFilter] = None,
+        asynchronous: bool = False,
+        maxsize: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
+    ) -> MessageObserver:
+        if not asynchronous:
+            return MessageObserver(_handle=self._message_observers.add(callback, filter))
+        return self._observe_async(
+            AsyncMessageObserver(callback, maxsize, overflow, TRANSPORT_WEBSOCKET), filter
+        )
+
+    def observe_message_batches(
+        self,
+        callback: MessageBatchObserverCallback,
+        *,
+        filter: Optional[MessageFilter] = None,
     ) -> MessageObserver:
-        self._message_observers.append(callback)
-        return MessageObserver(_handle=callback)
+        delivery = BatchMessageObserver(callback, TRANSPORT_WEBSOCKET)
+        self._batch_observers.append(delivery)
+        return MessageObserver(
+            _handle=self._message_observers.add(delivery.put, filter), _delivery=delivery
+        )
+
+    def message_stream(
+        self,
+        filter: Union[MessageFilter, Callable[[ChatMessageEvent], bool], None] = None,
+        maxsize: int = 1000,
+    ) -> MessageStream:
+        stream = MessageStream(filter, maxsize, TRANSPORT_WEBSOCKET)
+        observer = self._observe_async(stream, stream.filter)
+        stream._detach = partial(self.unobserve_messages, observer)
+        return stream
+
+    def _observe_async(
+        self, delivery: AsyncMessageObserver, filter: Optional[MessageFilter]
+    ) -> MessageObserver:
+        self._async_observers.append(delivery)
+        return MessageObserver(
+            _handle=self._message_observers.add(delivery.put, filter), _delivery=delivery
+        )
 
     def unobserve_messages(self, observer: MessageObserver) -> None:
-        try:
-            self._message_observers.remove(observer._handle)
-        except ValueError:
-            pass
+        self._message_observers.remove(observer._handle)
+        if observer._delivery is not None:
+            observer._delivery.close()
+            if observer._delivery in self._async_observers:
+                self._async_observers.remove(observer._delivery)
+            if observer._delivery in self._batch_observers:
+                self._batch_observers.remove(observer._delivery)
+
+    async def wait_for_observers(self) -> None:
+        """Wait until the asynchronous observers with the ``block`` overflow
+        policy have room in their queue; the WebSocket handlers wait before
+        reading the next frame of a client."""
+        for delivery in list(self._async_observers):
+            await delivery.wait_for_room()
+
+    def _is_bot(self, username: str) -> bool:
+        return bool(self._users.get(username, {}).get("bot"))
 
     def _emit_message_event(
         self, action: ChatMessageAction, message: Message
     ) -> None:
-        """Notify all message observers of a change. Observer errors are logged
-        but never interrupt message handling."""
+        """Notify all message observers of a change, or buffer it until the
+        open batch commits."""
         if not self._message_observers:
             return
         event = ChatMessageEvent(action=action, message=message)
-        for callback in list(self._message_observers):
-            try:
-                callback(event)
-            except Exception:  # pragma: no cover - defensive
-                _log.exception("Message observer failed for %s", action)
+        if self._batch_depth:
+            self._batch_events.append(event)
+            return
+        self._dispatch_message_events([event])
+
+    def _dispatch_message_events(self, events: List[ChatMessageEvent]) -> None:
+        """Deliver ``events``, the events of one commit, to all message
+        observers. Observer errors are logged but never interrupt message
+        handling."""
+        if not events or not self._message_observers:
+            return
+        duration = CHAT_OBSERVER_DURATION_SECONDS.labels(TRANSPORT_WEBSOCKET)
+        for event in events:
+            for callback in self._message_observers.match(event, self._is_bot):
+                try:
+                    with duration.time():
+                        callback(event)
+                except Exception:  # pragma: no cover - defensive
+                    _log.exception("Message observer failed for %s", event.action)
+        for delivery in list(self._batch_observers):
+            delivery.flush()
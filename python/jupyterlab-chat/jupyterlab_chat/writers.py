@@ -0,0 +1,121 @@
+# Copyright (c) Jupyter Development Team.
+# Distributed under the terms of the Modified BSD License.
+"""
+Throttling of the writing status broadcasts of a chat.
+
+Personas may report their writing status on every token. Both models keep the
+writers of a chat in a :class:`WritersThrottle`, which publishes the changes at
+most once per interval, leaving out the statuses that did not change, and
+removes the writers that stopped refreshing their status.
+"""
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tornado.ioloop import IOLoop
+
+from .models import User
+
+#: A change of writer: the user (a dict), and its status or ``None`` when it
+#: stopped writing.
+WriterChange = Tuple[dict, Optional[dict]]
+
+
+def writer_status(user: User, status: dict) -> dict:
+    """The published status of a writer: the user, with the optional
+    ``messageID`` and ``typingIndicator`` of ``status``."""
+    writer: dict = {"user": asdict(user)}
+    for key in ("messageID", "typingIndicator"):
+        value = status.get(key)
+        if value is not None:
+            writer[key] = value
+    return writer
+
+
+class WritersThrottle:
+    """The writers of a chat, keyed by username, published by ``publish`` at
+    most once per ``interval_s`` seconds.
+
+    The first change after a quiet interval is published at once; the changes
+    made during the interval that follows are coalesced and published at its
+    end. A writer whose status is not refreshed for ``expiry_s`` seconds is
+    removed. Zero disables the throttling or the expiry.
+    """
+
+    def __init__(
+        self,
+        publish: Callable[[List[WriterChange]], None],
+        interval_s: float = 0,
+        expiry_s: float = 0,
+    ):
+        self.interval_s = interval_s
+        self.expiry_s = expiry_s
+        self.writers: Dict[str, dict] = {}
+        self._publish = publish
+        self._published: Dict[str, dict] = {}
+        self._refreshed: Dict[str, float] = {}
+        self._last_publish = -math.inf
+        self._flush_timeout: Any = None
+        self._expiry_timeout: Any = None
+
+    def set(self, user: User, status: Optional[dict]) -> None:
+        """Set the status of ``user``, ``None`` when it stopped writing."""
+        if status is None:
+            self.writers.pop(user.username, None)
+            self._refreshed.pop(user.username, None)
+        else:
+            self.writers[user.username] = writer_status(user, status)
+            self._refreshed[user.username] = time.monotonic()
+            if self.expiry_s and self._expiry_timeout is None:
+                self._expiry_timeout = IOLoop.current().call_later(
+                    self.expiry_s, self._expire
+                )
+        self._schedule_flush()
+
+    def flush(self) -> None:
+        """Publish the writers changed since the last publication."""
+        if self._flush_timeout is not None:
+            IOLoop.current().remove_timeout(self._flush_timeout)
+            self._flush_timeout = None
+        changes: List[WriterChange] = []
+        new = [username for username in self.writers if username not in self._published]
+        for username in [*self._published, *new]:
+            writer, published = self.writers.get(username), self._published.get(username)
+            if writer != published:
+                changes.append(((writer or published)["user"], writer))  # type: ignore[index]
+        if not changes:
+            return
+        self._published = dict(self.writers)
+        self._last_publish = time.monotonic()
+        self._publish(changes)
+
+    def close(self) -> None:
+        for timeout in (self._flush_timeout, self._expiry_timeout):
+            if timeout is not None:
+                IOLoop.current().remove_timeout(timeout)
+        self._flush_timeout = self._expiry_timeout = None
+
+    def _schedule_flush(self) -> None:
+        if self._flush_timeout is not None:
+            return
+        delay = self._last_publish + self.interval_s - time.monotonic()
+        if delay <= 0:
+            self.flush()
+        else:
+            self._flush_timeout = IOLoop.current().call_later(delay, self.flush)
+
+    def _expire(self) -> None:
+        self._expiry_timeout = None
+        stale = time.monotonic() - self.expiry_s
+        for username, refreshed in list(self._refreshed.items()):
+            if refreshed <= stale:
+                del self._refreshed[username]
+                self.writers.pop(username, None)
+        if self._refreshed:
+            self._expiry_timeout = IOLoop.current().call_later(
+                min(self._refreshed.values()) - stale, self._expire
+            )
+        self._schedule_flush()
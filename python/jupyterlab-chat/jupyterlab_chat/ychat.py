@@ -3,30 +3,59 @@
 
 # TODO: remove this module in favor of the one in jupyter_ydoc when released.
 
-from dataclasses import asdict
+from dataclasses import asdict, replace
 import json
 import time
 import asyncio
+import bisect
+import itertools
+import logging
+from contextlib import contextmanager
 from functools import partial
+from pathlib import Path
 from jupyter_ydoc.ybasedoc import YBaseDoc
-from typing import Any, Callable, Optional, Union
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
 from uuid import uuid4
 from pycrdt import Array, ArrayEvent, Map, MapEvent, Subscription
 
+from . import chat_file
+from .metrics import (
+    CHAT_MESSAGE_UPDATES,
+    CHAT_MESSAGES,
+    CHAT_OBSERVER_DURATION_SECONDS,
+    TRANSPORT_RTC,
+)
 from .models import (
     BaseChatModel,
     ChatMessageAction,
     ChatMessageEvent,
     FileAttachment,
     Message,
+    MessageBatchObserverCallback,
+    MessageFilter,
     MessageObserver,
     MessageObserverCallback,
     NewMessage,
     NotebookAttachment,
+    OverflowPolicy,
     User,
     message_asdict_factory,
 )
+from .observers import (
+    AsyncMessageObserver,
+    BatchMessageObserver,
+    IndexedObserver,
+    MessageObserverIndex,
+    MessageStream,
+)
 from .utils import find_mentions
+from .writers import WriterChange, WritersThrottle
+
+_log = logging.getLogger(__name__)
+
+#: The keys of a message set by the server timestamping of a new message (see
+#: `_set_timestamp`), which are not an edit.
+TIMESTAMP_KEYS = {"time", "raw_time"}
 
 # Awareness state field under which the collaborative model publishes the set of
 # users currently writing (e.g. AI personas). Server-side senders have no
@@ -48,6 +77,9 @@ class YChat(YBaseDoc, BaseChatModel):
         # used as a fallback. Both are None until the chat is resolved.
         self.room_id: Optional[str] = None
         self.initial_path: Optional[str] = None
+        # The server root directory, set along with the fields above; needed to
+        # write the archive segments next to the chat file.
+        self.root_dir: Optional[Path] = None
         self._ydoc["users"] = self._yusers = Map()  # type:ignore[var-annotated]
         self._ydoc["messages"] = self._ymessages = Array()  # type:ignore[var-annotated]
         self._ydoc["attachments"] = self._yattachments = Map()  # type:ignore[var-annotated]
@@ -61,12 +93,39 @@ class YChat(YBaseDoc, BaseChatModel):
             self._initialize
         )
 
+        # Number of transactions that changed the document (see `get_version()`).
+        self._revision = 0
+        self._instance_id = uuid4().hex
+        self._ydoc_subscription: Optional[Subscription] = self._ydoc.observe(
+            self._on_transaction
+        )
+
         # Lookup table to get message index from its ID.
         self._indexes_by_id: dict[str, int] = {}
 
+        # The manifest of the archive segments of a segmented chat file, whose
+        # messages are not loaded (see `chat_file`). Written back by `get()`.
+        self._segments: list[dict] = []
+
         # In-memory set of users currently writing (keyed by username), the
-        # source of truth published to the awareness channel. Ephemeral.
-        self._writers: dict[str, dict] = {}
+        # source of truth published to the awareness channel at most once per
+        # interval (see `writers`). Ephemeral.
+        self._writers = WritersThrottle(self._publish_writers)
+
+        # Nesting depth of the open `batch()` blocks.
+        self._batch_depth = 0
+
+        # Set while `import_messages()` commits, so that imported history does
+        # not reach message observers.
+        self._importing = False
+
+        # The message observers, called from a single subscription to the
+        # messages array while there are any, and the queues of the
+        # asynchronous ones.
+        self._message_observers = MessageObserverIndex()
+        self._message_observers_subscription: Optional[Subscription] = None
+        self._async_observers: list[AsyncMessageObserver] = []
+        self._batch_observers: list[BatchMessageObserver] = []
 
     @property
     def version(self) -> str:
@@ -194,7 +253,17 @@ class YChat(YBaseDoc, BaseChatModel):
                 index,
                 Map(asdict(message, dict_factory=message_asdict_factory))
             )
-
+            if self._batch_depth:
+                # The lookup table is refreshed when the transaction commits,
+                # which a batch defers to its end: index the message now so it
+                # can be updated within the batch.
+                if index < len(self._ymessages) - 1:
+                    for msg_id, i in self._indexes_by_id.items():
+                        if i >= index:
+                            self._indexes_by_id[msg_id] = i + 1
+                self._indexes_by_id[uid] = index
+
+        CHAT_MESSAGES.labels(TRANSPORT_RTC, "server").inc()
         return uid
 
     def update_message(self, update: Message, append: bool = False, trigger_actions: list[Callable] | None = None):
@@ -230,6 +299,86 @@ class YChat(YBaseDoc, BaseChatModel):
                         message.update({ key: update_dict[key] })
                 elif update_dict[key] is not None:
                     message.update({ key: update_dict[key] })
+        CHAT_MESSAGE_UPDATES.labels(TRANSPORT_RTC, "server").inc()
+
+    def import_messages(self, messages: list[Message]) -> int:
+        """
+        Insert existing messages in a single transaction, keeping their ids,
+        timestamps and senders.
+        """
+        new = {
+            message.id: message
+            for message in messages
+            if message.id not in self._indexes_by_id
+        }
+        if not new:
+            return 0
+        times = [message.get("time", 0) for message in self._ymessages]
+        self._importing = True
+        try:
+            with self._ydoc.transaction():
+                # The imported timestamps are the reference, not to be
+                # replaced by the server time (see `_on_messages_change`).
+                imported = sorted(
+                    (replace(message, raw_time=False) for message in new.values()),
+                    key=lambda m: m.time,
+                )
+                for count, message in enumerate(imported):
+                    # The messages inserted so far all precede this one.
+                    index = bisect.bisect_right(times, message.time) + count
+                    self._ymessages.insert(
+                        index,
+                        Map(asdict(message, dict_factory=message_asdict_factory)),
+                    )
+        finally:
+            self._importing = False
+        return len(new)
+
+    def archive_messages(self, count: int) -> int:
+        """
+        Write the oldest messages to a new archive segment next to the chat
+        file, then remove them from the document in a single transaction (the
+        new manifest is saved with the document).
+        """
+        if self.root_dir is None:
+            raise RuntimeError("The chat must be resolved by the ChatManager to be archived")
+        messages = self._get_messages()[:max(count, 0)]
+        if not messages:
+            return 0
+        content: dict[str, Any] = {
+            "metadata": {"id": self.get_id()},
+            chat_file.SEGMENTS_KEY: self._segments,
+        }
+        chat_file.write_segment(self.root_dir / self.get_path(), content, messages)
+        self._segments = content[chat_file.SEGMENTS_KEY]
+        with self._ydoc.transaction():
+            del self._ymessages[0:len(messages)]
+        return len(messages)
+
+    def read_messages(
+        self, since: Optional[float] = None, limit: Optional[int] = None
+    ) -> list[dict]:
+        archive: Iterable[dict] = []
+        if self.root_dir is not None and self._segments:
+            content = {"metadata": {"id": self.get_id()}, chat_file.SEGMENTS_KEY: self._segments}
+            archive = chat_file.read_archive(self.root_dir / self.get_path(), content, since)
+        return chat_file.select_messages(
+            itertools.chain(archive, self._get_messages()), since, limit
+        )
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """
+        Group the changes made in the block into a single Y transaction, so
+        that clients receive one update and message observers are called once
+        the transaction is committed.
+        """
+        with self._ydoc.transaction():
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
 
     def get_attachments(self) -> dict[str, Union[FileAttachment, NotebookAttachment]]:
         """
@@ -300,22 +449,12 @@ class YChat(YBaseDoc, BaseChatModel):
         named by :data:`WRITERS_AWARENESS_KEY`), which every client scans; the
         awareness channel keeps that slot alive on its own, so no per-writer
         client or heartbeat is needed. Ephemeral: never persisted to the
-        ``.chat`` document.
-        """
-        if status is None:
-            self._writers.pop(user.username, None)
-        else:
-            writer: dict = {"user": asdict(user)}
-            message_id = status.get("messageID")
-            if message_id is not None:
-                writer["messageID"] = message_id
-            typing_indicator = status.get("typingIndicator")
-            if typing_indicator is not None:
-                writer["typingIndicator"] = typing_indicator
-            self._writers[user.username] = writer
-        self._publish_writers()
-
-    def _publish_writers(self) -> None:
+        ``.chat`` document. The changes are throttled: the writer set is
+        republished at most once per interval, and not when it did not change.
+        """
+        self._writers.set(user, status)
+
+    def _publish_writers(self, changes: list[WriterChange]) -> None:
         """Publish the current writer set to the awareness channel.
 
         Writes to the document's own awareness slot (no client-ID juggling). A
@@ -325,53 +464,143 @@ class YChat(YBaseDoc, BaseChatModel):
         if self.awareness is None:
             return
         self.awareness.set_local_state_field(
-            WRITERS_AWARENESS_KEY, list(self._writers.values())
+            WRITERS_AWARENESS_KEY, list(self._writers.writers.values())
         )
 
     def observe_messages(
-        self, callback: MessageObserverCallback
+        self,
+        callback: MessageObserverCallback,
+        *,
+        filter: Optional[MessageFilter] = None,
+        asynchronous: bool = False,
+        maxsize: int = 1000,
+        overflow: OverflowPolicy = OverflowPolicy.BLOCK,
     ) -> MessageObserver:
-        """Observe new messages by subscribing to the shared messages array.
+        """Observe the messages by deeply observing the shared messages array.
+
+        New messages are the inserts in the array, and edits the changes of the
+        maps of the messages; the changes of a message in a transaction (e.g.
+        the chunks of a streamed reply in a batch) are delivered as one event,
+        and the server timestamping of a new message is not an edit. Changes
+        are classified as server-sent/updated when their sender is a bot user,
+        and client-received/edited otherwise.
 
-        Only genuine new messages (array inserts) are surfaced; in-place content
-        edits mutate a nested map and do not raise an array event, so
-        ``CLIENT_MSG_EDITED``/``SERVER_MSG_UPDATED`` are not emitted in RTC mode.
-        New messages are classified as server-sent when their sender is a bot
-        user, and client-received otherwise.
+        The updates of the document are not held back by the ``block``
+        overflow policy of an asynchronous observer: its queue grows instead.
         """
-        subscription: Subscription = self._ymessages.observe(
-            partial(self._dispatch_message_event, callback)
+        if asynchronous:
+            return self._observe_async(
+                AsyncMessageObserver(callback, maxsize, overflow, TRANSPORT_RTC), filter
+            )
+        return MessageObserver(_handle=self._add_message_observer(callback, filter))
+
+    def observe_message_batches(
+        self,
+        callback: MessageBatchObserverCallback,
+        *,
+        filter: Optional[MessageFilter] = None,
+    ) -> MessageObserver:
+        """Observe the message changes of each transaction (a single change,
+        or a whole batch) as one list."""
+        delivery = BatchMessageObserver(callback, TRANSPORT_RTC)
+        self._batch_observers.append(delivery)
+        return MessageObserver(
+            _handle=self._add_message_observer(delivery.put, filter), _delivery=delivery
         )
-        return MessageObserver(_handle=subscription)
 
-    def unobserve_messages(self, observer: MessageObserver) -> None:
-        subscription = observer._handle
-        if subscription is not None:
-            self._ymessages.unobserve(subscription)
+    def message_stream(
+        self,
+        filter: Union[MessageFilter, Callable[[ChatMessageEvent], bool], None] = None,
+        maxsize: int = 1000,
+    ) -> MessageStream:
+        """Return an asynchronous iterator over the message changes; as with
+        an asynchronous observer, the queue grows beyond ``maxsize`` instead of
+        holding back the updates of the document."""
+        stream = MessageStream(filter, maxsize, TRANSPORT_RTC)
+        observer = self._observe_async(stream, stream.filter)
+        stream._detach = partial(self.unobserve_messages, observer)
+        return stream
+
+    def _observe_async(
+        self, delivery: AsyncMessageObserver, filter: Optional[MessageFilter]
+    ) -> MessageObserver:
+        self._async_observers.append(delivery)
+        return MessageObserver(
+            _handle=self._add_message_observer(delivery.put, filter), _delivery=delivery
+        )
 
-    def _dispatch_message_event(
-        self, callback: MessageObserverCallback, event: ArrayEvent
-    ) -> None:
-        # Skip while the document is still loading its pre-existing messages,
-        # and skip events that contain a delete (a message reposition performed
-        # by `_set_timestamp` is a delete+insert of an existing message, not a
-        # new one).
-        if self.dirty:
-            return
-        if any("delete" in value.keys() for value in event.delta):  # type:ignore[attr-defined]
+    def _add_message_observer(
+        self, callback: MessageObserverCallback, filter: Optional[MessageFilter]
+    ) -> IndexedObserver:
+        if self._message_observers_subscription is None:
+            self._message_observers_subscription = self._ymessages.observe_deep(
+                self._dispatch_message_events
+            )
+        return self._message_observers.add(callback, filter)
+
+    def unobserve_messages(self, observer: MessageObserver) -> None:
+        self._message_observers.remove(observer._handle)
+        if not self._message_observers and self._message_observers_subscription:
+            self._ymessages.unobserve(self._message_observers_subscription)
+            self._message_observers_subscription = None
+        if observer._delivery is not None:
+            observer._delivery.close()
+            if observer._delivery in self._async_observers:
+                self._async_observers.remove(observer._delivery)
+            if observer._delivery in self._batch_observers:
+                self._batch_observers.remove(observer._delivery)
+
+    def _is_bot(self, username: str) -> bool:
+        user = self.get_user(username)
+        return user is not None and bool(user.bot)
+
+    def _dispatch_message_events(self, events: list[Any]) -> None:
+        # Skip while the document is still loading its pre-existing messages.
+        if self.dirty or self._importing:
             return
-        for value in event.delta:  # type:ignore[attr-defined]
-            if "insert" not in value.keys():
-                continue
-            for item in value["insert"]:
-                message = Message(**item.to_py())
-                sender = self.get_user(message.sender)
+        # The maps of the messages changed by the transaction (array and map
+        # events), keyed by message id, and whether they are new.
+        changed: dict[str, tuple[Map, bool]] = {}
+        for event in events:
+            if isinstance(event, ArrayEvent):
+                # Skip the events that contain a delete (a message reposition
+                # performed by `_set_timestamp` is a delete+insert of an
+                # existing message, not a new one).
+                if event.path or any("delete" in value for value in event.delta):  # type:ignore[attr-defined]
+                    continue
+                for value in event.delta:  # type:ignore[attr-defined]
+                    for item in value.get("insert", ()):
+                        changed[item["id"]] = (item, True)
+            elif isinstance(event, MapEvent) and len(event.path) == 1:  # type:ignore[attr-defined]
+                if event.keys.keys() <= TIMESTAMP_KEYS:  # type:ignore[attr-defined]
+                    continue
+                ymessage = event.target  # type:ignore[attr-defined]
+                changed.setdefault(ymessage["id"], (ymessage, False))
+        duration = CHAT_OBSERVER_DURATION_SECONDS.labels(TRANSPORT_RTC)
+        for ymessage, new in changed.values():
+            message = Message(**(ymessage.to_py() or {}))
+            bot = self._is_bot(message.sender)
+            if new:
                 action = (
                     ChatMessageAction.SERVER_MSG_SENT
-                    if sender is not None and sender.bot
+                    if bot
                     else ChatMessageAction.CLIENT_MSG_RECEIVED
                 )
-                callback(ChatMessageEvent(action=action, message=message))
+            else:
+                action = (
+                    ChatMessageAction.SERVER_MSG_UPDATED
+                    if bot
+                    else ChatMessageAction.CLIENT_MSG_EDITED
+                )
+            message_event = ChatMessageEvent(action=action, message=message)
+            for callback in self._message_observers.match(message_event, self._is_bot):
+                try:
+                    with duration.time():
+                        callback(message_event)
+                except Exception:
+                    _log.exception("Message observer failed for %s", action)
+        for delivery in list(self._batch_observers):
+            delivery.flush()
 
     def create_id(self) -> str:
         """
@@ -448,17 +677,17 @@ class YChat(YBaseDoc, BaseChatModel):
         Returns the contents of the document.
         :return: Document's contents in JSON.
         """
-        return json.dumps(
-            {
-                "messages": self._get_messages(),
-                "users": self._get_users(),
-                "attachments": {
+        return chat_file.dumps(
+            chat_file.chat_content(
+                self._get_messages(),
+                self._get_users(),
+                {
                     att_id: asdict(att)
                     for att_id, att in self.get_attachments().items()
                 },
-                "metadata": self.get_metadata()
-            },
-            indent=2
+                self.get_metadata(),
+                self._segments,
+            )
         )
 
     def set(self, value: str) -> None:
@@ -472,6 +701,10 @@ class YChat(YBaseDoc, BaseChatModel):
         except json.JSONDecodeError:
             contents = dict()
 
+        # Only the tail of a segmented chat file is loaded; its manifest is kept
+        # to be written back.
+        self._segments = contents.get(chat_file.SEGMENTS_KEY, [])
+
         # Make sure the users are updated before the messages, for consistency.
         with self._ydoc.transaction():
             self._yusers.clear()
@@ -527,9 +760,29 @@ class YChat(YBaseDoc, BaseChatModel):
         if self._ymessages_subscription is not None:
             self._ymessages.unobserve(self._ymessages_subscription)
             self._ymessages_subscription = None
+        if self._ydoc_subscription is not None:
+            self._ydoc.unobserve(self._ydoc_subscription)
+            self._ydoc_subscription = None
         if self._ystate_subscription is not None:
             self._ystate.unobserve(self._ystate_subscription)
             self._ystate_subscription = None
+        if self._message_observers_subscription is not None:
+            self._ymessages.unobserve(self._message_observers_subscription)
+            self._message_observers_subscription = None
+        for delivery in self._async_observers:
+            delivery.close()
+        self._async_observers = []
+        self._batch_observers = []
+        self._writers.close()
+
+    def _on_transaction(self, event: Any) -> None:
+        self._revision += 1
+
+    def get_version(self) -> str:
+        """
+        Returns a token changing with every transaction that changes the document.
+        """
+        return f"{self._instance_id}.{self._revision}"
 
     def _initialize(self, event: MapEvent) -> None:
         """